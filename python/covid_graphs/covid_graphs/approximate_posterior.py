@@ -0,0 +1,115 @@
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import click
+import click_pathlib
+import numpy as np
+import pandas as pd
+
+from .country_report import create_report
+from .fit_atg_model import AtgModelFit, AtgModelSamples, fit_atg_model_with_covariance
+
+# Same number of samples as the default NUTS run: 4 chains, 800 draws each.
+DEFAULT_SAMPLE_COUNT = 3200
+# Quantiles reported by the comparison with NUTS.
+_QUANTILES = [0.05, 0.5, 0.95]
+
+
+def fit_cumulative_cases(cases: np.ndarray) -> Tuple[AtgModelFit, np.ndarray]:
+    """
+    Least-squares fit of the cumulative sum of daily `cases`, with the covariance of the parameters.
+    The cumulative cases are assumed to start from zero, which holds for all country reports.
+
+    Cumulative cases at index `i` correspond to day `i - 1` of `cases`, the same convention as in
+    the Bayesian model.
+    """
+    cumulative = np.maximum(0, np.concatenate(([0], np.cumsum(cases))))
+    return fit_atg_model_with_covariance(xs=np.arange(len(cumulative)), ys=cumulative)
+
+
+def sample_laplace_posterior(
+    cases: np.ndarray, sample_count: int = DEFAULT_SAMPLE_COUNT, seed: Optional[int] = None
+) -> AtgModelSamples:
+    """
+    Laplace approximation of the posterior around the least-squares optimum. A fast alternative
+    to `bayesian.sample_posterior`, using the same date convention, so the samples can be plotted
+    the same way.
+
+    The normal approximation is made in log-space of the positive parameters a, tg and exp, so
+    that all samples are valid.
+    """
+    fit, covariance = fit_cumulative_cases(cases)
+    positive_params = np.maximum([fit.a, fit.tg, fit.exp], np.finfo(float).tiny)
+    mean = np.concatenate((np.log(positive_params), [fit.t0]))
+    # Delta method: d(log x) = dx / x.
+    scale = np.concatenate((1.0 / positive_params, [1.0]))
+    log_covariance = covariance * np.outer(scale, scale)
+
+    rng = np.random.default_rng(seed)
+    draws = rng.multivariate_normal(mean, log_covariance, size=sample_count, method="eigh")
+    return AtgModelSamples(
+        a=np.exp(draws[:, 0]),
+        tg=np.exp(draws[:, 1]),
+        exp=np.exp(draws[:, 2]),
+        t0=draws[:, 3],
+    )
+
+
+def _summarize(samples: AtgModelSamples, prefix: str) -> Dict[str, float]:
+    summary = {}
+    for name, values in [
+        ("alpha", samples.exp),
+        ("tg", samples.tg),
+        ("peak", samples.exp * samples.tg + samples.t0),
+    ]:
+        lower, median, upper = np.quantile(values, _QUANTILES)
+        summary[f"{prefix}_{name}"] = median
+        summary[f"{prefix}_{name}_width"] = upper - lower
+    return summary
+
+
+@click.command(help="Compare the Laplace approximation of the posterior with NUTS")
+@click.argument(
+    "country_data_files",
+    nargs=-1,
+    required=True,
+    type=click_pathlib.Path(exists=True),
+)
+@click.option("--cutoff", type=int, default=0, help="Ignore the last days of data")
+@click.option("--draws", type=int, default=400, help="NUTS draws per chain")
+@click.option("--chains", type=int, default=4)
+@click.option("--cores", type=int, default=4)
+def compare_posteriors(
+    country_data_files: Tuple[Path, ...], cutoff: int, draws: int, chains: int, cores: int
+) -> None:
+    # Imported lazily, the approximation itself does not need PyMC3.
+    from . import bayesian
+
+    sampler_settings = bayesian.SamplerSettings(draws=draws, chains=chains, cores=cores)
+    rows = []
+    for country_data_file in country_data_files:
+        report = create_report(country_data_file)
+        cases = bayesian.get_cases(report, cutoff)
+
+        laplace_start = time.perf_counter()
+        laplace_samples = sample_laplace_posterior(cases)
+        laplace_seconds = time.perf_counter() - laplace_start
+
+        nuts_start = time.perf_counter()
+        nuts_samples = bayesian.sample_posterior(cases, sampler_settings).to_model_samples()
+        nuts_seconds = time.perf_counter() - nuts_start
+
+        rows.append(
+            {
+                "country": report.short_name,
+                "laplace_seconds": laplace_seconds,
+                "nuts_seconds": nuts_seconds,
+                **_summarize(laplace_samples, "laplace"),
+                **_summarize(nuts_samples, "nuts"),
+            }
+        )
+
+    table = pd.DataFrame(rows)
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(table.round(2).to_string(index=False))
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from . import approximate_posterior, fit_atg_model
+
+
+def test_sample_laplace_posterior():
+    a, tg, exp, t0 = 2719.0, 7.2, 6.23, 2.5
+    xs = np.arange(100)
+    rng = np.random.default_rng(47)
+    cumulative = fit_atg_model._model(params=[a, tg, exp, t0], xs=xs)
+    cumulative += rng.normal(scale=20.0, size=len(cumulative))
+    cases = np.diff(np.maximum(0, cumulative))
+
+    samples = approximate_posterior.sample_laplace_posterior(cases, sample_count=2000, seed=47)
+    assert len(samples) == 2000
+    assert np.all(samples.a > 0) and np.all(samples.tg > 0) and np.all(samples.exp > 0)
+    assert np.median(samples.exp * samples.tg + samples.t0) == pytest.approx(
+        exp * tg + t0, rel=0.02
+    )
+
+    # More noise means more uncertainty.
+    noisier_cases = cases + rng.normal(scale=50.0, size=len(cases))
+    noisier_samples = approximate_posterior.sample_laplace_posterior(noisier_cases, seed=47)
+    assert np.std(noisier_samples.tg) > np.std(samples.tg)
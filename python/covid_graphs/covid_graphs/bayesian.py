@@ -1,82 +1,463 @@
 # Code inspired by a program from Vladimír Boža
 
+import datetime
+import functools
+import inspect
 import random
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, List, Optional
 
+import arviz as az
 import click
 import click_pathlib
-import matplotlib.pyplot as plt
 import numpy as np
 import pymc3 as pm
 
 from . import country_report
+from .approximate_posterior import fit_cumulative_cases, sample_laplace_posterior
 from .country_graph import CountryGraph, GraphType
-from .fit_atg_model import AtgModelFit
-from .formula import FittedFormula
+from .country_report import CountryReport
+from .fit_atg_model import AtgModelFit, AtgModelSamples
+from .formula import FittedFormula, PosteriorFormula
+from .posterior_cache import PosteriorCache, hash_content
 from .predictions import CountryPrediction, PredictionEvent
 
+# Variables of the posterior samples, everything else is discarded after sampling.
+POSTERIOR_VARIABLES = ["alpha", "tg", "shift", "mult"]
+# Free variables of the model, sampling stages continue the chains from their last values.
+_START_VARIABLES = ["alpha", "shift", "peak", "mult", "sigma"]
+_TRACED_VARIABLES = sorted(set(POSTERIOR_VARIABLES + _START_VARIABLES))
+# Prefix of the names of diagnostics when stored together with the draws.
+_DIAGNOSTIC_PREFIX = "diagnostic_"
+# Bounds of the uniform priors.
+_ALPHA_BOUNDS = (1.0, 20.0)
+_SHIFT_BOUNDS = (0.0, 40.0)
+_PEAK_BOUNDS = (30.0, 80.0)
+_MULT_BOUNDS = (-30.0, 20.0)
+# Half-width of the uniform jitter of the start point of every chain, in the (transformed) space
+# used by the sampler. Chains starting from the same point would make R-hat look better than it is.
+_START_JITTER = 0.5
+# Target acceptance rate of NUTS, controls the step size found by the tuning.
+_TARGET_ACCEPT = 0.9
 
-def fit_bayesian_model(cases: np.ndarray) -> List[AtgModelFit]:
-    base_length = 800
-    with pm.Model() as model:  # noqa: F841
-        days = np.arange(len(cases))
 
-        alpha = pm.Uniform("alpha", 1, 20)
-        shift = pm.Uniform("shift", 0, 40)
-        peak = pm.Uniform("peak", 30, 80)
-        mult = pm.Uniform("mult", -30, 20)
+@dataclass(frozen=True)
+class SamplerSettings:
+    """
+    NUTS sampler budget. Each chain is first tuned, then `burn_in` further draws are discarded and
+    `draws` are kept.
 
-        tg = pm.Deterministic("tg", peak / alpha)
-        x = pm.math.maximum(0, (days - shift) / tg)
-        x_prev = pm.math.maximum(0, (days - 1 - shift) / tg)
-        exp_cases = pm.Deterministic(
-            "exp_cases",
-            pm.math.exp(mult - x) * (x ** alpha) - pm.math.exp(mult - x_prev) * (x_prev ** alpha),
+    Sampling runs in stages, every stage continues the chains from the last draws of the previous
+    one. The first stage is tuned for `min_tune` steps, every next one for as many steps as all the
+    previous ones together, until the R-hat of every variable is at most `max_r_hat`, or the chains
+    were tuned for `tune` steps in total.
+    """
+
+    draws: int = 800
+    min_tune: int = 200
+    tune: int = 800
+    burn_in: int = 800
+    chains: int = 4
+    cores: int = 4
+    max_r_hat: float = 1.05
+
+
+@dataclass
+class PosteriorSamples:
+    """Posterior draws of the Bayesian ATG model, each array has shape (chains, draws)."""
+
+    alpha: np.ndarray
+    tg: np.ndarray
+    shift: np.ndarray
+    mult: np.ndarray
+    # Sampler diagnostics, e.g. "r_hat_alpha", "ess_alpha", "divergences", "sampling_seconds".
+    diagnostics: Dict[str, float] = field(default_factory=dict)
+
+    @staticmethod
+    def from_model_samples(samples: AtgModelSamples) -> "PosteriorSamples":
+        """Inverse of `to_model_samples`, the samples form a single chain."""
+        return PosteriorSamples(
+            alpha=samples.exp[np.newaxis, :],
+            tg=samples.tg[np.newaxis, :],
+            shift=samples.t0[np.newaxis, :] - 1,
+            mult=np.log(samples.a / samples.tg)[np.newaxis, :],
+        )
+
+    def to_model_samples(self) -> AtgModelSamples:
+        return AtgModelSamples(
+            a=(np.exp(self.mult) * self.tg).ravel(),
+            tg=self.tg.ravel(),
+            exp=self.alpha.ravel(),
+            t0=self.shift.ravel() + 1,
         )
 
-        sigma = pm.HalfCauchy("sigma", beta=500)
-        # likelihood = pm.Normal("y", mu=exp_cases, sigma=sigma, observed=cases)
-        # likelihood = pm.Cauchy("y", alpha=exp_cases, beta=sigma, observed=cases)
-        likelihood = pm.Laplace("obs", mu=exp_cases, b=sigma, observed=cases)  # noqa: F841
+    def to_fits(self) -> List[AtgModelFit]:
+        return self.to_model_samples().to_fits()
 
-        step = pm.NUTS(target_accept=0.9)
-        start = pm.find_MAP()
-        trace = pm.sample(
-            2 * base_length, chains=4, cores=4, tune=base_length, start=start, step=step
+    def show_trace_plot(self) -> None:
+        # Imported lazily, so that headless runs do not need a display.
+        import matplotlib.pyplot as plt
+
+        pm.traceplot({name: getattr(self, name) for name in POSTERIOR_VARIABLES})
+        plt.show()
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        arrays = {name: getattr(self, name) for name in POSTERIOR_VARIABLES}
+        arrays.update(
+            {_DIAGNOSTIC_PREFIX + name: np.array(value) for name, value in self.diagnostics.items()}
         )
-        trace = trace[base_length:]
+        return arrays
 
-    pm.traceplot(trace)
-    plt.show()
+    def save(self, path: Path) -> None:
+        """Saves the draws and diagnostics as a compressed .npz file."""
+        with open(path, "wb") as output:
+            np.savez_compressed(output, **self.to_arrays())
 
-    alpha_t = trace["alpha"][-base_length:]
-    shift_t = trace["shift"][-base_length:]
-    tg_t = trace["tg"][-base_length:]
-    a_t = np.exp(trace["mult"][-base_length:]) * tg_t
 
-    return [
-        AtgModelFit(exp=alpha, tg=tg, a=a, t0=shift + 1)
-        for alpha, tg, a, shift in zip(alpha_t, tg_t, a_t, shift_t)
-    ]
+def _create_posterior_samples(arrays: Dict[str, np.ndarray]) -> PosteriorSamples:
+    diagnostics = {
+        name[len(_DIAGNOSTIC_PREFIX) :]: float(value)
+        for name, value in arrays.items()
+        if name.startswith(_DIAGNOSTIC_PREFIX)
+    }
+    return PosteriorSamples(
+        diagnostics=diagnostics, **{name: arrays[name] for name in POSTERIOR_VARIABLES}
+    )
+
+
+def load_posterior_samples(path: Path) -> PosteriorSamples:
+    with np.load(path) as samples:
+        return _create_posterior_samples({name: samples[name] for name in samples.files})
+
+
+def _create_cache_key(cases: np.ndarray, sampler_settings: SamplerSettings) -> str:
+    """
+    The key identifies the data, the model and the sampler budget. The cutoff is implicitly part of
+    the key, since it determines `cases`. The model is identified by the source code creating it
+    and by the module constants it uses.
+    """
+    return hash_content(
+        np.ascontiguousarray(cases, dtype=np.float64).tobytes(),
+        inspect.getsource(BayesianAtgModel).encode(),
+        repr(
+            (
+                _ALPHA_BOUNDS,
+                _SHIFT_BOUNDS,
+                _PEAK_BOUNDS,
+                _MULT_BOUNDS,
+                _START_JITTER,
+                _TARGET_ACCEPT,
+            )
+        ).encode(),
+        repr(sampler_settings).encode(),
+    )
+
+
+def _create_start_values(cases: np.ndarray) -> Dict[str, float]:
+    """
+    Finds a starting point for sampling using the least-squares fit of the cumulative cases.
+    The shift of the model is `t0 - 1`, see `approximate_posterior.fit_cumulative_cases`.
+    """
+    fit, _ = fit_cumulative_cases(cases)
+
+    def clip(value: float, lower: float, upper: float) -> float:
+        # Uniform priors have zero density on the boundary, so we stay slightly inside.
+        margin = (upper - lower) * 1e-3
+        return float(np.clip(value, lower + margin, upper - margin))
+
+    expected_cumulative = AtgModelSamples.from_fits([fit]).predict(np.arange(len(cases) + 1))[0]
+    residuals = cases - np.diff(expected_cumulative)
+    return {
+        "alpha": clip(fit.exp, *_ALPHA_BOUNDS),
+        "shift": clip(fit.t0 - 1, *_SHIFT_BOUNDS),
+        "peak": clip(fit.exp * fit.tg, *_PEAK_BOUNDS),
+        "mult": clip(np.log(max(fit.a / fit.tg, 1e-12)), *_MULT_BOUNDS),
+        # Maximum likelihood estimate of the scale of the Laplace distribution.
+        "sigma": max(float(np.mean(np.abs(residuals))), 1.0),
+    }
+
+
+class BayesianAtgModel:
+    """
+    The Bayesian ATG model, compiled once. The daily cases are a shared data container, so that
+    posteriors of many case series (countries, cutoffs) can be sampled without recompiling.
+    """
+
+    def __init__(self, target_accept: float = _TARGET_ACCEPT):
+        with pm.Model() as self.model:
+            cases = pm.Data("cases", np.zeros(1))
+            days = pm.Data("days", np.zeros(1))
+
+            alpha = pm.Uniform("alpha", *_ALPHA_BOUNDS)
+            shift = pm.Uniform("shift", *_SHIFT_BOUNDS)
+            peak = pm.Uniform("peak", *_PEAK_BOUNDS)
+            mult = pm.Uniform("mult", *_MULT_BOUNDS)
+
+            tg = pm.Deterministic("tg", peak / alpha)
+            x = pm.math.maximum(0, (days - shift) / tg)
+            x_prev = pm.math.maximum(0, (days - 1 - shift) / tg)
+            # Not a pm.Deterministic, so that the per-day values are not stored in the trace.
+            exp_cases = pm.math.exp(mult - x) * (x ** alpha) - pm.math.exp(mult - x_prev) * (
+                x_prev ** alpha
+            )
+
+            sigma = pm.HalfCauchy("sigma", beta=500)
+            # likelihood = pm.Normal("y", mu=exp_cases, sigma=sigma, observed=cases)
+            # likelihood = pm.Cauchy("y", alpha=exp_cases, beta=sigma, observed=cases)
+            likelihood = pm.Laplace("obs", mu=exp_cases, b=sigma, observed=cases)  # noqa: F841
+
+            # Compiles the log-probability and its gradient.
+            self.step = pm.NUTS(target_accept=target_accept)
+
+    def _create_start_point(self, values: Dict[str, float]) -> Dict[str, np.ndarray]:
+        """Converts `values` of the variables into the (transformed) space used by the sampler."""
+        start = {}
+        for name, value in values.items():
+            variable = self.model[name]
+            if hasattr(variable, "transformed"):
+                start[variable.transformed.name] = variable.transformation.forward_val(
+                    np.array(value)
+                )
+            else:
+                start[name] = np.array(value)
+        return start
+
+    def _create_chain_start_points(
+        self, values: Dict[str, float], chains: int
+    ) -> List[Dict[str, np.ndarray]]:
+        """Jitters the start point given by `values` independently for every chain."""
+        start = self._create_start_point(values)
+        return [
+            {
+                name: value + np.random.uniform(-_START_JITTER, _START_JITTER, np.shape(value))
+                for name, value in start.items()
+            }
+            for _ in range(chains)
+        ]
+
+    def sample(self, cases: np.ndarray, sampler_settings: SamplerSettings) -> PosteriorSamples:
+        sampling_start = time.perf_counter()
+        pm.set_data({"cases": cases, "days": np.arange(len(cases))}, model=self.model)
+        start = self._create_chain_start_points(
+            _create_start_values(cases), sampler_settings.chains
+        )
+
+        total_tune = 0
+        stage_tune = min(sampler_settings.min_tune, sampler_settings.tune)
+        while True:
+            with self.model:
+                trace = pm.sample(
+                    sampler_settings.burn_in + sampler_settings.draws,
+                    chains=sampler_settings.chains,
+                    cores=sampler_settings.cores,
+                    tune=stage_tune,
+                    start=start,
+                    step=self.step,
+                    trace=[self.model[name] for name in _TRACED_VARIABLES],
+                    return_inferencedata=False,
+                    compute_convergence_checks=False,
+                )
+            total_tune += stage_tune
+            kept_trace = trace[sampler_settings.burn_in :]
+            draws = {
+                name: np.array(kept_trace.get_values(name, combine=False))
+                for name in POSTERIOR_VARIABLES
+            }
+            r_hat = az.rhat(draws)
+            max_r_hat = max(float(r_hat[name]) for name in POSTERIOR_VARIABLES)
+            stage_tune = min(total_tune, sampler_settings.tune - total_tune)
+            if max_r_hat <= sampler_settings.max_r_hat or stage_tune <= 0:
+                break
+            # The chains were not thrown away, the next stage continues from where they are.
+            start = [
+                self._create_start_point(
+                    {name: trace.point(-1, chain=chain)[name] for name in _START_VARIABLES}
+                )
+                for chain in trace.chains
+            ]
+
+        ess = az.ess(draws)
+        diagnostics = {
+            "converged": float(max_r_hat <= sampler_settings.max_r_hat),
+            "divergences": float(kept_trace.get_sampler_stats("diverging").sum()),
+            "tune": float(total_tune),
+            "sampling_seconds": time.perf_counter() - sampling_start,
+        }
+        for name in POSTERIOR_VARIABLES:
+            diagnostics[f"r_hat_{name}"] = float(r_hat[name])
+            diagnostics[f"ess_{name}"] = float(ess[name])
+        return PosteriorSamples(diagnostics=diagnostics, **draws)
+
+
+@functools.lru_cache(maxsize=None)
+def get_bayesian_model() -> BayesianAtgModel:
+    """Returns the process-wide compiled model."""
+    return BayesianAtgModel()
+
+
+def sample_posterior(
+    cases: np.ndarray,
+    sampler_settings: SamplerSettings = SamplerSettings(),
+    cache: Optional[PosteriorCache] = None,
+) -> PosteriorSamples:
+    """
+    Samples the posterior of the Bayesian ATG model given daily `cases`. If `cache` is given,
+    previously sampled posteriors of the same data, model and sampler settings are reused.
+    """
+    if cache is not None:
+        cache_key = _create_cache_key(cases, sampler_settings)
+        cached_arrays = cache.get(cache_key)
+        if cached_arrays is not None:
+            return _create_posterior_samples(cached_arrays)
+
+    posterior_samples = get_bayesian_model().sample(cases, sampler_settings)
+
+    if cache is not None:
+        cache.put(cache_key, posterior_samples.to_arrays())
+    return posterior_samples
+
+
+def get_cases(report: CountryReport, cutoff: int) -> np.ndarray:
+    """Daily increase of active cases, ignoring the last `cutoff` days."""
+    used_length = len(report.dates) - cutoff
+    return np.diff(report.cumulative_active[:used_length])
+
+
+def sample_posteriors(
+    report: CountryReport,
+    cutoffs: Iterable[int],
+    sampler_settings: SamplerSettings = SamplerSettings(),
+    cache: Optional[PosteriorCache] = None,
+) -> Dict[int, PosteriorSamples]:
+    """Samples posteriors for many cutoffs of one country, e.g. for a backtest."""
+    return {
+        cutoff: sample_posterior(get_cases(report, cutoff), sampler_settings, cache)
+        for cutoff in cutoffs
+    }
+
+
+def fit_bayesian_model(
+    cases: np.ndarray,
+    sampler_settings: SamplerSettings = SamplerSettings(),
+    show_trace: bool = True,
+) -> List[AtgModelFit]:
+    posterior_samples = sample_posterior(cases, sampler_settings)
+
+    if show_trace:
+        posterior_samples.show_trace_plot()
+
+    return posterior_samples.to_fits()
 
 
 @click.command(help="COVID-19 country growth visualization")
 @click.argument("filename", required=True, type=click_pathlib.Path(exists=True))
 @click.argument("cutoff", required=False, type=int, default=0)
-def calculate_posterior(filename: Path, cutoff: int):
+@click.option("--draws", type=int, default=SamplerSettings.draws, help="Kept draws per chain")
+@click.option(
+    "--min-tune", type=int, default=SamplerSettings.min_tune, help="Tuning steps of the first stage"
+)
+@click.option(
+    "--tune", type=int, default=SamplerSettings.tune, help="Maximal tuning steps per chain"
+)
+@click.option(
+    "--burn-in", type=int, default=SamplerSettings.burn_in, help="Discarded draws per chain"
+)
+@click.option("--chains", type=int, default=SamplerSettings.chains)
+@click.option("--cores", type=int, default=SamplerSettings.cores)
+@click.option(
+    "-o",
+    "--output",
+    type=click_pathlib.Path(),
+    default=None,
+    help="Save the posterior samples (alpha, tg, shift, mult) into this .npz file",
+)
+@click.option("--headless", is_flag=True, help="Do not show the trace plot and the figure")
+@click.option(
+    "--approximate",
+    is_flag=True,
+    help="Use a Laplace approximation around the least-squares fit instead of NUTS",
+)
+@click.option(
+    "--bands/--traces",
+    default=True,
+    help="Show the median and credible interval of all samples, or 100 sampled traces",
+)
+@click.option(
+    "--cache-dir",
+    type=click_pathlib.Path(),
+    default=None,
+    help="Reuse posteriors sampled for the same data, model and sampler settings",
+)
+@click.option("--cache-max-age-days", type=float, default=30, help="Evict older cache entries")
+@click.option("--cache-max-size-mb", type=float, default=500, help="Maximal size of the cache")
+def calculate_posterior(
+    filename: Path,
+    cutoff: int,
+    draws: int,
+    min_tune: int,
+    tune: int,
+    burn_in: int,
+    chains: int,
+    cores: int,
+    output: Optional[Path],
+    headless: bool,
+    approximate: bool,
+    bands: bool,
+    cache_dir: Optional[Path],
+    cache_max_age_days: float,
+    cache_max_size_mb: float,
+):
     report = country_report.create_report(filename)
 
     used_length = len(report.dates) - cutoff
     print(used_length)
-    cases = np.diff(report.cumulative_active[:used_length])
+    cases = get_cases(report, cutoff)
+
+    sampler_settings = SamplerSettings(
+        draws=draws, min_tune=min_tune, tune=tune, burn_in=burn_in, chains=chains, cores=cores
+    )
+    cache = None
+    if cache_dir is not None:
+        cache = PosteriorCache(
+            cache_dir,
+            max_age=datetime.timedelta(days=cache_max_age_days),
+            max_size_bytes=int(cache_max_size_mb * 2 ** 20),
+        )
+    if approximate:
+        posterior_samples = PosteriorSamples.from_model_samples(sample_laplace_posterior(cases))
+    else:
+        posterior_samples = sample_posterior(cases, sampler_settings, cache)
+        print(f"Diagnostics: {posterior_samples.diagnostics}")
+    if output is not None:
+        posterior_samples.save(output)
+        print(f"Saved {posterior_samples.alpha.size} posterior samples to {output}")
+    if headless:
+        return
 
-    fits = random.sample(fit_bayesian_model(cases), 100)
+    if not approximate:
+        posterior_samples.show_trace_plot()
+    last_data_date = report.dates[used_length - 1]
+
+    if bands:
+        posterior_formula = PosteriorFormula(
+            samples=posterior_samples.to_model_samples(),
+            start_date=report.dates[0],
+            last_data_date=last_data_date,
+        )
+        country_graph = CountryGraph(
+            report=report, country_predictions=[], posterior_formula=posterior_formula
+        )
+        country_graph.create_country_figure(graph_type=GraphType.BayesBands).show()
+        return
+
+    fits = posterior_samples.to_fits()
+    fits = random.sample(fits, min(100, len(fits)))
     print("Five random fits:")
     for fit in fits[:5]:
         print(fit)
 
-    last_data_date = report.dates[used_length - 1]
     predictions = [
         CountryPrediction(
             prediction_event=PredictionEvent(
@@ -0,0 +1,178 @@
+import datetime
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import click
+import click_pathlib
+import numpy as np
+
+from .country_report import CountryReport, create_report
+
+# Name of the consolidated dataset in a data directory, next to the .data files.
+DATASET_FILENAME = "countries.npz"
+
+
+@dataclass
+class CountryDataset:
+    """
+    Data of many countries in one place, as (countries x dates) matrices sharing one date axis,
+    which starts at `start_date` and has one column per day. Countries are indexed in the order of
+    `short_names`.
+
+    Country i has data on columns `first_idx[i]` until `last_idx[i]` (exclusive), other entries
+    of its row are zero. This way, cumulative sums over rows are correct too.
+    """
+
+    short_names: List[str]
+    long_names: List[str]
+    population: np.ndarray
+    start_date: datetime.date
+    first_idx: np.ndarray
+    last_idx: np.ndarray
+    daily_positive: np.ndarray
+    daily_dead: np.ndarray
+    daily_recovered: np.ndarray
+
+    def __post_init__(self):
+        self._idx_by_short_name = {name: idx for idx, name in enumerate(self.short_names)}
+        self.daily_active = self.daily_positive - self.daily_recovered - self.daily_dead
+        self.cumulative_active = np.cumsum(self.daily_active, axis=1)
+        # The shared date axis, one date per column.
+        self.dates = [
+            self.start_date + datetime.timedelta(days=day)
+            for day in range(self.daily_positive.shape[1])
+        ]
+
+    def __len__(self) -> int:
+        return len(self.short_names)
+
+    def __contains__(self, short_name: str) -> bool:
+        return short_name in self._idx_by_short_name
+
+    def create_report(self, short_name: str) -> CountryReport:
+        """Returns the same report as `country_report.create_report` of the country's .data file."""
+        idx = self._idx_by_short_name[short_name]
+        first, last = self.first_idx[idx], self.last_idx[idx]
+        return CountryReport(
+            short_name=short_name,
+            long_name=self.long_names[idx],
+            dates=self.dates[first:last],
+            daily_positive=self.daily_positive[idx, first:last],
+            daily_dead=self.daily_dead[idx, first:last],
+            daily_recovered=self.daily_recovered[idx, first:last],
+            daily_active=self.daily_active[idx, first:last],
+            cumulative_active=self.cumulative_active[idx, first:last],
+            # Same type as the population parsed from a .data file.
+            population=int(self.population[idx]),
+        )
+
+
+def create_country_dataset(reports: Iterable[CountryReport]) -> CountryDataset:
+    reports = sorted(reports, key=lambda report: report.short_name)
+    start_date = min(report.dates[0] for report in reports)
+    end_date = max(report.dates[-1] for report in reports)
+    date_count = (end_date - start_date).days + 1
+
+    first_idx = np.array([(report.dates[0] - start_date).days for report in reports])
+    last_idx = first_idx + np.array([len(report.dates) for report in reports])
+    metrics = {
+        name: np.zeros((len(reports), date_count), dtype=np.int64)
+        for name in ["daily_positive", "daily_dead", "daily_recovered"]
+    }
+    for idx, report in enumerate(reports):
+        if (report.dates[-1] - report.dates[0]).days + 1 != len(report.dates):
+            raise ValueError(f"Data of {report.short_name} are not consecutive days")
+        for name, matrix in metrics.items():
+            matrix[idx, first_idx[idx] : last_idx[idx]] = getattr(report, name)
+
+    return CountryDataset(
+        short_names=[report.short_name for report in reports],
+        long_names=[report.long_name for report in reports],
+        population=np.array([report.population for report in reports], dtype=np.uint64),
+        start_date=start_date,
+        first_idx=first_idx,
+        last_idx=last_idx,
+        **metrics,
+    )
+
+
+def save_country_dataset(dataset: CountryDataset, path: Path) -> None:
+    # Uncompressed, so that loading is just reading the arrays.
+    with open(path, "wb") as output:
+        np.savez(
+            output,
+            short_names=np.array(dataset.short_names),
+            long_names=np.array(dataset.long_names),
+            population=dataset.population,
+            start_date=np.array(dataset.start_date.isoformat()),
+            first_idx=dataset.first_idx,
+            last_idx=dataset.last_idx,
+            daily_positive=dataset.daily_positive,
+            daily_dead=dataset.daily_dead,
+            daily_recovered=dataset.daily_recovered,
+        )
+
+
+def load_country_dataset(path: Path) -> CountryDataset:
+    with np.load(path, allow_pickle=False) as arrays:
+        return CountryDataset(
+            short_names=arrays["short_names"].tolist(),
+            long_names=arrays["long_names"].tolist(),
+            population=arrays["population"],
+            start_date=datetime.date.fromisoformat(str(arrays["start_date"])),
+            first_idx=arrays["first_idx"],
+            last_idx=arrays["last_idx"],
+            daily_positive=arrays["daily_positive"],
+            daily_dead=arrays["daily_dead"],
+            daily_recovered=arrays["daily_recovered"],
+        )
+
+
+def load_country_reports(data_dir: Path, short_names: Iterable[str]) -> Dict[str, CountryReport]:
+    """
+    Creates reports of the countries in `short_names` which have data in `data_dir`. Reads them
+    from the consolidated dataset if there is one newer than the country's .data file, otherwise
+    parses the .data file.
+    """
+    dataset: Optional[CountryDataset] = None
+    dataset_path = data_dir / DATASET_FILENAME
+    if dataset_path.is_file():
+        dataset = load_country_dataset(dataset_path)
+        dataset_mtime = dataset_path.stat().st_mtime
+
+    reports = {}
+    for short_name in short_names:
+        data_path = data_dir / f"{short_name}.data"
+        data_is_file = data_path.is_file()
+        if (
+            dataset is not None
+            and short_name in dataset
+            and (not data_is_file or data_path.stat().st_mtime <= dataset_mtime)
+        ):
+            reports[short_name] = dataset.create_report(short_name)
+        elif data_is_file:
+            reports[short_name] = create_report(data_path)
+    return reports
+
+
+@click.command(help="Consolidate the .data files of all countries into one dataset")
+@click.argument(
+    "data_dir",
+    required=True,
+    type=click_pathlib.Path(exists=True),
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click_pathlib.Path(),
+    default=None,
+    help=f"Output file, {DATASET_FILENAME} in DATA_DIR by default",
+)
+def create_dataset(data_dir: Path, output: Optional[Path]) -> None:
+    output = output or data_dir / DATASET_FILENAME
+    dataset = create_country_dataset(
+        create_report(path) for path in sorted(data_dir.glob("*.data"))
+    )
+    save_country_dataset(dataset, output)
+    print(f"Wrote {len(dataset)} countries and {len(dataset.dates)} days into {output}")
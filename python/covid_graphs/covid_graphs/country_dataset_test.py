@@ -0,0 +1,51 @@
+import datetime
+
+import numpy as np
+
+from . import country_dataset
+from .country_report import CountryReport
+
+
+def _create_report(short_name: str, start_date: datetime.date, daily_positive) -> CountryReport:
+    daily_positive = np.array(daily_positive)
+    daily_recovered = daily_positive // 2
+    daily_dead = np.zeros(len(daily_positive), dtype=int)
+    daily_active = daily_positive - daily_recovered - daily_dead
+    return CountryReport(
+        short_name=short_name,
+        long_name=f"{short_name} long",
+        dates=[start_date + datetime.timedelta(days=d) for d in range(len(daily_positive))],
+        daily_positive=daily_positive,
+        daily_dead=daily_dead,
+        daily_recovered=daily_recovered,
+        daily_active=daily_active,
+        cumulative_active=np.cumsum(daily_active),
+        population=1000,
+    )
+
+
+def test_country_dataset(tmp_path):
+    reports = [
+        _create_report("B", datetime.date(2020, 3, 3), [1, 5, 9]),
+        _create_report("A", datetime.date(2020, 3, 1), [2, 4, 6, 8]),
+    ]
+    dataset = country_dataset.create_country_dataset(reports)
+    assert dataset.short_names == ["A", "B"]
+    assert dataset.dates[0] == datetime.date(2020, 3, 1)
+    assert dataset.daily_positive.shape == (2, 5)
+    # Cross-country data is plain array slicing.
+    assert list(dataset.daily_positive[:, 2]) == [6, 1]
+
+    path = tmp_path / country_dataset.DATASET_FILENAME
+    country_dataset.save_country_dataset(dataset, path)
+    loaded = country_dataset.load_country_dataset(path)
+    for report in reports:
+        loaded_report = loaded.create_report(report.short_name)
+        assert loaded_report.long_name == report.long_name
+        assert loaded_report.dates == report.dates
+        assert loaded_report.population == report.population
+        for metric in ["daily_positive", "daily_recovered", "daily_active", "cumulative_active"]:
+            assert np.array_equal(getattr(loaded_report, metric), getattr(report, metric))
+
+    reports_by_short_name = country_dataset.load_country_reports(tmp_path, ["A", "B", "C"])
+    assert sorted(reports_by_short_name.keys()) == ["A", "B"]
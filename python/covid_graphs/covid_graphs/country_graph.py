@@ -2,26 +2,34 @@ import datetime
 import math
 from enum import Enum
 from pathlib import Path
-from typing import Iterable, List, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
 import click
 import click_pathlib
+import numpy as np
 from plotly.graph_objs import Figure, Layout, Scatter
 
 from . import predictions
 from .country_report import CountryReport, create_report
-from .formula import FittedFormula, TraceGenerator
+from .formula import FittedFormula, PosteriorFormula, TraceGenerator, get_date_axis
 from .predictions import BK_20200329, BK_20200411, CountryPrediction, PredictionEvent
 
 # Extend the predictions at least by 1/5th of the length of active cases.
 EXTENSION_RATIO = 0.2
+# Probability mass of the interval drawn around predictions with uncertainty.
+INTERVAL_MASS = 0.9
+# Length of a day on date axes of plotly.
+MILLISECONDS_PER_DAY = 24 * 60 * 60 * 1000
 
 
 class GraphType(Enum):
     Slider = "slider"
+    # Same as Slider, but the figure only grows linearly with the number of predictions.
+    CompactSlider = "compact-slider"
     SinglePrediction = "single"
     MultiPredictions = "multi"
     BayesPredictions = "bayes"
+    BayesBands = "bayes-bands"
 
     def __str__(self):
         return self.value
@@ -36,41 +44,68 @@ class GraphAxisType(Enum):
         return self.value
 
 
+def _to_date_array(dates: Sequence[Union[datetime.date, np.datetime64]]) -> np.ndarray:
+    return np.array(dates, dtype="datetime64[D]")
+
+
+def _get_date_index(dates: np.ndarray, date: Union[datetime.date, np.datetime64]) -> int:
+    """Returns the index of `date` in `dates`, a datetime64[D] array of consecutive days."""
+    return int((np.datetime64(date, "D") - dates[0]) // np.timedelta64(1, "D"))
+
+
 def _get_display_range(
-    report: CountryReport, trace_generators: Iterable[TraceGenerator]
+    report: CountryReport,
+    trace_generators: Iterable[TraceGenerator],
+    posterior_formula: Optional[PosteriorFormula] = None,
 ) -> Tuple[datetime.date, datetime.date]:
-    start_date = min(
-        [trace_generator.start_date for trace_generator in trace_generators] + [report.dates[0]]
-    )
+    start_dates = [trace_generator.start_date for trace_generator in trace_generators]
+    display_at_least_until = [
+        trace_generator.display_at_least_until for trace_generator in trace_generators
+    ]
+    if posterior_formula is not None:
+        start_dates.append(posterior_formula.start_date)
+        display_at_least_until.append(posterior_formula.get_display_at_least_until())
+
+    start_date = min(start_dates + [report.dates[0]])
 
     last_report_date = report.dates[-1]
     report_length = last_report_date - start_date + datetime.timedelta(days=1)
     report_extension = report_length * EXTENSION_RATIO
 
-    display_until = max(
-        [trace_generator.display_at_least_until for trace_generator in trace_generators]
-        + [last_report_date + report_extension]
-    )
+    display_until = max(display_at_least_until + [last_report_date + report_extension])
 
     return start_date, display_until
 
 
 class CountryGraph:
-    """Constructs a graph for a given country"""
+    """
+    Constructs a graph for a given country.
+
+    Instead of (or in addition to) individual predictions, the graph can show a posterior
+    prediction as a median with a credible interval band, see GraphType.BayesBands.
+
+    A graph is read-only once constructed, its arrays are not writeable. Figures are created anew
+    by every call of `create_country_figure` without modifying the graph, so a graph can be shared
+    by threads, e.g. by the Dash callbacks of a threaded server.
+    """
 
     def __init__(
         self,
         report: CountryReport,
         country_predictions: List[CountryPrediction],
+        posterior_formula: Optional[PosteriorFormula] = None,
     ):
         self.short_name = report.short_name
         self.long_name = report.long_name
 
-        if len(country_predictions) >= 1:
-            self.prediction_last_data_date = max(
-                country_prediction.prediction_event.last_data_date
-                for country_prediction in country_predictions
-            )
+        last_data_dates = [
+            country_prediction.prediction_event.last_data_date
+            for country_prediction in country_predictions
+        ]
+        if posterior_formula is not None:
+            last_data_dates.append(posterior_formula.last_data_date)
+        if len(last_data_dates) >= 1:
+            self.prediction_last_data_date = max(last_data_dates)
 
         # We create traces in three steps:
         # 1. A formula is first shifted to the appropriate date on the graph, creating a
@@ -84,22 +119,36 @@ class CountryGraph:
             )
             for prediction in country_predictions
         }
-        start_date, display_until = _get_display_range(report, trace_generator_by_event.values())
+        start_date, display_until = _get_display_range(
+            report, trace_generator_by_event.values(), posterior_formula
+        )
         self.trace_by_event = {
             event: trace_generator.generate_trace(display_until)
             for event, trace_generator in trace_generator_by_event.items()
         }
-
-        start_date_idx = report.dates.index(start_date)
-        # Crop country data to display.
-        self.cropped_dates = report.dates[start_date_idx:]
+        self.posterior_last_data_date = None
+        self.trace_bands = None
+        if posterior_formula is not None:
+            self.posterior_last_data_date = posterior_formula.last_data_date
+            self.trace_bands = posterior_formula.generate_bands(display_until, INTERVAL_MASS)
+
+        # Crop country data to display. Reports have a record for every day.
+        start_date_idx = (start_date - report.dates[0]).days
+        if not 0 <= start_date_idx < len(report.dates):
+            raise ValueError(f"{start_date} is not a date of the report of {report.short_name}")
+        self.cropped_dates = get_date_axis(
+            start_date, np.arange(len(report.dates) - start_date_idx)
+        )
         self.cropped_cumulative_active = report.cumulative_active[start_date_idx:]
-        self.log_xaxis_date_since = self.cropped_dates[0] - datetime.timedelta(days=1)
+        self.cropped_dates.flags.writeable = False
+        self.cropped_cumulative_active.flags.writeable = False
+        self.log_xaxis_date_since = start_date - datetime.timedelta(days=1)
         self.log_title = f"Days [since {self.log_xaxis_date_since.strftime('%b %d, %Y')}]"
         self.date_title = None
 
         self.max_value = max(
             [trace.max_value for trace in self.trace_by_event.values()]
+            + ([self.trace_bands.upper.max()] if self.trace_bands is not None else [])
             + [self.cropped_cumulative_active.max()]
         )
         self.log_yrange = [
@@ -135,18 +184,225 @@ class CountryGraph:
             yanchor="bottom",
         )
 
+    def _create_compact_slider(
+        self,
+        adjust_xlabel: Callable,
+        graph_axis_type: GraphAxisType,
+        get_color: Callable[[PredictionEvent], str],
+    ) -> Tuple[List[Scatter], Dict[str, Any]]:
+        """
+        Creates the traces of the latest prediction and a slider restyling them with the values of
+        the selected prediction. Unlike `_create_slider`, which toggles the visibility of all
+        traces of all predictions, every prediction is only sent once, in its step of the slider.
+        The traces have to be the first ones of the figure.
+
+        Predictions are sent as their first date and values, since their dates are consecutive.
+        """
+        if graph_axis_type == GraphAxisType.LogLog:
+            # Days since `log_xaxis_date_since`, the dates are shown as the hover text.
+            day_length: int = 1
+        else:
+            day_length = MILLISECONDS_PER_DAY
+
+        steps = []
+        values_by_step = []
+        for event, trace in self.trace_by_event.items():
+            data_until_idx = _get_date_index(trace.xs, event.last_data_date)
+            rect_x = adjust_xlabel(
+                _to_date_array(
+                    [
+                        self.cropped_dates[0],
+                        event.last_data_date,
+                        event.last_data_date,
+                        self.cropped_dates[0],
+                    ]
+                )
+            )
+            first_dates = adjust_xlabel(trace.xs[[0, data_until_idx]]).tolist()
+            if graph_axis_type == GraphAxisType.LogLog:
+                text = [None, trace.xs[: data_until_idx + 1], trace.xs[data_until_idx:], None]
+            else:
+                text = [None] * 4
+            label = trace.label.replace(
+                "%PREDICTION_DATE%", event.prediction_date.strftime("%b %d")
+            )
+            color = get_color(event)
+            # Values of the data cutoff rectangle, the prediction until and after the cutoff and
+            # the maximum mark.
+            values = {
+                "x": [
+                    rect_x,
+                    None,
+                    None,
+                    adjust_xlabel(_to_date_array([trace.max_value_date] * 2)),
+                ],
+                "x0": [None, first_dates[0], first_dates[1], None],
+                "dx": [None, day_length, day_length, None],
+                "y": [
+                    [0, 0, self.max_value, self.max_value],
+                    trace.ys[: data_until_idx + 1],
+                    trace.ys[data_until_idx:],
+                    [1.0, trace.max_value],
+                ],
+                "text": text,
+                "name": [None, label, label, "Peak"],
+                "line.color": ["rgba(255,255,255,0)", color, color, color],
+            }
+            values_by_step.append(values)
+            steps.append(
+                dict(
+                    method="restyle",
+                    args=(values, [0, 1, 2, 3]),
+                    label=event.last_data_date.strftime("%B %d"),
+                )
+            )
+
+        styles: List[Dict[str, Any]] = [
+            dict(
+                mode="none",
+                fill="tozerox",
+                fillcolor="rgba(144, 238, 144, 0.4)",
+                opacity=0.4,
+                showlegend=False,
+                hoverinfo="skip",
+            ),
+            dict(mode="lines", line=dict(width=2)),
+            dict(mode="lines", line=dict(width=2, dash="dot"), showlegend=False),
+            dict(
+                mode="markers",
+                marker=dict(size=15, symbol="star"),
+                showlegend=False,
+                hoverinfo="skip",
+            ),
+        ]
+        latest_values = values_by_step[-1]
+        traces = []
+        for idx, style in enumerate(styles):
+            trace = Scatter(
+                **{
+                    attribute: latest_values[attribute][idx]
+                    for attribute in ["x", "x0", "dx", "y", "text", "name"]
+                },
+                **style,
+            )
+            trace.line.color = latest_values["line.color"][idx]
+            traces.append(trace)
+
+        slider = dict(
+            active=len(steps) - 1,
+            currentvalue={"prefix": "Prediction date: "},
+            pad={"b": 20},
+            steps=steps,
+            y=1,
+            yanchor="bottom",
+        )
+        return traces, slider
+
+    def _create_band_traces(self, adjust_xlabel: Callable) -> List[Scatter]:
+        bands = self.trace_bands
+        assert bands is not None and self.posterior_last_data_date is not None
+        blue = "rgb(0, 121, 177)"
+        xs = adjust_xlabel(bands.xs)
+        data_until_idx = _get_date_index(bands.xs, self.posterior_last_data_date)
+
+        rect_x = adjust_xlabel(
+            _to_date_array(
+                [
+                    self.cropped_dates[0],
+                    self.posterior_last_data_date,
+                    self.posterior_last_data_date,
+                    self.cropped_dates[0],
+                ]
+            )
+        )
+        peak_dates = [bands.peak_lower_date.date(), bands.peak_upper_date.date()]
+        peak_idx = min(len(bands.xs) - 1, _get_date_index(bands.xs, bands.peak_date.date()))
+        peak_value = bands.median[peak_idx]
+        interval_name = f"{bands.interval_mass:.0%} {bands.interval_kind}"
+
+        return [
+            Scatter(
+                x=rect_x,
+                y=[0, 0, self.max_value, self.max_value],
+                mode="none",
+                fill="tozerox",
+                fillcolor="rgba(144, 238, 144, 0.4)",
+                opacity=0.4,
+                line=dict(color="rgba(255,255,255,0)"),
+                showlegend=False,
+                hoverinfo="skip",
+            ),
+            Scatter(
+                x=xs,
+                y=bands.upper,
+                mode="lines",
+                line=dict(width=0, color=blue),
+                showlegend=False,
+                hoverinfo="skip",
+            ),
+            Scatter(
+                x=xs,
+                y=bands.lower,
+                mode="lines",
+                name=interval_name,
+                fill="tonexty",
+                fillcolor="rgba(0, 121, 177, 0.25)",
+                line=dict(width=0, color=blue),
+                hoverinfo="skip",
+            ),
+            Scatter(
+                x=xs[: data_until_idx + 1],
+                y=bands.median[: data_until_idx + 1],
+                text=bands.xs[: data_until_idx + 1],
+                mode="lines",
+                name=bands.label.replace(
+                    "%PREDICTION_DATE%", self.posterior_last_data_date.strftime("%b %d")
+                ),
+                line=dict(width=2, color=blue),
+            ),
+            Scatter(
+                x=xs[data_until_idx:],
+                y=bands.median[data_until_idx:],
+                text=bands.xs[data_until_idx:],
+                mode="lines",
+                line=dict(width=2, dash="dot", color=blue),
+                showlegend=False,
+            ),
+            Scatter(
+                x=adjust_xlabel(_to_date_array(peak_dates)),
+                y=[peak_value, peak_value],
+                mode="lines+markers",
+                name=f"Peak, {interval_name}",
+                line=dict(width=3, color=blue),
+                marker=dict(size=10, symbol="line-ns-open"),
+                text=[date.strftime("%b %d") for date in peak_dates],
+                hoverinfo="text",
+            ),
+            Scatter(
+                x=adjust_xlabel(_to_date_array([bands.peak_date.date()])),
+                y=[peak_value],
+                mode="markers",
+                name="Median peak",
+                marker=dict(size=15, symbol="star", color=blue),
+                showlegend=False,
+                hoverinfo="skip",
+            ),
+        ]
+
     def create_country_figure(
         self,
         graph_axis_type: GraphAxisType = GraphAxisType.Linear,
         graph_type: GraphType = GraphType.SinglePrediction,
-    ):
-        def adjust_xlabel(date: datetime.date):
+    ) -> Figure:
+        log_xaxis_date_since = np.datetime64(self.log_xaxis_date_since, "D")
+
+        def adjust_xlabel(dates: np.ndarray) -> np.ndarray:
             # Due to plotly limitations, we can only have graphs with dates on the x-axis when we
             # x-axis isn't log-scale.
             if graph_axis_type != GraphAxisType.LogLog:
-                return date
+                return dates
             else:
-                return (date - self.log_xaxis_date_since).days
+                return (dates - log_xaxis_date_since) // np.timedelta64(1, "D")
 
         def color_and_opacity_by_event(event: PredictionEvent, count: int):
             orange = "rgb(255, 123, 37)"
@@ -167,11 +423,23 @@ class CountryGraph:
                 return blue, 1.0
 
         traces = []
+        sliders = []
+        if graph_type == GraphType.CompactSlider and len(self.trace_by_event) > 0:
+            slider_traces, slider = self._create_compact_slider(
+                adjust_xlabel,
+                graph_axis_type,
+                lambda event: color_and_opacity_by_event(event, 0)[0],
+            )
+            traces.extend(slider_traces)
+            sliders.append(slider)
+
+        # The traces of the compact slider are already created.
+        trace_by_event = {} if graph_type == GraphType.CompactSlider else self.trace_by_event
         visibility = graph_type != GraphType.Slider
         count = 0
-        for event, trace in self.trace_by_event.items():
+        for event, trace in trace_by_event.items():
             prediction_date_str = event.prediction_date.strftime("%b %d")
-            data_until_idx = trace.xs.index(event.last_data_date)
+            data_until_idx = _get_date_index(trace.xs, event.last_data_date)
 
             count += 1
             color, opacity = color_and_opacity_by_event(event, count)
@@ -181,10 +449,7 @@ class CountryGraph:
                 data_until_y = trace.ys[data_until_idx]
                 traces.append(
                     Scatter(
-                        x=[
-                            adjust_xlabel(event.last_data_date),
-                            adjust_xlabel(event.last_data_date),
-                        ],
+                        x=adjust_xlabel(_to_date_array([event.last_data_date] * 2)),
                         y=[1.0, data_until_y],
                         mode="markers",
                         name="Data cutoff",
@@ -199,11 +464,16 @@ class CountryGraph:
                 )
             elif graph_type != GraphType.BayesPredictions or count == 1:
                 # For Bayesian predictions we only want to draw one rectangle
-                rect_x = [
-                    adjust_xlabel(self.cropped_dates[0]),
-                    adjust_xlabel(event.last_data_date),
-                ]
-                rect_x = rect_x + rect_x[::-1]
+                rect_x = adjust_xlabel(
+                    _to_date_array(
+                        [
+                            self.cropped_dates[0],
+                            event.last_data_date,
+                            event.last_data_date,
+                            self.cropped_dates[0],
+                        ]
+                    )
+                )
                 traces.append(
                     Scatter(
                         x=rect_x,
@@ -222,7 +492,7 @@ class CountryGraph:
 
             traces.append(
                 Scatter(
-                    x=list(map(adjust_xlabel, trace.xs[: data_until_idx + 1])),
+                    x=adjust_xlabel(trace.xs[: data_until_idx + 1]),
                     y=trace.ys[: data_until_idx + 1],
                     text=trace.xs[: data_until_idx + 1],
                     mode="lines",
@@ -236,7 +506,7 @@ class CountryGraph:
             )
             traces.append(
                 Scatter(
-                    x=list(map(adjust_xlabel, trace.xs[data_until_idx:])),
+                    x=adjust_xlabel(trace.xs[data_until_idx:]),
                     y=trace.ys[data_until_idx:],
                     text=trace.xs[data_until_idx:],
                     mode="lines",
@@ -254,10 +524,7 @@ class CountryGraph:
                 traces.append(
                     Scatter(
                         mode="markers",
-                        x=[
-                            adjust_xlabel(trace.max_value_date),
-                            adjust_xlabel(trace.max_value_date),
-                        ],
+                        x=adjust_xlabel(_to_date_array([trace.max_value_date] * 2)),
                         y=[1.0, trace.max_value],
                         name="Peak",
                         line=dict(color=color),
@@ -270,10 +537,13 @@ class CountryGraph:
                     )
                 )
 
+        if graph_type == GraphType.BayesBands and self.trace_bands is not None:
+            traces.extend(self._create_band_traces(adjust_xlabel))
+
         # Add cumulated active cases trace.
         traces.append(
             Scatter(
-                x=list(map(adjust_xlabel, self.cropped_dates)),
+                x=adjust_xlabel(self.cropped_dates),
                 y=self.cropped_cumulative_active,
                 mode="lines+markers",
                 name="Active cases",
@@ -282,7 +552,6 @@ class CountryGraph:
             )
         )
 
-        sliders = []
         if graph_type == GraphType.Slider and len(self.trace_by_event) > 0:
             sliders.append(self._create_slider(traces, list(self.trace_by_event.keys())))
 
@@ -309,20 +578,39 @@ class CountryGraph:
             sliders=sliders,
         )
 
-        self.figure = Figure(data=traces, layout=layout)
-        return self.update_graph_axis_type(graph_axis_type)
+        figure = Figure(data=traces, layout=layout)
+        self._apply_axes_layout(figure, graph_axis_type)
+        return figure
 
-    def update_graph_axis_type(self, graph_axis_type: GraphAxisType):
+    def get_axes_layout(self, graph_axis_type: GraphAxisType) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the layout of the axes of `graph_axis_type`. Linear and semi-log figures only
+        differ in this layout, so it can be applied to a figure of the other one. The layout is
+        created anew by every call.
+        """
         if graph_axis_type == GraphAxisType.Linear:
-            self.figure.update_xaxes(type="date", title=self.date_title)
-            self.figure.update_yaxes(type="linear", autorange=True)
+            xaxis = dict(type="date", title=self.date_title)
+            yaxis = dict(type="linear", autorange=True)
         elif graph_axis_type == GraphAxisType.SemiLog:
-            self.figure.update_xaxes(type="date", title=self.date_title)
-            self.figure.update_yaxes(type="log", autorange=False, range=self.log_yrange)
+            xaxis = dict(type="date", title=self.date_title)
+            yaxis = dict(type="log", autorange=False, range=list(self.log_yrange))
         elif graph_axis_type == GraphAxisType.LogLog:
-            self.figure.update_xaxes(type="log", title=self.log_title)
-            self.figure.update_yaxes(type="log", autorange=False, range=self.log_yrange)
-        return self.figure
+            xaxis = dict(type="log", title=self.log_title)
+            yaxis = dict(type="log", autorange=False, range=list(self.log_yrange))
+        else:
+            raise ValueError(f"Unknown graph axis type: {graph_axis_type}")
+        return dict(xaxis=xaxis, yaxis=yaxis)
+
+    def update_graph_axis_type(self, figure: Figure, graph_axis_type: GraphAxisType) -> Figure:
+        """Returns a copy of `figure` of this graph with the axes of `graph_axis_type`."""
+        figure = Figure(figure)
+        self._apply_axes_layout(figure, graph_axis_type)
+        return figure
+
+    def _apply_axes_layout(self, figure: Figure, graph_axis_type: GraphAxisType) -> None:
+        axes_layout = self.get_axes_layout(graph_axis_type)
+        figure.update_xaxes(**axes_layout["xaxis"])
+        figure.update_yaxes(**axes_layout["yaxis"])
 
 
 @click.command(help="COVID-19 visualization of active cases")
@@ -336,9 +624,33 @@ class CountryGraph:
     required=True,
     type=click_pathlib.Path(exists=True),
 )
-def show_country_plot(country_data_file: Path, prediction_dir: Path):
+@click.option(
+    "--bands",
+    is_flag=True,
+    default=False,
+    help="Show the bootstrap bands of the latest prediction instead of the slider",
+)
+def show_country_plot(country_data_file: Path, prediction_dir: Path, bands: bool):
     country_report = create_report(country_data_file)
     prediction_db = predictions.load_prediction_db(prediction_dir=prediction_dir)
+    if bands:
+        bootstrap_formulas = []
+        for prediction in prediction_db.select_predictions(
+            country=country_report.short_name, last_data_dates=country_report.dates
+        ):
+            if isinstance(prediction.formula, FittedFormula):
+                bootstrap_formula = prediction.formula.get_bootstrap_formula()
+                if bootstrap_formula is not None:
+                    bootstrap_formulas.append(bootstrap_formula)
+        if len(bootstrap_formulas) == 0:
+            raise click.UsageError("No bootstrapped prediction, see generate_predictions")
+        latest_formula = max(bootstrap_formulas, key=lambda f: f.last_data_date)
+        country_graph = CountryGraph(
+            report=country_report, country_predictions=[], posterior_formula=latest_formula
+        )
+        country_graph.create_country_figure(graph_type=GraphType.BayesBands).show()
+        return
+
     country_predictions = [
         prediction
         for prediction in prediction_db.select_predictions(
@@ -349,4 +661,4 @@ def show_country_plot(country_data_file: Path, prediction_dir: Path):
     ]
 
     country_graph = CountryGraph(report=country_report, country_predictions=country_predictions)
-    country_graph.create_country_figure(graph_type=GraphType.Slider).show()
+    country_graph.create_country_figure(graph_type=GraphType.CompactSlider).show()
@@ -19,13 +19,18 @@ class CountryReport:
     daily_recovered: np.ndarray
     daily_active: np.ndarray
     cumulative_active: np.ndarray
-    population: np.uint64
+    population: int
 
 
-def create_report(country_data_file: Path) -> CountryReport:
-    """Constructs a numpy representation of data read from 'data_dir' a given country."""
+def read_country_data(country_data_file: Path) -> CountryData:
     country_data = CountryData()
     text_format.Parse(country_data_file.read_text(), country_data)
+    return country_data
+
+
+def create_report(country_data_file: Path) -> CountryReport:
+    """Constructs a numpy representation of data read from 'data_dir' a given country."""
+    country_data = read_country_data(country_data_file)
 
     long_name = country_data.name
     short_name = country_data.short_name
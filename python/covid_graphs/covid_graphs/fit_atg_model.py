@@ -1,8 +1,23 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import List
+from itertools import repeat
+from typing import Callable, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
-from scipy.optimize import least_squares
+from scipy.optimize import OptimizeResult, least_squares
+
+# Enough replicates for stable 90% intervals, while still taking only about a second per fit.
+DEFAULT_BOOTSTRAP_REPLICATES = 200
+# Same as the default limit of `least_squares` on residual evaluations for four parameters.
+DEFAULT_MAX_ITERATIONS = 400
+
+# Settings of `fit_atg_models`. Tolerances are the defaults of `least_squares`, the initial
+# damping works best on the country data.
+_FTOL = 1e-8
+_XTOL = 1e-8
+_INITIAL_DAMPING = 1e-2
+_MAX_DAMPING = 1e12
 
 
 @dataclass
@@ -13,28 +28,334 @@ class AtgModelFit:
     t0: float
 
     def predict(self, x: float) -> float:
-        ys = _model(params=[self.a, self.tg, self.exp, self.t0], xs=np.array([x]))
-        return ys[0]
+        return self.predict_many(np.array([x]))[0]
+
+    def predict_many(self, xs: np.ndarray) -> np.ndarray:
+        return _model(params=[self.a, self.tg, self.exp, self.t0], xs=xs)
+
+    def predict_std(self, xs: np.ndarray, covariance: np.ndarray) -> np.ndarray:
+        """
+        Returns the standard deviation of the predictions at `xs`, given the `covariance` of the
+        parameters (a, tg, exp, t0). Uses the delta method, i.e. the linearization of the model.
+        """
+        jacobian = _model_jacobian(params=[self.a, self.tg, self.exp, self.t0], xs=xs)
+        variance = np.einsum("ij,ik,kj->j", jacobian, covariance, jacobian)
+        return np.sqrt(np.maximum(0.0, variance))
+
+
+@dataclass
+class FitDiagnostics:
+    """Diagnostics of the least-squares solver which fitted an atg model."""
+
+    # Status returned by `least_squares`, positive if the fit converged.
+    status: int
+    # Number of evaluations of the residuals.
+    nfev: int
+    # Half of the sum of squared residuals at the optimum.
+    cost: float
+    # Wall time of the fit.
+    fit_seconds: float
+
+    @property
+    def converged(self) -> bool:
+        return self.status > 0
+
+
+@dataclass
+class AtgModelSamples:
+    """Many samples of the atg model, for example from a posterior. One array entry per sample."""
+
+    a: np.ndarray
+    tg: np.ndarray
+    exp: np.ndarray
+    t0: np.ndarray
+
+    @staticmethod
+    def from_fits(fits: List[AtgModelFit]) -> "AtgModelSamples":
+        return AtgModelSamples(
+            a=np.array([fit.a for fit in fits]),
+            tg=np.array([fit.tg for fit in fits]),
+            exp=np.array([fit.exp for fit in fits]),
+            t0=np.array([fit.t0 for fit in fits]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.a)
+
+    def to_fits(self) -> List[AtgModelFit]:
+        return [
+            AtgModelFit(a=a, tg=tg, exp=exp, t0=t0)
+            for a, tg, exp, t0 in zip(self.a, self.tg, self.exp, self.t0)
+        ]
+
+    def predict(self, xs: np.ndarray) -> np.ndarray:
+        """Returns a matrix of shape (samples, len(xs)) with predictions of every sample."""
+        params = [param[:, np.newaxis] for param in [self.a, self.tg, self.exp, self.t0]]
+        return _model(params=params, xs=np.asarray(xs)[np.newaxis, :])
+
+    def get_peak_days(self) -> np.ndarray:
+        """Returns the x-value of the peak of every sample."""
+        return self.exp * self.tg + self.t0
+
+    def get_peak_values(self) -> np.ndarray:
+        """Returns the maximal value of every sample, (a/tg) * exp^exp * e^(-exp)."""
+        return (self.a / self.tg) * self.exp ** self.exp * np.exp(-self.exp)
 
 
 def fit_atg_model(xs: np.ndarray, ys: np.ndarray) -> AtgModelFit:
     """
     Fits atg model through `(xs, ys)` datapoints.
     """
+    a, tg, exp, t0 = _fit_least_squares(xs, ys).x
+    return AtgModelFit(a=a, tg=tg, exp=exp, t0=t0)
+
+
+def fit_atg_model_with_covariance(xs: np.ndarray, ys: np.ndarray) -> Tuple[AtgModelFit, np.ndarray]:
+    """
+    Fits atg model through `(xs, ys)` datapoints. Also returns the 4x4 covariance matrix of the
+    parameters (a, tg, exp, t0), estimated from the Jacobian J at the optimum and the residual
+    variance s^2 as s^2 * (J^T J)^-1.
+    """
+    fit, covariance, _ = fit_atg_model_with_diagnostics(xs, ys)
+    return fit, covariance
+
+
+def fit_atg_model_with_diagnostics(
+    xs: np.ndarray, ys: np.ndarray
+) -> Tuple[AtgModelFit, np.ndarray, FitDiagnostics]:
+    """
+    Like `fit_atg_model_with_covariance`, but also returns diagnostics of the solver.
+    """
+    start = time.perf_counter()
+    result = _fit_least_squares(xs, ys)
+    fit_seconds = time.perf_counter() - start
+    a, tg, exp, t0 = result.x
+    degrees_of_freedom = max(1, len(ys) - len(result.x))
+    residual_variance = np.sum(result.fun ** 2) / degrees_of_freedom
+    covariance = residual_variance * np.linalg.pinv(result.jac.T @ result.jac)
+    diagnostics = FitDiagnostics(
+        status=int(result.status),
+        nfev=int(result.nfev),
+        cost=float(result.cost),
+        fit_seconds=fit_seconds,
+    )
+    return AtgModelFit(a=a, tg=tg, exp=exp, t0=t0), covariance, diagnostics
+
+
+def bootstrap_atg_model(
+    xs: np.ndarray,
+    ys: np.ndarray,
+    fit: AtgModelFit,
+    replicates: int = DEFAULT_BOOTSTRAP_REPLICATES,
+    seed: Optional[int] = None,
+    processes: int = 1,
+) -> AtgModelSamples:
+    """
+    Residual bootstrap of the atg model `fit` through `(xs, ys)` datapoints.
+
+    The residuals of `fit` are resampled with replacement and added back to its predictions,
+    creating `replicates` new datasets (negative values are clipped to zero). Each of them is
+    refitted starting from `fit`, which typically converges in a few iterations. With
+    `processes > 1`, the replicates are refitted on a process pool.
+    """
+    params = [fit.a, fit.tg, fit.exp, fit.t0]
+    predicted = _model(params=params, xs=xs)
+    residuals = np.asarray(ys, dtype=float) - predicted
+    rng = np.random.default_rng(seed)
+    resampled_idx = rng.integers(len(residuals), size=(replicates, len(residuals)))
+    replicate_ys = np.maximum(0.0, predicted[np.newaxis, :] + residuals[resampled_idx])
+
+    if processes > 1:
+        chunks = np.array_split(replicate_ys, processes)
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            fitted_params = np.concatenate(
+                list(executor.map(_fit_replicates, repeat(xs), chunks, repeat(params)))
+            )
+    else:
+        fitted_params = _fit_replicates(xs, replicate_ys, params)
+
+    return AtgModelSamples(
+        a=fitted_params[:, 0],
+        tg=fitted_params[:, 1],
+        exp=fitted_params[:, 2],
+        t0=fitted_params[:, 3],
+    )
+
+
+def fit_atg_models(
+    xs: Sequence[np.ndarray],
+    ys: Sequence[np.ndarray],
+    max_iterations: int = DEFAULT_MAX_ITERATIONS,
+) -> Tuple[AtgModelSamples, np.ndarray, List[FitDiagnostics]]:
+    """
+    Fits atg models through many independent series of datapoints `(xs[i], ys[i])` at once, which
+    is much faster than fitting them one by one. Returns the fits, their covariance matrices as an
+    array of shape (len(xs), 4, 4) computed like in `fit_atg_model_with_covariance`, and solver
+    diagnostics. The wall time of the batch is split evenly among the series in the diagnostics.
+
+    The series can have different lengths, they are padded and masked. All series are fitted by
+    one vectorized Levenberg-Marquardt iteration, solving a 4x4 system per series, which is the
+    block-diagonal structure of the joint problem. Every series has its own damping and stops on
+    its own, its damping is controlled by the gain ratio as in Nielsen (1999). The positive
+    parameters a, tg and exp are optimized in logarithmic scale, t0 is bounded by the first x-value
+    and stays fixed at the bound while the cost would decrease past it. Where `fit_atg_model`
+    converges, the fits agree with it up to the solver tolerance, unless the two solvers end up in
+    different local minima.
+    """
+    start = time.perf_counter()
+    assert len(xs) == len(ys), "Inconsistent number of series to fit."
+    series_count = len(xs)
+    max_length = max(len(series_xs) for series_xs in xs)
+    padded_xs = np.zeros((series_count, max_length))
+    padded_ys = np.zeros((series_count, max_length))
+    mask = np.zeros((series_count, max_length), dtype=bool)
+    for series_idx, (series_xs, series_ys) in enumerate(zip(xs, ys)):
+        assert len(series_xs) == len(series_ys), "Inconsistent number of datapoints to fit."
+        assert np.all(series_ys >= 0), "No support for negative values for `ys`."
+        padded_xs[series_idx, : len(series_xs)] = series_xs
+        padded_xs[series_idx, len(series_xs) :] = series_xs[-1]
+        padded_ys[series_idx, : len(series_ys)] = series_ys
+        mask[series_idx, : len(series_xs)] = True
+
+    # Parameters of every series are (log a, log tg, log exp, t0).
+    t0_lower_bound = padded_xs[:, 0]
+    log_params = np.array([_get_initial_guess(x0) for x0 in t0_lower_bound]).reshape(-1, 4)
+    log_params[:, :3] = np.log(log_params[:, :3])
+
+    def to_params(log_params: np.ndarray) -> List[np.ndarray]:
+        params = [log_params[:, k, np.newaxis] for k in range(4)]
+        return [np.exp(params[0]), np.exp(params[1]), np.exp(params[2]), params[3]]
+
+    def compute_cost(log_params: np.ndarray, idx: np.ndarray) -> np.ndarray:
+        with np.errstate(all="ignore"):
+            residuals = _model(params=to_params(log_params), xs=padded_xs[idx]) - padded_ys[idx]
+            cost = 0.5 * np.sum(np.where(mask[idx], residuals, 0.0) ** 2, axis=1)
+        return np.where(np.isfinite(cost), cost, np.inf)
+
+    all_idx = np.arange(series_count)
+    cost = compute_cost(log_params, all_idx)
+    damping = np.full(series_count, _INITIAL_DAMPING)
+    damping_growth = np.full(series_count, 2.0)
+    status = np.zeros(series_count, dtype=int)
+    nfev = np.ones(series_count, dtype=int)
+    active = np.ones(series_count, dtype=bool)
+    for _ in range(max_iterations):
+        idx = np.flatnonzero(active)
+        if len(idx) == 0:
+            break
+        current = log_params[idx]
+        params = to_params(current)
+        with np.errstate(all="ignore"):
+            residuals = _model(params=params, xs=padded_xs[idx]) - padded_ys[idx]
+        residuals = np.where(mask[idx], residuals, 0.0)
+        # Jacobian by the logarithmic parameters, of shape (series, datapoints, 4).
+        scale = np.array([params[0], params[1], params[2], np.ones_like(params[3])])
+        jacobian = _model_jacobian(params=params, xs=padded_xs[idx]) * scale
+        jacobian = np.where(mask[idx], jacobian, 0.0).transpose(1, 2, 0)
+
+        jtj = np.einsum("ntk,ntl->nkl", jacobian, jacobian)
+        gradient = np.einsum("ntk,nt->nk", jacobian, residuals)
+        # Where t0 is at its bound and the cost would decrease past it, keep t0 fixed.
+        t0_fixed = (current[:, 3] <= t0_lower_bound[idx]) & (gradient[:, 3] > 0)
+        jtj[t0_fixed, 3, :] = 0.0
+        jtj[t0_fixed, :, 3] = 0.0
+        gradient[t0_fixed, 3] = 0.0
+        diagonal = np.maximum(np.diagonal(jtj, axis1=1, axis2=2), 1e-12)
+        lhs = jtj + (damping[idx, np.newaxis] * diagonal)[:, :, np.newaxis] * np.eye(4)
+        candidate = current - np.linalg.solve(lhs, gradient[..., np.newaxis])[..., 0]
+        candidate[:, 3] = np.maximum(candidate[:, 3], t0_lower_bound[idx])
+        candidate_cost = compute_cost(candidate, idx)
+        nfev[idx] += 1
+
+        # Ratio of the actual and the predicted decrease of the cost.
+        step = candidate - current
+        predicted_decrease = -np.einsum("nk,nk->n", gradient, step) - 0.5 * np.einsum(
+            "nk,nkl,nl->n", step, jtj, step
+        )
+        with np.errstate(all="ignore"):
+            gain_ratio = (cost[idx] - candidate_cost) / predicted_decrease
+        improved = (candidate_cost < cost[idx]) & (gain_ratio > 0)
+        ftol_reached = improved & (cost[idx] - candidate_cost <= _FTOL * cost[idx])
+        step_norm = np.linalg.norm(step, axis=1)
+        xtol_reached = improved & (step_norm <= _XTOL * (_XTOL + np.linalg.norm(current, axis=1)))
+        log_params[idx[improved]] = candidate[improved]
+        cost[idx[improved]] = candidate_cost[improved]
+        damping_decrease = np.maximum(1 / 3, 1 - (2 * np.where(improved, gain_ratio, 0) - 1) ** 3)
+        damping[idx] = np.where(
+            improved,
+            np.maximum(damping[idx] * damping_decrease, 1e-12),
+            damping[idx] * damping_growth[idx],
+        )
+        damping_growth[idx] = np.where(improved, 2.0, damping_growth[idx] * 2)
+
+        # Statuses as in `least_squares`: 2 if ftol is reached, 3 if xtol is reached, 0 if the
+        # iterations run out. With damping this large, steps are as short as with a tiny gradient,
+        # which is status 1.
+        done = ftol_reached | xtol_reached | (damping[idx] > _MAX_DAMPING)
+        status[idx[done]] = np.where(ftol_reached[done], 2, np.where(xtol_reached[done], 3, 1))
+        active[idx[done]] = False
+
+    params = to_params(log_params)
+    fits = AtgModelSamples(
+        a=params[0][:, 0], tg=params[1][:, 0], exp=params[2][:, 0], t0=params[3][:, 0]
+    )
+    jacobian = np.where(mask, _model_jacobian(params=params, xs=padded_xs), 0.0).transpose(1, 2, 0)
+    degrees_of_freedom = np.maximum(1, mask.sum(axis=1) - 4)
+    residual_variance = 2 * cost / degrees_of_freedom
+    covariances = residual_variance[:, np.newaxis, np.newaxis] * np.linalg.pinv(
+        np.einsum("ntk,ntl->nkl", jacobian, jacobian)
+    )
+
+    fit_seconds = (time.perf_counter() - start) / max(1, series_count)
+    diagnostics = [
+        FitDiagnostics(
+            status=int(status[series_idx]),
+            nfev=int(nfev[series_idx]),
+            cost=float(cost[series_idx]),
+            fit_seconds=fit_seconds,
+        )
+        for series_idx in range(series_count)
+    ]
+    return fits, covariances, diagnostics
+
+
+def _fit_replicates(xs: np.ndarray, replicate_ys: np.ndarray, x0: Sequence[float]) -> np.ndarray:
+    """Fits every row of `replicate_ys`, returns a matrix of shape (replicates, 4)."""
+    xs = np.asarray(xs, dtype=float)
+    return np.array(
+        [_fit_least_squares(xs, ys, x0=x0, jac=_residuals_jacobian).x for ys in replicate_ys]
+    ).reshape(-1, 4)
+
+
+def _fit_least_squares(
+    xs: np.ndarray,
+    ys: np.ndarray,
+    x0: Optional[Sequence[float]] = None,
+    jac: Union[str, Callable] = "2-point",
+) -> OptimizeResult:
+    """
+    Least-squares fit of the atg model. Starts at `x0` if given, otherwise at a generic initial
+    guess. `jac` is passed to `least_squares`, it can be `_residuals_jacobian`.
+    """
     assert len(xs) == len(ys), "Inconsistent number of datapoints to fit."
     assert np.all(ys >= 0), "No support for negative values for `ys`."
-    a_init = 2000.0
-    tg_init = 7.0
-    exp_init = 6.23
-    t0_init = xs[0]
-    least_squares_result = least_squares(
+    if x0 is None:
+        x0 = _get_initial_guess(xs[0])
+    return least_squares(
         fun=_residuals,
-        x0=[a_init, tg_init, exp_init, t0_init],
+        x0=x0,
+        jac=jac,
         bounds=([0.0, 0.0, 0.0, xs[0]], np.inf),
         args=(xs, ys),
     )
-    a, tg, exp, t0 = least_squares_result.x
-    return AtgModelFit(a=a, tg=tg, exp=exp, t0=t0)
+
+
+def _get_initial_guess(t0_init: float) -> List[float]:
+    """Generic initial guess of the parameters (a, tg, exp, t0)."""
+    a_init = 2000.0
+    tg_init = 7.0
+    exp_init = 6.23
+    return [a_init, tg_init, exp_init, t0_init]
 
 
 def _residuals(params: List[float], xs: np.ndarray, ys: np.ndarray) -> float:
@@ -48,7 +369,12 @@ def _residuals(params: List[float], xs: np.ndarray, ys: np.ndarray) -> float:
     return _model(params=params, xs=xs) - ys
 
 
-def _model(params: List[float], xs: np.ndarray) -> np.ndarray:
+def _residuals_jacobian(params: List[float], xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """Returns the Jacobian of `_residuals`, a matrix of shape (len(xs), 4)."""
+    return _model_jacobian(params=params, xs=xs).T
+
+
+def _model(params: Sequence[Union[float, np.ndarray]], xs: np.ndarray) -> np.ndarray:
     """
     Returns predicted y-values of the model for values `x` in `xs`:
         x' = (x-t0) / tg
@@ -59,3 +385,30 @@ def _model(params: List[float], xs: np.ndarray) -> np.ndarray:
     a, tg, exp, t0 = params
     x_prime = np.maximum(0.0, (xs - t0)) / tg
     return (a / tg) * x_prime ** exp * np.exp(-x_prime)
+
+
+def _model_jacobian(params: Sequence[Union[float, np.ndarray]], xs: np.ndarray) -> np.ndarray:
+    """
+    Returns the partial derivatives of the model by (a, tg, exp, t0) at `xs`, as a matrix of shape
+    (4, len(xs)). With x' and y as in `_model`:
+        dy/da   = y / a
+        dy/dtg  = y * (x' - exp - 1) / tg
+        dy/dexp = y * log(x')
+        dy/dt0  = y * (1 - exp / x') / tg
+    All derivatives are zero where x' <= 0.
+    """
+    a, tg, exp, t0 = params
+    x_prime = np.maximum(0.0, (np.asarray(xs, dtype=float) - t0)) / tg
+    ys = _model(params=params, xs=xs)
+    positive = x_prime > 0
+    # Avoid division by zero and log(0), the derivatives are masked there anyway.
+    safe_x_prime = np.where(positive, x_prime, 1.0)
+    jacobian = np.array(
+        [
+            ys / a,
+            ys * (x_prime - exp - 1) / tg,
+            ys * np.log(safe_x_prime),
+            ys * (1 - exp / safe_x_prime) / tg,
+        ]
+    )
+    return np.where(positive, jacobian, 0.0)
@@ -43,3 +43,105 @@ def test_atg_model_fit_predict():
     expected = 1.2 / 2.3 * ((x - 5.6) / 2.3) ** 3.4 / np.exp((x - 5.6) / 2.3)
     assert fit.predict(x) == pytest.approx(expected)
     assert fit.predict(4.0) == pytest.approx(0.0)
+    assert fit.predict_many(np.array([x, 4.0])) == pytest.approx([expected, 0.0])
+
+
+def test_atg_model_samples_predict():
+    fits = [AtgModelFit(a=1.2, tg=2.3, exp=3.4, t0=5.6), AtgModelFit(a=20, tg=7, exp=2, t0=0.5)]
+    samples = fit_atg_model.AtgModelSamples.from_fits(fits)
+    xs = np.arange(30)
+    ys = samples.predict(xs)
+    assert ys.shape == (2, 30)
+    for fit, fit_ys in zip(fits, ys):
+        assert fit_ys == pytest.approx([fit.predict(x) for x in xs])
+
+
+def test_model_jacobian():
+    params = np.array([2719.0, 7.2, 6.23, 2.5])
+    xs = np.arange(0, 60, dtype=float)
+    jacobian = fit_atg_model._model_jacobian(params, xs)
+    eps = 1e-6
+    for idx in range(len(params)):
+        step = np.zeros(len(params))
+        step[idx] = eps * params[idx]
+        expected = (
+            fit_atg_model._model(params + step, xs) - fit_atg_model._model(params - step, xs)
+        ) / (2 * step[idx])
+        assert jacobian[idx] == pytest.approx(expected, rel=1e-4, abs=1e-6)
+
+
+def test_fit_atg_model_with_covariance():
+    a, tg, exp, t0 = 2719.0, 7.2, 6.23, 2.5
+    xs = np.arange(1, 100)
+    rng = np.random.default_rng(3)
+    ys = fit_atg_model._model(params=[a, tg, exp, t0], xs=xs) + rng.uniform(0, 10, size=len(xs))
+    fit, covariance = fit_atg_model.fit_atg_model_with_covariance(xs=xs, ys=ys)
+    assert covariance.shape == (4, 4)
+    assert np.allclose(covariance, covariance.T)
+    assert np.all(np.diag(covariance) > 0)
+
+    std = fit.predict_std(xs, covariance)
+    assert std.shape == (len(xs),)
+    assert np.all(std >= 0)
+    assert np.all(std[xs <= fit.t0] == 0)
+
+
+def test_bootstrap_atg_model():
+    a, tg, exp, t0 = 2719.0, 7.2, 6.23, 2.5
+    xs = np.arange(1, 100)
+    rng = np.random.default_rng(5)
+    ys = fit_atg_model._model(params=[a, tg, exp, t0], xs=xs) + rng.uniform(0, 10, size=len(xs))
+    fit = fit_atg_model.fit_atg_model(xs=xs, ys=ys)
+
+    samples = fit_atg_model.bootstrap_atg_model(xs=xs, ys=ys, fit=fit, replicates=50, seed=1)
+    assert len(samples) == 50
+    peak_days = samples.get_peak_days()
+    assert np.min(peak_days) < fit.exp * fit.tg + fit.t0 < np.max(peak_days)
+    assert np.median(peak_days) == pytest.approx(exp * tg + t0, abs=1.0)
+    assert np.median(samples.get_peak_values()) == pytest.approx(
+        fit_atg_model._model(params=[a, tg, exp, t0], xs=np.array([exp * tg + t0]))[0], rel=0.05
+    )
+
+    pooled_samples = fit_atg_model.bootstrap_atg_model(
+        xs=xs, ys=ys, fit=fit, replicates=50, seed=1, processes=2
+    )
+    assert np.allclose(pooled_samples.a, samples.a)
+
+
+def test_fit_atg_model_with_diagnostics():
+    a, tg, exp, t0 = 2719.0, 7.2, 6.23, 2.5
+    xs = np.arange(1, 100)
+    ys = fit_atg_model._model(params=[a, tg, exp, t0], xs=xs)
+    fit, _, diagnostics = fit_atg_model.fit_atg_model_with_diagnostics(xs=xs, ys=ys)
+    assert fit.tg == pytest.approx(tg, rel=1e-3)
+    assert diagnostics.converged
+    assert diagnostics.nfev > 0
+    assert diagnostics.cost == pytest.approx(0.0, abs=1e-3)
+    assert diagnostics.fit_seconds > 0
+
+
+def test_fit_atg_models():
+    rng = np.random.default_rng(4)
+    xs, ys = [], []
+    for a, tg, exp, t0, length in [
+        (2719.0, 7.2, 6.23, 2.5, 99),
+        (15000.0, 5.0, 4.0, 10.3, 70),
+        (800.0, 10.0, 3.0, 0.0, 120),
+    ]:
+        series_xs = np.arange(length)
+        series_ys = fit_atg_model._model(params=[a, tg, exp, t0], xs=series_xs)
+        xs.append(series_xs)
+        ys.append(series_ys + rng.uniform(0, 0.01 * series_ys.max(), size=length))
+
+    fits, covariances, diagnostics = fit_atg_model.fit_atg_models(xs, ys)
+    assert len(fits) == 3 and covariances.shape == (3, 4, 4)
+    for series_xs, series_ys, fit, covariance, series_diagnostics in zip(
+        xs, ys, fits.to_fits(), covariances, diagnostics
+    ):
+        expected = fit_atg_model.fit_atg_model_with_diagnostics(series_xs, series_ys)
+        expected_fit, expected_covariance, expected_diagnostics = expected
+        assert series_diagnostics.converged and expected_diagnostics.converged
+        assert series_diagnostics.cost == pytest.approx(expected_diagnostics.cost, rel=1e-6)
+        for param in ["a", "tg", "exp", "t0"]:
+            assert getattr(fit, param) == pytest.approx(getattr(expected_fit, param), rel=1e-4)
+        assert covariance == pytest.approx(expected_covariance, rel=1e-2, abs=1e-8)
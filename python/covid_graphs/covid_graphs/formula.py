@@ -1,20 +1,29 @@
 import datetime
 import math
 from abc import abstractmethod
-from dataclasses import dataclass
-from typing import Callable, List, Optional
+from dataclasses import dataclass, field, replace
+from typing import Callable, Hashable, List, Optional, Sequence, Tuple
 
 import numpy as np
+from scipy.stats import norm
 
 from . import fit_atg_model
 from .country_report import CountryReport
-from .fit_atg_model import AtgModelFit
+from .fit_atg_model import AtgModelFit, AtgModelSamples, FitDiagnostics
 from .pb.atg_prediction_pb2 import AtgParameters
+from .trace_cache import TRACE_CACHE, CachedTrace
+
+
+def get_date_axis(start_date: datetime.date, days: np.ndarray) -> np.ndarray:
+    """Returns the dates `days` after `start_date`, as a datetime64[D] array."""
+    return np.datetime64(start_date, "D") + days
 
 
 @dataclass
 class Trace:
-    xs: List[datetime.date]
+    # Dates as a datetime64[D] array. Both arrays are read-only, since they may be shared with
+    # other traces through the trace cache.
+    xs: np.ndarray
     ys: np.ndarray
     max_value_date: datetime.date
     max_value: float
@@ -26,23 +35,85 @@ class Trace:
 @dataclass
 class TraceGenerator:
     """
-    Trace is created from a function `func(x)`, which has x=0 at `start_date`. It's only defined for
-    x >= 0.
+    Trace is created from a function `func(xs)`, which has x=0 at `start_date`. It's only defined for
+    x >= 0. The function is vectorized, it gets all the days of the trace as an array at once.
+
+    If `cache_key` is given, it must identify `func`, e.g. by the parameters of the formula. The
+    traces are then cached in `trace_cache.TRACE_CACHE`, so that they are only computed once per
+    process and date range.
     """
 
     func: Callable
     start_date: datetime.date
     display_at_least_until: datetime.date
     label: str
+    cache_key: Optional[Hashable] = None
 
     def generate_trace(self, display_until: datetime.date) -> Trace:
         """Generates trace corresponding to the closed interval [self.start_date, end_date]"""
+        if self.cache_key is None:
+            cached_trace = self._create_trace(display_until)
+        else:
+            cached_trace = TRACE_CACHE.get_or_create(
+                (self.cache_key, self.start_date, display_until),
+                lambda: self._create_trace(display_until),
+            )
+        return Trace(
+            cached_trace.xs,
+            cached_trace.ys,
+            cached_trace.max_value_date,
+            cached_trace.max_value,
+            label=self.label,
+        )
+
+    def _create_trace(self, display_until: datetime.date) -> CachedTrace:
         raw_xs = np.arange((display_until - self.start_date).days + 1)
-        ys = np.array([self.func(x) for x in raw_xs])
-        xs = [self.start_date + datetime.timedelta(days=int(x)) for x in raw_xs]
+        xs = get_date_axis(self.start_date, raw_xs)
+        ys = np.asarray(self.func(raw_xs))
+        xs.flags.writeable = False
+        ys.flags.writeable = False
         idx_max = ys.argmax()
-        max_value_date, max_value = xs[idx_max], ys[idx_max]
-        return Trace(xs, ys, max_value_date, max_value, label=self.label)
+        return CachedTrace(
+            xs=xs,
+            ys=ys,
+            max_value_date=self.start_date + datetime.timedelta(days=int(idx_max)),
+            max_value=ys[idx_max],
+        )
+
+
+@dataclass
+class TraceBands:
+    """Median trace of a prediction and an uncertainty interval around it."""
+
+    # Dates as a datetime64[D] array.
+    xs: np.ndarray
+    median: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+    # Probability mass between `lower` and `upper`.
+    interval_mass: float
+    # Kind of the interval, e.g. "credible interval" or "confidence interval".
+    interval_kind: str
+    # Dates of the median peak and the interval of the peak.
+    peak_date: datetime.datetime
+    peak_lower_date: datetime.datetime
+    peak_upper_date: datetime.datetime
+
+    label: str
+
+
+@dataclass
+class PeakSummary:
+    """Median peak date and value of a prediction with uncertainty, and their intervals."""
+
+    # Probability mass between the lower and the upper values.
+    interval_mass: float
+    date_lower: datetime.datetime
+    date_median: datetime.datetime
+    date_upper: datetime.datetime
+    value_lower: float
+    value_median: float
+    value_upper: float
 
 
 class Formula:
@@ -71,10 +142,11 @@ class PolynomialFormula(Formula):
         display_at_least_until = country_report.dates[-1]
 
         return TraceGenerator(
-            func=lambda x: self.a * (x ** self.exponent),
+            func=lambda xs: self.a * (xs ** self.exponent),
             start_date=start_date,
             display_at_least_until=display_at_least_until,
             label=label,
+            cache_key=("polynomial", self.a, self.exponent),
         )
 
     def get_peak(self, country_report: CountryReport) -> Optional[datetime.datetime]:
@@ -105,15 +177,16 @@ class AtgFormula(Formula):
             start_date=start_date,
         )
 
-        def formula(x: float):
-            x /= self.tg
-            return (self.a / self.tg) * x ** self.exponent / np.exp(x)
+        def formula(xs: np.ndarray) -> np.ndarray:
+            xs = xs / self.tg
+            return (self.a / self.tg) * xs ** self.exponent / np.exp(xs)
 
         return TraceGenerator(
             func=formula,
             start_date=start_date,
             display_at_least_until=display_at_least_until,
             label=label,
+            cache_key=("atg", self.tg, self.a, self.exponent),
         )
 
     def get_peak(self, country_report: CountryReport) -> Optional[datetime.datetime]:
@@ -137,11 +210,19 @@ class FittedFormula(Formula):
     The model ('fit') was fitted using data until 'last_data_date'.
     The trace created by this model starts at 'start_date' shifted by 'fit.t0' days ('fit.t0' is
     less than 1).
+
+    If known, 'covariance' is the 4x4 covariance matrix of the parameters (a, tg, exp, t0) of the
+    fit, which gives confidence intervals of the prediction. Similarly, 'bootstrap' holds residual
+    bootstrap replicates of the fit, with 't0' relative to 'start_date', and 'diagnostics' tells
+    how the solver fared.
     """
 
     fit: AtgModelFit
     start_date: datetime.date
     last_data_date: datetime.date
+    covariance: Optional[np.ndarray] = field(default=None, compare=False)
+    bootstrap: Optional[AtgModelSamples] = field(default=None, compare=False)
+    diagnostics: Optional[FitDiagnostics] = field(default=None, compare=False)
 
     def serialize(self):
         atg_parameters = AtgParameters()
@@ -150,6 +231,18 @@ class FittedFormula(Formula):
         atg_parameters.tg = self.fit.tg
         atg_parameters.offset = self.fit.t0
         atg_parameters.a = self.fit.a
+        if self.covariance is not None:
+            atg_parameters.covariance.extend(self.covariance.ravel())
+        if self.bootstrap is not None:
+            atg_parameters.bootstrap.alpha.extend(self.bootstrap.exp)
+            atg_parameters.bootstrap.tg.extend(self.bootstrap.tg)
+            atg_parameters.bootstrap.a.extend(self.bootstrap.a)
+            atg_parameters.bootstrap.offset.extend(self.bootstrap.t0)
+        if self.diagnostics is not None:
+            atg_parameters.diagnostics.status = self.diagnostics.status
+            atg_parameters.diagnostics.nfev = self.diagnostics.nfev
+            atg_parameters.diagnostics.cost = self.diagnostics.cost
+            atg_parameters.diagnostics.fit_seconds = self.diagnostics.fit_seconds
 
         _set_proto_date(atg_parameters.last_data_date, self.last_data_date)
         _set_proto_date(atg_parameters.start_date, self.start_date)
@@ -164,10 +257,11 @@ class FittedFormula(Formula):
         )
         label = _create_atg_label("Daily prediction", tg=self.fit.tg, alpha=self.fit.exp)
         return TraceGenerator(
-            func=self.fit.predict,
+            func=self.fit.predict_many,
             start_date=self.start_date,
             display_at_least_until=display_at_least_until,
             label=label,
+            cache_key=("fitted-atg", self.fit.a, self.fit.tg, self.fit.exp, self.fit.t0),
         )
 
     def get_peak(self, country_report: Optional[CountryReport] = None) -> datetime.datetime:
@@ -175,29 +269,229 @@ class FittedFormula(Formula):
             self.start_date, datetime.datetime.min.time()
         ) + datetime.timedelta(days=self.fit.exp * self.fit.tg + self.fit.t0)
 
+    def get_peak_interval(
+        self, interval_mass: float
+    ) -> Optional[Tuple[datetime.datetime, datetime.datetime]]:
+        """Returns the confidence interval of the peak, or None if the covariance is unknown."""
+        if self.covariance is None:
+            return None
+        return self._get_peak_interval(self.covariance, interval_mass)
+
+    def _get_peak_interval(
+        self, covariance: np.ndarray, interval_mass: float
+    ) -> Tuple[datetime.datetime, datetime.datetime]:
+        # The peak is at exp * tg + t0, differentiate by (a, tg, exp, t0).
+        gradient = np.array([0.0, self.fit.exp, self.fit.tg, 1.0])
+        peak_std = math.sqrt(max(0.0, gradient @ covariance @ gradient))
+        half_width = datetime.timedelta(days=_get_z_score(interval_mass) * peak_std)
+        peak = self.get_peak()
+        return peak - half_width, peak + half_width
+
+    def generate_confidence_bands(
+        self, display_until: datetime.date, interval_mass: float
+    ) -> Optional[TraceBands]:
+        """
+        Generates the trace with its confidence interval for the closed interval
+        [self.start_date, display_until], or None if the covariance is unknown.
+        """
+        if self.covariance is None:
+            return None
+        peak_interval = self._get_peak_interval(self.covariance, interval_mass)
+        raw_xs = np.arange((display_until - self.start_date).days + 1)
+        ys = fit_atg_model._model(
+            params=[self.fit.a, self.fit.tg, self.fit.exp, self.fit.t0], xs=raw_xs
+        )
+        half_width = _get_z_score(interval_mass) * self.fit.predict_std(raw_xs, self.covariance)
+        return TraceBands(
+            xs=get_date_axis(self.start_date, raw_xs),
+            median=ys,
+            lower=np.maximum(0.0, ys - half_width),
+            upper=ys + half_width,
+            interval_mass=interval_mass,
+            interval_kind="confidence interval",
+            peak_date=self.get_peak(),
+            peak_lower_date=peak_interval[0],
+            peak_upper_date=peak_interval[1],
+            label=_create_atg_label("Daily prediction", tg=self.fit.tg, alpha=self.fit.exp),
+        )
+
+    def get_bootstrap_formula(self) -> Optional["PosteriorFormula"]:
+        """Returns the bootstrap replicates as a formula drawn as bands, or None if unknown."""
+        if self.bootstrap is None:
+            return None
+        return PosteriorFormula(
+            samples=self.bootstrap,
+            start_date=self.start_date,
+            last_data_date=self.last_data_date,
+            interval_kind="bootstrap interval",
+            label_prefix="Bootstrap prediction",
+        )
+
 
-def fit_country_data(country_report: CountryReport, last_data_date: datetime.date) -> FittedFormula:
+def _get_z_score(interval_mass: float) -> float:
+    """Returns z such that [-z, z] contains 'interval_mass' of the standard normal distribution."""
+    return float(norm.ppf(0.5 + interval_mass / 2))
+
+
+@dataclass
+class PosteriorFormula:
+    """
+    Many samples of the atg model (typically a posterior), all fitted using data until
+    'last_data_date'. Like in FittedFormula, the traces start at 'start_date' shifted by
+    'samples.t0' days.
+
+    All samples are evaluated at once as a (samples x days) matrix.
+    """
+
+    samples: AtgModelSamples
+    start_date: datetime.date
+    last_data_date: datetime.date
+    interval_kind: str = "credible interval"
+    label_prefix: str = "Bayesian prediction"
+
+    def get_display_at_least_until(self) -> datetime.date:
+        return _get_display_at_least_until(
+            tg=float(np.median(self.samples.tg)),
+            exp=float(np.median(self.samples.exp)),
+            start_date=self.start_date,
+        )
+
+    def get_peak_days(self) -> np.ndarray:
+        """Returns the peak of every sample, in days since 'start_date'."""
+        return self.samples.get_peak_days()
+
+    def summarize_peaks(self, interval_mass: float) -> PeakSummary:
+        tail = (1.0 - interval_mass) / 2
+        quantiles = [tail, 0.5, 1.0 - tail]
+        start_datetime = datetime.datetime.combine(self.start_date, datetime.datetime.min.time())
+        peak_dates = [
+            start_datetime + datetime.timedelta(days=days)
+            for days in np.quantile(self.get_peak_days(), quantiles)
+        ]
+        peak_values = np.quantile(self.samples.get_peak_values(), quantiles)
+        return PeakSummary(
+            interval_mass=interval_mass,
+            date_lower=peak_dates[0],
+            date_median=peak_dates[1],
+            date_upper=peak_dates[2],
+            value_lower=peak_values[0],
+            value_median=peak_values[1],
+            value_upper=peak_values[2],
+        )
+
+    def generate_bands(self, display_until: datetime.date, interval_mass: float) -> TraceBands:
+        """Generates bands corresponding to the closed interval [self.start_date, display_until]"""
+        raw_xs = np.arange((display_until - self.start_date).days + 1)
+        ys = self.samples.predict(raw_xs)
+        tail = (1.0 - interval_mass) / 2
+        lower, median, upper = np.quantile(ys, [tail, 0.5, 1.0 - tail], axis=0)
+        peak_lower, peak, peak_upper = np.quantile(self.get_peak_days(), [tail, 0.5, 1.0 - tail])
+
+        start_datetime = datetime.datetime.combine(self.start_date, datetime.datetime.min.time())
+        label = _create_atg_label(
+            self.label_prefix,
+            tg=float(np.median(self.samples.tg)),
+            alpha=float(np.median(self.samples.exp)),
+        )
+        return TraceBands(
+            xs=get_date_axis(self.start_date, raw_xs),
+            median=median,
+            lower=lower,
+            upper=upper,
+            interval_mass=interval_mass,
+            interval_kind=self.interval_kind,
+            peak_date=start_datetime + datetime.timedelta(days=peak),
+            peak_lower_date=start_datetime + datetime.timedelta(days=peak_lower),
+            peak_upper_date=start_datetime + datetime.timedelta(days=peak_upper),
+            label=label,
+        )
+
+
+def fit_country_data(
+    country_report: CountryReport,
+    last_data_date: datetime.date,
+    bootstrap_replicates: int = 0,
+    processes: int = 1,
+) -> FittedFormula:
     """
     last_data_date: Date until which to consider data. Inclusive.
     country_report: CountryReport containing epidemiological data for the country.
+    bootstrap_replicates: Number of residual bootstrap replicates, none if 0.
+    processes: Number of processes refitting the bootstrap replicates.
     """
-    until_idx = country_report.dates.index(last_data_date)
+    xs, ys = _get_datapoints(country_report, last_data_date)
+    fit, covariance, diagnostics = fit_atg_model.fit_atg_model_with_diagnostics(xs=xs, ys=ys)
+    bootstrap = None
+    if bootstrap_replicates > 0:
+        bootstrap = fit_atg_model.bootstrap_atg_model(
+            xs=xs, ys=ys, fit=fit, replicates=bootstrap_replicates, processes=processes
+        )
+    return _create_fitted_formula(
+        country_report, last_data_date, fit, covariance, diagnostics, bootstrap
+    )
+
+
+def fit_country_data_batch(
+    country_report: CountryReport, last_data_dates: Sequence[datetime.date]
+) -> List[FittedFormula]:
+    """
+    Same as `fit_country_data` without bootstrap for each of `last_data_dates`, but fits all of
+    them at once with `fit_atg_model.fit_atg_models`.
+    """
+    datapoints = [
+        _get_datapoints(country_report, last_data_date) for last_data_date in last_data_dates
+    ]
+    fits, covariances, all_diagnostics = fit_atg_model.fit_atg_models(
+        xs=[xs for xs, _ in datapoints], ys=[ys for _, ys in datapoints]
+    )
+    return [
+        _create_fitted_formula(country_report, last_data_date, fit, covariance, diagnostics)
+        for last_data_date, fit, covariance, diagnostics in zip(
+            last_data_dates, fits.to_fits(), covariances, all_diagnostics
+        )
+    ]
+
 
+def _get_datapoints(
+    country_report: CountryReport, last_data_date: datetime.date
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns datapoints to fit, with x-values counting days since the first date of the report."""
+    until_idx = country_report.dates.index(last_data_date)
     # The choice of date zero is in theory arbitrary.
     date_zero = country_report.dates[0]
-    xs = [(date - date_zero).days for date in country_report.dates[: until_idx + 1]]
-    fit = fit_atg_model.fit_atg_model(
-        xs=xs,
-        ys=country_report.cumulative_active[: until_idx + 1],
-    )
+    xs = np.array([(date - date_zero).days for date in country_report.dates[: until_idx + 1]])
+    ys = country_report.cumulative_active[: until_idx + 1]
+    return xs, ys
+
+
+def _create_fitted_formula(
+    country_report: CountryReport,
+    last_data_date: datetime.date,
+    fit: AtgModelFit,
+    covariance: np.ndarray,
+    diagnostics: FitDiagnostics,
+    bootstrap: Optional[AtgModelSamples] = None,
+) -> FittedFormula:
+    """Creates a formula from a fit of datapoints returned by `_get_datapoints`."""
     whole_day_offset = np.floor(fit.t0)
+    if bootstrap is not None:
+        # Not in place, the caller may still use the replicates.
+        bootstrap = replace(bootstrap, t0=bootstrap.t0 - whole_day_offset)
 
     # Move the fitted model by 'whole_day_offset', so that '0 <= fit.t0 < 1'.
     shifted_fit = AtgModelFit(exp=fit.exp, tg=fit.tg, t0=fit.t0 - whole_day_offset, a=fit.a)
 
     # Counterintuitively, `date` + `timedelta` results in `date`.
-    start_date = date_zero + datetime.timedelta(days=whole_day_offset)
-    return FittedFormula(fit=shifted_fit, start_date=start_date, last_data_date=last_data_date)
+    start_date = country_report.dates[0] + datetime.timedelta(days=whole_day_offset)
+    # The covariance does not change by shifting t0.
+    return FittedFormula(
+        fit=shifted_fit,
+        start_date=start_date,
+        last_data_date=last_data_date,
+        covariance=covariance,
+        bootstrap=bootstrap,
+        diagnostics=diagnostics,
+    )
 
 
 def _date_from_proto(proto_date) -> datetime.date:
@@ -210,7 +504,26 @@ def create_formula_from_proto(atg_parameters) -> FittedFormula:
     )
     start_date = _date_from_proto(atg_parameters.start_date)
     last_data_date = _date_from_proto(atg_parameters.last_data_date)
-    return FittedFormula(fit, start_date, last_data_date)
+    covariance = None
+    if len(atg_parameters.covariance) > 0:
+        covariance = np.array(atg_parameters.covariance).reshape(4, 4)
+    bootstrap = None
+    if atg_parameters.HasField("bootstrap"):
+        bootstrap = AtgModelSamples(
+            a=np.array(atg_parameters.bootstrap.a),
+            tg=np.array(atg_parameters.bootstrap.tg),
+            exp=np.array(atg_parameters.bootstrap.alpha),
+            t0=np.array(atg_parameters.bootstrap.offset),
+        )
+    diagnostics = None
+    if atg_parameters.HasField("diagnostics"):
+        diagnostics = FitDiagnostics(
+            status=atg_parameters.diagnostics.status,
+            nfev=atg_parameters.diagnostics.nfev,
+            cost=atg_parameters.diagnostics.cost,
+            fit_seconds=atg_parameters.diagnostics.fit_seconds,
+        )
+    return FittedFormula(fit, start_date, last_data_date, covariance, bootstrap, diagnostics)
 
 
 def _get_display_at_least_until(tg: float, exp: float, start_date: datetime.date) -> datetime.date:
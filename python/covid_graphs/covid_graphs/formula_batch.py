@@ -0,0 +1,130 @@
+import datetime
+from dataclasses import dataclass
+from typing import Iterable, Sequence, Tuple
+
+import numpy as np
+
+from .fit_atg_model import AtgModelSamples
+from .formula import FittedFormula
+
+_MICROSECONDS_PER_DAY = 24 * 60 * 60 * 10 ** 6
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def _to_datetime64_days(dates: Iterable[datetime.date]) -> np.ndarray:
+    # Much faster than letting numpy convert the date objects.
+    ordinals = np.array([date.toordinal() for date in dates], dtype=np.int64)
+    return (ordinals - _EPOCH_ORDINAL).astype("datetime64[D]")
+
+
+def _to_datetime64(days_since_start: np.ndarray, start_dates: np.ndarray) -> np.ndarray:
+    """Returns `start_dates` shifted by fractional days, with microsecond precision like timedelta."""
+    microseconds = np.round(days_since_start * _MICROSECONDS_PER_DAY).astype("timedelta64[us]")
+    return start_dates.astype("datetime64[us]") + microseconds
+
+
+@dataclass
+class FormulaBatch:
+    """
+    Many fitted formulas as arrays, one entry per formula: the parameters of the fits in `fits`,
+    and `start_dates` and `last_data_dates` as datetime64[D] arrays. As in `FittedFormula`, the
+    t0 of every fit is relative to its start date.
+
+    Computes the peaks, inflection points and display ranges of all formulas at once, which
+    matters when there are thousands of them.
+    """
+
+    fits: AtgModelSamples
+    start_dates: np.ndarray
+    last_data_dates: np.ndarray
+
+    @staticmethod
+    def from_formulas(fitted_formulas: Sequence[FittedFormula]) -> "FormulaBatch":
+        return FormulaBatch(
+            fits=AtgModelSamples(
+                a=np.array([formula.fit.a for formula in fitted_formulas], dtype=float),
+                tg=np.array([formula.fit.tg for formula in fitted_formulas], dtype=float),
+                exp=np.array([formula.fit.exp for formula in fitted_formulas], dtype=float),
+                t0=np.array([formula.fit.t0 for formula in fitted_formulas], dtype=float),
+            ),
+            start_dates=_to_datetime64_days(formula.start_date for formula in fitted_formulas),
+            last_data_dates=_to_datetime64_days(
+                formula.last_data_date for formula in fitted_formulas
+            ),
+        )
+
+    def __len__(self) -> int:
+        return len(self.start_dates)
+
+    def get_peaks(self) -> np.ndarray:
+        """Returns the peak of every formula as datetime64[us], like `FittedFormula.get_peak`."""
+        return _to_datetime64(self.fits.get_peak_days(), self.start_dates)
+
+    def get_inflection_points(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the first and the second inflection point of every formula as datetime64[us]. The
+        curve x^exp * e^(-x) has its inflection points at x = exp -/+ sqrt(exp), the first one is
+        clipped to the start of the curve.
+        """
+        exp, tg, t0 = self.fits.exp, self.fits.tg, self.fits.t0
+        first = tg * np.maximum(0.0, exp - np.sqrt(exp)) + t0
+        second = tg * (exp + np.sqrt(exp)) + t0
+        return _to_datetime64(first, self.start_dates), _to_datetime64(second, self.start_dates)
+
+    def get_display_at_least_until(self) -> np.ndarray:
+        """
+        Returns the date until which every formula should be displayed, as datetime64[D]: the day
+        of the second inflection point, as computed by `FittedFormula.get_trace_generator`.
+        """
+        days = np.ceil(self.fits.tg * (self.fits.exp + np.sqrt(self.fits.exp)))
+        return self.start_dates + days.astype("timedelta64[D]")
+
+    def get_display_range(
+        self,
+        first_report_date: datetime.date,
+        last_report_date: datetime.date,
+        extension_ratio: float,
+    ) -> Tuple[datetime.date, datetime.date]:
+        """
+        Returns the date range of a graph showing all formulas along with a report spanning
+        [`first_report_date`, `last_report_date`], which is extended by `extension_ratio` of the
+        displayed length of the report. Same as the display range of `CountryGraph`.
+        """
+        start_date = first_report_date
+        display_until = last_report_date
+        if len(self) > 0:
+            start_date = min(start_date, self.start_dates.min().item())
+            display_until = self.get_display_at_least_until().max().item()
+        report_length = last_report_date - start_date + datetime.timedelta(days=1)
+        display_until = max(display_until, last_report_date + report_length * extension_ratio)
+        return start_date, display_until
+
+    def select_displayable(
+        self,
+        max_peak_distance: datetime.timedelta,
+        max_peak_variability: datetime.timedelta,
+        now: datetime.datetime,
+    ) -> np.ndarray:
+        """
+        Returns indices of the formulas 'f[0], ..., f[k]' sorted by their last data date, such that:
+        * f[k] is the latest formula whose peak is not too far in the future, i.e. it's earlier
+          than 'max_peak_distance' from 'now'.
+        * f[0] is the earliest formula after which the peaks of 'f[0], ..., f[k]' are within
+          'max_peak_variability'.
+        """
+        # Latest first, formulas with the same last data date keep their order.
+        order = np.argsort(-self.last_data_dates.astype(np.int64), kind="stable")
+        peaks = self.get_peaks()[order]
+
+        latest_possible_peak = np.datetime64(now + max_peak_distance, "us")
+        not_too_far = peaks <= latest_possible_peak
+        if not np.any(not_too_far):
+            return np.array([], dtype=np.int64)
+        skip = int(np.argmax(not_too_far))
+        order, peaks = order[skip:], peaks[skip:]
+
+        # The spread of the peaks only grows as older formulas are added.
+        spread = np.maximum.accumulate(peaks) - np.minimum.accumulate(peaks)
+        within = spread <= np.timedelta64(max_peak_variability, "us")
+        count = len(within) if np.all(within) else int(np.argmin(within))
+        return order[:count][::-1]
@@ -0,0 +1,88 @@
+import datetime
+
+import numpy as np
+
+from .fit_atg_model import AtgModelFit
+from .formula import FittedFormula
+from .formula_batch import FormulaBatch
+
+
+def _create_formulas(count: int, seed: int):
+    rng = np.random.default_rng(seed)
+    start_date = datetime.date(2020, 3, 1)
+    return [
+        FittedFormula(
+            fit=AtgModelFit(
+                a=rng.uniform(100, 10000),
+                tg=rng.uniform(2, 15),
+                exp=rng.uniform(1, 8),
+                t0=rng.uniform(0, 1),
+            ),
+            start_date=start_date + datetime.timedelta(days=int(rng.integers(0, 20))),
+            last_data_date=start_date + datetime.timedelta(days=int(rng.integers(30, 60))),
+        )
+        for _ in range(count)
+    ]
+
+
+def test_peaks_and_display_dates():
+    formulas = _create_formulas(50, seed=1)
+    batch = FormulaBatch.from_formulas(formulas)
+    assert len(batch) == len(formulas)
+    assert batch.get_peaks().tolist() == [formula.get_peak() for formula in formulas]
+
+    display_at_least_until = batch.get_display_at_least_until().tolist()
+    first_inflection_points, second_inflection_points = batch.get_inflection_points()
+    for idx, formula in enumerate(formulas):
+        assert (
+            display_at_least_until[idx] == formula.get_trace_generator(None).display_at_least_until
+        )
+        assert (
+            first_inflection_points[idx] <= batch.get_peaks()[idx] < second_inflection_points[idx]
+        )
+        assert second_inflection_points[idx].item().date() <= display_at_least_until[idx]
+
+    first_report_date, last_report_date = datetime.date(2020, 3, 5), datetime.date(2020, 4, 20)
+    start_date, display_until = batch.get_display_range(first_report_date, last_report_date, 0.2)
+    assert start_date == min(formula.start_date for formula in formulas)
+    assert display_until == max(display_at_least_until)
+
+    empty_batch = FormulaBatch.from_formulas([])
+    assert empty_batch.get_display_range(first_report_date, last_report_date, 0.5) == (
+        first_report_date,
+        datetime.date(2020, 5, 13),
+    )
+
+
+def _select_displayable_one_by_one(formulas, max_peak_distance, max_peak_variability, now):
+    sorted_formulas = sorted(formulas, key=lambda formula: formula.last_data_date, reverse=True)
+    clipped_formulas = [
+        formula for formula in sorted_formulas if formula.get_peak() <= now + max_peak_distance
+    ]
+    if len(clipped_formulas) == 0:
+        return []
+    skip = sorted_formulas.index(clipped_formulas[0])
+    result = []
+    for formula in sorted_formulas[skip:]:
+        peaks = [other.get_peak() for other in result + [formula]]
+        if max(peaks) - min(peaks) > max_peak_variability:
+            break
+        result.append(formula)
+    return result[::-1]
+
+
+def test_select_displayable():
+    formulas = _create_formulas(200, seed=2)
+    batch = FormulaBatch.from_formulas(formulas)
+    for days in [1, 5, 20, 60]:
+        for now in [datetime.datetime(2020, 3, 1), datetime.datetime(2020, 4, 15)]:
+            selected = [
+                formulas[idx]
+                for idx in batch.select_displayable(
+                    datetime.timedelta(days=30), datetime.timedelta(days=days), now
+                )
+            ]
+            expected = _select_displayable_one_by_one(
+                formulas, datetime.timedelta(days=30), datetime.timedelta(days=days), now
+            )
+            assert [id(formula) for formula in selected] == [id(formula) for formula in expected]
@@ -5,7 +5,14 @@ import numpy as np
 import pytest
 
 from .country_report import CountryReport
-from .formula import AtgFormula
+from .fit_atg_model import AtgModelFit, AtgModelSamples, FitDiagnostics
+from .formula import (
+    AtgFormula,
+    FittedFormula,
+    PosteriorFormula,
+    _create_fitted_formula,
+    create_formula_from_proto,
+)
 
 
 def test_two_traces():
@@ -47,3 +54,136 @@ def test_two_traces():
     assert trace2.max_value_date == start_date2 + datetime.timedelta(days=max_t2)
     assert trace2.xs[0] == start_date2
     assert trace_generator2.display_at_least_until == start_date2 + datetime.timedelta(days=length2)
+
+
+def test_posterior_bands():
+    start_date = datetime.date(2020, 5, 1)
+    rng = np.random.default_rng(47)
+    samples = AtgModelSamples(
+        a=rng.uniform(1000, 2000, size=500),
+        tg=rng.uniform(5, 7, size=500),
+        exp=rng.uniform(2, 4, size=500),
+        t0=rng.uniform(0, 1, size=500),
+    )
+    posterior_formula = PosteriorFormula(
+        samples=samples, start_date=start_date, last_data_date=datetime.date(2020, 5, 20)
+    )
+    bands = posterior_formula.generate_bands(datetime.date(2020, 7, 1), interval_mass=0.9)
+
+    assert bands.xs[0] == start_date
+    assert len(bands.xs) == len(bands.median) == (datetime.date(2020, 7, 1) - start_date).days + 1
+    assert np.all(bands.lower <= bands.median) and np.all(bands.median <= bands.upper)
+    day = 20
+    day_ys = np.array([samples.a / samples.tg * ((day - samples.t0) / samples.tg) ** samples.exp])
+    day_ys *= np.exp(-(day - samples.t0) / samples.tg)
+    assert bands.median[day] == pytest.approx(np.median(day_ys))
+
+    peak_days = samples.exp * samples.tg + samples.t0
+    assert bands.peak_lower_date <= bands.peak_date <= bands.peak_upper_date
+    median_peak = datetime.datetime(2020, 5, 1) + datetime.timedelta(days=np.median(peak_days))
+    assert bands.peak_date == median_peak
+
+
+def test_confidence_bands():
+    start_date = datetime.date(2020, 5, 1)
+    fit = AtgModelFit(a=1500, tg=6, exp=3, t0=0.5)
+    covariance = np.diag([100.0, 0.04, 0.01, 0.25])
+    formula = FittedFormula(
+        fit=fit,
+        start_date=start_date,
+        last_data_date=datetime.date(2020, 5, 20),
+        covariance=covariance,
+    )
+    bands = formula.generate_confidence_bands(datetime.date(2020, 7, 1), interval_mass=0.9)
+
+    assert bands is not None
+    assert bands.xs[0] == start_date
+    assert bands.median[20] == pytest.approx(fit.predict(20))
+    assert np.all(bands.lower >= 0)
+    assert np.all(bands.lower <= bands.median) and np.all(bands.median <= bands.upper)
+    assert bands.peak_lower_date < bands.peak_date < bands.peak_upper_date
+    # The standard deviation of exp * tg + t0 is sqrt(36 * 0.01 + 9 * 0.04 + 0.25) = sqrt(0.97).
+    half_width = (bands.peak_upper_date - bands.peak_date).total_seconds() / 86400
+    assert half_width == pytest.approx(1.6449 * math.sqrt(0.97), rel=1e-3)
+
+    restored = create_formula_from_proto(formula.serialize())
+    assert isinstance(restored, FittedFormula)
+    assert np.array_equal(restored.covariance, covariance)
+
+    formula_without_covariance = FittedFormula(fit, start_date, datetime.date(2020, 5, 20))
+    assert formula_without_covariance.generate_confidence_bands(start_date, 0.9) is None
+    assert create_formula_from_proto(formula_without_covariance.serialize()).covariance is None
+
+
+def test_bootstrap_formula():
+    start_date = datetime.date(2020, 5, 1)
+    bootstrap = AtgModelSamples(
+        a=np.array([1400.0, 1500.0, 1600.0]),
+        tg=np.array([6.0, 6.0, 6.0]),
+        exp=np.array([2.5, 3.0, 3.5]),
+        t0=np.array([0.5, 0.5, 0.5]),
+    )
+    formula = FittedFormula(
+        fit=AtgModelFit(a=1500, tg=6, exp=3, t0=0.5),
+        start_date=start_date,
+        last_data_date=datetime.date(2020, 5, 20),
+        bootstrap=bootstrap,
+    )
+    restored = create_formula_from_proto(formula.serialize())
+    assert restored.bootstrap is not None
+    assert np.array_equal(restored.bootstrap.exp, bootstrap.exp)
+    assert np.array_equal(restored.bootstrap.t0, bootstrap.t0)
+
+    bootstrap_formula = restored.get_bootstrap_formula()
+    assert bootstrap_formula is not None
+    summary = bootstrap_formula.summarize_peaks(interval_mass=1.0)
+    assert summary.date_median == datetime.datetime(2020, 5, 19, 12)
+    assert summary.date_lower == datetime.datetime(2020, 5, 16, 12)
+    assert summary.value_median == pytest.approx(1500 / 6 * 3 ** 3 * math.exp(-3))
+    bands = bootstrap_formula.generate_bands(datetime.date(2020, 7, 1), interval_mass=0.9)
+    assert bands.interval_kind == "bootstrap interval"
+
+    assert create_formula_from_proto(restored.serialize()).bootstrap is not None
+
+
+def test_shifting_the_fit_keeps_the_bootstrap():
+    report = CountryReport(
+        short_name="UK",
+        long_name="United Kingdom",
+        dates=[datetime.date(2020, 3, 1) + datetime.timedelta(days=day) for day in range(10)],
+        daily_positive=None,
+        daily_dead=None,
+        daily_recovered=None,
+        daily_active=None,
+        cumulative_active=None,
+        population=None,
+    )
+    bootstrap = AtgModelSamples(
+        a=np.array([1500.0]), tg=np.array([6.0]), exp=np.array([3.0]), t0=np.array([4.5])
+    )
+    formula = _create_fitted_formula(
+        report,
+        datetime.date(2020, 3, 10),
+        AtgModelFit(a=1500, tg=6, exp=3, t0=4.5),
+        np.eye(4),
+        FitDiagnostics(status=2, nfev=17, cost=123.5, fit_seconds=0.01),
+        bootstrap,
+    )
+    assert formula.start_date == datetime.date(2020, 3, 5)
+    assert formula.bootstrap is not None
+    assert np.array_equal(formula.bootstrap.t0, [0.5])
+    assert np.array_equal(bootstrap.t0, [4.5])
+
+
+def test_fit_diagnostics():
+    formula = FittedFormula(
+        fit=AtgModelFit(a=1500, tg=6, exp=3, t0=0.5),
+        start_date=datetime.date(2020, 5, 1),
+        last_data_date=datetime.date(2020, 5, 20),
+        diagnostics=FitDiagnostics(status=2, nfev=17, cost=123.5, fit_seconds=0.01),
+    )
+    restored = create_formula_from_proto(formula.serialize())
+    assert restored.diagnostics == formula.diagnostics
+
+    formula.diagnostics = None
+    assert create_formula_from_proto(formula.serialize()).diagnostics is None
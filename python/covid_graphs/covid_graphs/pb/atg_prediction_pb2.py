@@ -18,7 +18,7 @@ DESCRIPTOR = _descriptor.FileDescriptor(
   package='',
   syntax='proto3',
   serialized_options=None,
-  serialized_pb=b'\n\x14\x61tg_prediction.proto\"\xcd\x01\n\rAtgParameters\x12+\n\x0elast_data_date\x18\x01 \x01(\x0b\x32\x13.AtgParameters.Date\x12\r\n\x05\x61lpha\x18\x05 \x01(\x01\x12\n\n\x02tg\x18\x06 \x01(\x01\x12\t\n\x01\x61\x18\x07 \x01(\x01\x12\'\n\nstart_date\x18\t \x01(\x0b\x32\x13.AtgParameters.Date\x12\x0e\n\x06offset\x18\x08 \x01(\x01\x1a\x30\n\x04\x44\x61te\x12\x0b\n\x03\x64\x61y\x18\x01 \x01(\r\x12\r\n\x05month\x18\x02 \x01(\r\x12\x0c\n\x04year\x18\x03 \x01(\r\"q\n\x14\x43ountryAtgParameters\x12\"\n\nparameters\x18\x01 \x03(\x0b\x32\x0e.AtgParameters\x12\x1a\n\x12short_country_name\x18\x02 \x01(\t\x12\x19\n\x11long_country_name\x18\x03 \x01(\tb\x06proto3'
+  serialized_pb=b'\n\x14\x61tg_prediction.proto\"\xce\x03\n\rAtgParameters\x12+\n\x0elast_data_date\x18\x01 \x01(\x0b\x32\x13.AtgParameters.Date\x12\r\n\x05\x61lpha\x18\x05 \x01(\x01\x12\n\n\x02tg\x18\x06 \x01(\x01\x12\t\n\x01\x61\x18\x07 \x01(\x01\x12\x0e\n\x06offset\x18\x08 \x01(\x01\x12\'\n\nstart_date\x18\t \x01(\x0b\x32\x13.AtgParameters.Date\x12\x12\n\ncovariance\x18\n \x03(\x01\x12)\n\tbootstrap\x18\x0b \x01(\x0b\x32\x16.AtgParameters.Samples\x12/\n\x0b\x64iagnostics\x18\x0c \x01(\x0b\x32\x1a.AtgParameters.Diagnostics\x1a\x30\n\x04\x44\x61te\x12\x0b\n\x03\x64\x61y\x18\x01 \x01(\r\x12\r\n\x05month\x18\x02 \x01(\r\x12\x0c\n\x04year\x18\x03 \x01(\r\x1a?\n\x07Samples\x12\r\n\x05\x61lpha\x18\x01 \x03(\x01\x12\n\n\x02tg\x18\x02 \x03(\x01\x12\t\n\x01\x61\x18\x03 \x03(\x01\x12\x0e\n\x06offset\x18\x04 \x03(\x01\x1aN\n\x0b\x44iagnostics\x12\x0e\n\x06status\x18\x01 \x01(\x05\x12\x0c\n\x04nfev\x18\x02 \x01(\r\x12\x0c\n\x04\x63ost\x18\x03 \x01(\x01\x12\x13\n\x0b\x66it_seconds\x18\x04 \x01(\x01\"q\n\x14\x43ountryAtgParameters\x12\"\n\nparameters\x18\x01 \x03(\x0b\x32\x0e.AtgParameters\x12\x1a\n\x12short_country_name\x18\x02 \x01(\t\x12\x19\n\x11long_country_name\x18\x03 \x01(\tb\x06proto3'
 )
 
 
@@ -64,8 +64,110 @@ _ATGPARAMETERS_DATE = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=182,
-  serialized_end=230,
+  serialized_start=294,
+  serialized_end=342,
+)
+
+_ATGPARAMETERS_SAMPLES = _descriptor.Descriptor(
+  name='Samples',
+  full_name='AtgParameters.Samples',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='alpha', full_name='AtgParameters.Samples.alpha', index=0,
+      number=1, type=1, cpp_type=5, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='tg', full_name='AtgParameters.Samples.tg', index=1,
+      number=2, type=1, cpp_type=5, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='a', full_name='AtgParameters.Samples.a', index=2,
+      number=3, type=1, cpp_type=5, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='offset', full_name='AtgParameters.Samples.offset', index=3,
+      number=4, type=1, cpp_type=5, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto3',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=344,
+  serialized_end=407,
+)
+
+_ATGPARAMETERS_DIAGNOSTICS = _descriptor.Descriptor(
+  name='Diagnostics',
+  full_name='AtgParameters.Diagnostics',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='status', full_name='AtgParameters.Diagnostics.status', index=0,
+      number=1, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='nfev', full_name='AtgParameters.Diagnostics.nfev', index=1,
+      number=2, type=13, cpp_type=3, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='cost', full_name='AtgParameters.Diagnostics.cost', index=2,
+      number=3, type=1, cpp_type=5, label=1,
+      has_default_value=False, default_value=float(0),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='fit_seconds', full_name='AtgParameters.Diagnostics.fit_seconds', index=3,
+      number=4, type=1, cpp_type=5, label=1,
+      has_default_value=False, default_value=float(0),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto3',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=409,
+  serialized_end=487,
 )
 
 _ATGPARAMETERS = _descriptor.Descriptor(
@@ -104,23 +206,44 @@ _ATGPARAMETERS = _descriptor.Descriptor(
       is_extension=False, extension_scope=None,
       serialized_options=None, file=DESCRIPTOR),
     _descriptor.FieldDescriptor(
-      name='start_date', full_name='AtgParameters.start_date', index=4,
+      name='offset', full_name='AtgParameters.offset', index=4,
+      number=8, type=1, cpp_type=5, label=1,
+      has_default_value=False, default_value=float(0),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='start_date', full_name='AtgParameters.start_date', index=5,
       number=9, type=11, cpp_type=10, label=1,
       has_default_value=False, default_value=None,
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       serialized_options=None, file=DESCRIPTOR),
     _descriptor.FieldDescriptor(
-      name='offset', full_name='AtgParameters.offset', index=5,
-      number=8, type=1, cpp_type=5, label=1,
-      has_default_value=False, default_value=float(0),
+      name='covariance', full_name='AtgParameters.covariance', index=6,
+      number=10, type=1, cpp_type=5, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='bootstrap', full_name='AtgParameters.bootstrap', index=7,
+      number=11, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='diagnostics', full_name='AtgParameters.diagnostics', index=8,
+      number=12, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       serialized_options=None, file=DESCRIPTOR),
   ],
   extensions=[
   ],
-  nested_types=[_ATGPARAMETERS_DATE, ],
+  nested_types=[_ATGPARAMETERS_DATE, _ATGPARAMETERS_SAMPLES, _ATGPARAMETERS_DIAGNOSTICS, ],
   enum_types=[
   ],
   serialized_options=None,
@@ -130,7 +253,7 @@ _ATGPARAMETERS = _descriptor.Descriptor(
   oneofs=[
   ],
   serialized_start=25,
-  serialized_end=230,
+  serialized_end=487,
 )
 
 
@@ -174,13 +297,17 @@ _COUNTRYATGPARAMETERS = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=232,
-  serialized_end=345,
+  serialized_start=489,
+  serialized_end=602,
 )
 
 _ATGPARAMETERS_DATE.containing_type = _ATGPARAMETERS
+_ATGPARAMETERS_SAMPLES.containing_type = _ATGPARAMETERS
+_ATGPARAMETERS_DIAGNOSTICS.containing_type = _ATGPARAMETERS
 _ATGPARAMETERS.fields_by_name['last_data_date'].message_type = _ATGPARAMETERS_DATE
 _ATGPARAMETERS.fields_by_name['start_date'].message_type = _ATGPARAMETERS_DATE
+_ATGPARAMETERS.fields_by_name['bootstrap'].message_type = _ATGPARAMETERS_SAMPLES
+_ATGPARAMETERS.fields_by_name['diagnostics'].message_type = _ATGPARAMETERS_DIAGNOSTICS
 _COUNTRYATGPARAMETERS.fields_by_name['parameters'].message_type = _ATGPARAMETERS
 DESCRIPTOR.message_types_by_name['AtgParameters'] = _ATGPARAMETERS
 DESCRIPTOR.message_types_by_name['CountryAtgParameters'] = _COUNTRYATGPARAMETERS
@@ -194,12 +321,28 @@ AtgParameters = _reflection.GeneratedProtocolMessageType('AtgParameters', (_mess
     # @@protoc_insertion_point(class_scope:AtgParameters.Date)
     })
   ,
+
+  'Samples' : _reflection.GeneratedProtocolMessageType('Samples', (_message.Message,), {
+    'DESCRIPTOR' : _ATGPARAMETERS_SAMPLES,
+    '__module__' : 'atg_prediction_pb2'
+    # @@protoc_insertion_point(class_scope:AtgParameters.Samples)
+    })
+  ,
+
+  'Diagnostics' : _reflection.GeneratedProtocolMessageType('Diagnostics', (_message.Message,), {
+    'DESCRIPTOR' : _ATGPARAMETERS_DIAGNOSTICS,
+    '__module__' : 'atg_prediction_pb2'
+    # @@protoc_insertion_point(class_scope:AtgParameters.Diagnostics)
+    })
+  ,
   'DESCRIPTOR' : _ATGPARAMETERS,
   '__module__' : 'atg_prediction_pb2'
   # @@protoc_insertion_point(class_scope:AtgParameters)
   })
 _sym_db.RegisterMessage(AtgParameters)
 _sym_db.RegisterMessage(AtgParameters.Date)
+_sym_db.RegisterMessage(AtgParameters.Samples)
+_sym_db.RegisterMessage(AtgParameters.Diagnostics)
 
 CountryAtgParameters = _reflection.GeneratedProtocolMessageType('CountryAtgParameters', (_message.Message,), {
   'DESCRIPTOR' : _COUNTRYATGPARAMETERS,
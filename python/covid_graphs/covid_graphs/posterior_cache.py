@@ -0,0 +1,99 @@
+import datetime
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+
+def hash_content(*parts: bytes) -> str:
+    """Returns a hex digest identifying the concatenation of `parts`."""
+    digest = hashlib.sha256()
+    for part in parts:
+        # Prefix each part by its length, so that different splits give different hashes.
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class PosteriorCache:
+    """
+    Content-addressed on-disk cache of posterior draws. Each entry is a dictionary of numpy arrays
+    stored as a compressed .npz file named by its key.
+
+    Entries older than `max_age` are evicted, and if the cache is larger than `max_size_bytes`,
+    the oldest entries are evicted until it fits.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_age: Optional[datetime.timedelta] = None,
+        max_size_bytes: Optional[int] = None,
+    ):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npz"
+
+    def _is_expired(self, path: Path, now: float) -> bool:
+        return (
+            self.max_age is not None and now - path.stat().st_mtime > self.max_age.total_seconds()
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        path = self._path(key)
+        try:
+            if self._is_expired(path, time.time()):
+                path.unlink()
+                raise FileNotFoundError
+            with np.load(path) as arrays:
+                result = {name: arrays[name] for name in arrays.files}
+        except (FileNotFoundError, ValueError, OSError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key: str, arrays: Dict[str, np.ndarray]) -> None:
+        # Write into a temporary file first, so that concurrent readers never see partial entries.
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as output:
+            np.savez_compressed(output, **arrays)
+        os.replace(tmp_name, self._path(key))
+        self.evict()
+
+    def evict(self) -> None:
+        now = time.time()
+        entries = []
+        for path in self.cache_dir.glob("*.npz"):
+            try:
+                if self._is_expired(path, now):
+                    path.unlink()
+                else:
+                    stat = path.stat()
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            except FileNotFoundError:
+                # Evicted by another process.
+                continue
+
+        if self.max_size_bytes is None:
+            return
+        entries.sort()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total_size -= size
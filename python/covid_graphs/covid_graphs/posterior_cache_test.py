@@ -0,0 +1,49 @@
+import datetime
+import os
+import time
+
+import numpy as np
+
+from .posterior_cache import PosteriorCache, hash_content
+
+
+def test_hash_content():
+    assert hash_content(b"ab", b"c") == hash_content(b"ab", b"c")
+    assert hash_content(b"ab", b"c") != hash_content(b"a", b"bc")
+
+
+def test_get_and_put(tmp_path):
+    cache = PosteriorCache(tmp_path)
+    assert cache.get("key") is None
+
+    cache.put("key", {"alpha": np.array([[1.0, 2.0]]), "diagnostic_divergences": np.array(3.0)})
+    arrays = cache.get("key")
+    assert arrays is not None
+    assert np.array_equal(arrays["alpha"], [[1.0, 2.0]])
+    assert arrays["diagnostic_divergences"] == 3.0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evict_by_age(tmp_path):
+    cache = PosteriorCache(tmp_path, max_age=datetime.timedelta(hours=1))
+    cache.put("old", {"alpha": np.zeros(3)})
+    two_hours_ago = time.time() - 2 * 3600
+    os.utime(tmp_path / "old.npz", (two_hours_ago, two_hours_ago))
+
+    assert cache.get("old") is None
+    assert not (tmp_path / "old.npz").exists()
+
+
+def test_evict_by_size(tmp_path):
+    cache = PosteriorCache(tmp_path)
+    for idx, key in enumerate(["first", "second", "third"]):
+        cache.put(key, {"alpha": np.random.rand(1000)})
+        # Make sure the modification times differ.
+        os.utime(tmp_path / f"{key}.npz", (idx, idx))
+    entry_size = (tmp_path / "third.npz").stat().st_size
+
+    cache.max_size_bytes = 2 * entry_size + entry_size // 2
+    cache.evict()
+    assert cache.get("first") is None
+    assert cache.get("second") is not None
+    assert cache.get("third") is not None
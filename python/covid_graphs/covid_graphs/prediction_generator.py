@@ -1,12 +1,16 @@
+import dataclasses
 import datetime
+import json
+import statistics
 from pathlib import Path
-from typing import Iterable, List
+from typing import Dict, Iterable, List, Optional
 
 import click
 import click_pathlib
 from google.protobuf import text_format  # type: ignore
 
 from . import formula
+from .country_graph import INTERVAL_MASS
 from .country_report import CountryReport, create_report
 from .formula import FittedFormula
 from .pb.atg_prediction_pb2 import CountryAtgParameters
@@ -16,14 +20,99 @@ PREDICTION_DAYS = 7 * 10
 
 
 def create_fitted_formulas(
-    country_report: CountryReport, last_data_dates: Iterable[datetime.date]
+    country_report: CountryReport,
+    last_data_dates: Iterable[datetime.date],
+    bootstrap_replicates: int = 0,
+    processes: int = 1,
+    reusable_formulas: Optional[Dict[datetime.date, FittedFormula]] = None,
+    batch: bool = False,
 ) -> List[FittedFormula]:
+    """
+    Fits the country data until each of `last_data_dates`. Only the fit using the latest data is
+    bootstrapped with `bootstrap_replicates` replicates, the older ones are only shown on the slider.
+
+    Formulas in `reusable_formulas` (by last data date) are used instead of fitting again, without
+    their bootstrap replicates unless they are the latest. With `batch`, the formulas without
+    bootstrap are fitted at once by `formula.fit_country_data_batch`.
+    """
+    last_data_dates = sorted(last_data_dates)
+    reusable_formulas = reusable_formulas or {}
+    formula_by_date: Dict[datetime.date, FittedFormula] = {}
+    dates_to_fit = []
+    for idx, last_data_date in enumerate(last_data_dates):
+        replicates = bootstrap_replicates if idx == len(last_data_dates) - 1 else 0
+        reusable_formula = reusable_formulas.get(last_data_date)
+        if reusable_formula is not None and (
+            replicates == 0 or reusable_formula.bootstrap is not None
+        ):
+            if replicates == 0:
+                # The formula was the latest one when it was reused last time.
+                reusable_formula = dataclasses.replace(reusable_formula, bootstrap=None)
+            formula_by_date[last_data_date] = reusable_formula
+        elif replicates > 0 or not batch:
+            formula_by_date[last_data_date] = formula.fit_country_data(
+                last_data_date=last_data_date,
+                country_report=country_report,
+                bootstrap_replicates=replicates,
+                processes=processes,
+            )
+        else:
+            dates_to_fit.append(last_data_date)
+
+    if len(dates_to_fit) > 0:
+        fitted_formulas = formula.fit_country_data_batch(country_report, dates_to_fit)
+        formula_by_date.update(zip(dates_to_fit, fitted_formulas))
+    return [formula_by_date[last_data_date] for last_data_date in last_data_dates]
+
+
+def summarize_fit_diagnostics(fitted_formulas: Iterable[FittedFormula]) -> Optional[str]:
+    """Returns a one-line summary of the solver diagnostics of the formulas, None if unknown."""
+    all_diagnostics = [
+        fitted_formula.diagnostics
+        for fitted_formula in fitted_formulas
+        if fitted_formula.diagnostics is not None
+    ]
+    if len(all_diagnostics) == 0:
+        return None
+    not_converged = sum(not diagnostics.converged for diagnostics in all_diagnostics)
+    nfevs = [diagnostics.nfev for diagnostics in all_diagnostics]
+    fit_seconds = [diagnostics.fit_seconds for diagnostics in all_diagnostics]
+    return (
+        f"{len(all_diagnostics)} fits, {not_converged} not converged, "
+        f"{statistics.median(nfevs):.0f} residual evaluations (median, max {max(nfevs)}), "
+        f"{sum(fit_seconds):.2f} s (slowest {max(fit_seconds):.3f} s), "
+        f"final cost of the latest fit {all_diagnostics[-1].cost:.4g}"
+    )
+
+
+def read_fitted_formulas(atg_file: Path) -> List[FittedFormula]:
+    country_atg_parameters = CountryAtgParameters()
+    text_format.Parse(atg_file.read_text(), country_atg_parameters)
     return [
-        formula.fit_country_data(last_data_date=last_data_date, country_report=country_report)
-        for last_data_date in last_data_dates
+        formula.create_formula_from_proto(atg_parameters)
+        for atg_parameters in country_atg_parameters.parameters
     ]
 
 
+def get_reusable_formulas(
+    atg_file: Path, short_name: str, changes_file: Path
+) -> Dict[datetime.date, FittedFormula]:
+    """
+    Returns formulas of `atg_file` fitted only on data which did not change according to
+    `changes_file`, written by `prepare_all_data --incremental`.
+    """
+    changes = json.loads(changes_file.read_text())
+    if short_name not in changes or not atg_file.exists():
+        return {}
+    first_changed_date = changes[short_name]["first_changed_date"]
+    return {
+        fitted_formula.last_data_date: fitted_formula
+        for fitted_formula in read_fitted_formulas(atg_file)
+        if first_changed_date is None
+        or fitted_formula.last_data_date < datetime.date.fromisoformat(first_changed_date)
+    }
+
+
 @click.command(help="COVID-19 country predictions calculation")
 @click.argument(
     "filename",
@@ -35,11 +124,69 @@ def create_fitted_formulas(
     required=True,
     type=click_pathlib.Path(),
 )
-def generate_predictions(filename: Path, output_dir: Path) -> None:
+@click.option(
+    "--bootstrap-replicates",
+    type=int,
+    default=0,
+    help="Residual bootstrap replicates of the latest fit, drawn as bands",
+)
+@click.option(
+    "--processes", type=int, default=1, help="Number of processes refitting bootstrap replicates"
+)
+@click.option(
+    "--batch-fit",
+    is_flag=True,
+    help="Fit all predictions without bootstrap in one batched solve, much faster",
+)
+@click.option(
+    "--changes",
+    type=click_pathlib.Path(exists=True),
+    default=None,
+    help="JSON written by prepare_all_data --incremental, only predictions using changed days "
+    "are fitted again",
+)
+def generate_predictions(
+    filename: Path,
+    output_dir: Path,
+    bootstrap_replicates: int,
+    processes: int,
+    batch_fit: bool,
+    changes: Optional[Path],
+) -> None:
     output_dir.mkdir(parents=True, exist_ok=True)
     country_report = create_report(filename)
     last_data_dates = country_report.dates[-PREDICTION_DAYS:]
-    fitted_formulas = create_fitted_formulas(country_report, last_data_dates)
+    reusable_formulas: Dict[datetime.date, FittedFormula] = {}
+    if changes is not None:
+        reusable_formulas = get_reusable_formulas(
+            output_dir / f"{country_report.short_name}.atg", country_report.short_name, changes
+        )
+    fitted_formulas = create_fitted_formulas(
+        country_report,
+        last_data_dates,
+        bootstrap_replicates,
+        processes,
+        reusable_formulas,
+        batch=batch_fit,
+    )
+    # Reused formulas were fitted by an earlier run, only the new fits are summarized.
+    diagnostics_summary = summarize_fit_diagnostics(
+        fitted_formula
+        for fitted_formula in fitted_formulas
+        if fitted_formula.last_data_date not in reusable_formulas
+    )
+    if diagnostics_summary is not None:
+        print(f"{country_report.short_name}: {diagnostics_summary}")
+    bootstrap_formula = fitted_formulas[-1].get_bootstrap_formula()
+    if bootstrap_formula is not None:
+        summary = bootstrap_formula.summarize_peaks(INTERVAL_MASS)
+        print(
+            f"{country_report.short_name}: peak on {summary.date_median:%Y-%m-%d} "
+            f"({summary.date_lower:%Y-%m-%d} to {summary.date_upper:%Y-%m-%d}), "
+            f"{summary.value_median:.0f} active cases "
+            f"({summary.value_lower:.0f} to {summary.value_upper:.0f}), "
+            f"{summary.interval_mass:.0%} bootstrap interval"
+        )
 
     short_country_name = country_report.short_name
     country_atg_parameters = CountryAtgParameters()
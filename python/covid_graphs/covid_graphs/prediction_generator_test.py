@@ -0,0 +1,44 @@
+import datetime
+
+import numpy as np
+
+from .country_report import CountryReport
+from .fit_atg_model import AtgModelSamples
+from .prediction_generator import create_fitted_formulas
+
+
+def _create_report(days: int) -> CountryReport:
+    samples = AtgModelSamples(
+        a=np.array([2000.0]), tg=np.array([7.0]), exp=np.array([6.0]), t0=np.array([0.5])
+    )
+    cumulative_active = np.round(samples.predict(np.arange(days))[0])
+    daily_active = np.diff(cumulative_active, prepend=0.0)
+    start_date = datetime.date(2020, 3, 1)
+    return CountryReport(
+        short_name="Slovakia",
+        long_name="Slovakia",
+        dates=[start_date + datetime.timedelta(days=day) for day in range(days)],
+        daily_positive=daily_active,
+        daily_dead=np.zeros(days),
+        daily_recovered=np.zeros(days),
+        daily_active=daily_active,
+        cumulative_active=cumulative_active,
+        population=5_450_000,
+    )
+
+
+def test_only_the_latest_reused_formula_is_bootstrapped():
+    report = _create_report(days=50)
+    first_dates = report.dates[-4:-1]
+    first_formulas = create_fitted_formulas(report, first_dates, bootstrap_replicates=5)
+    assert [formula.bootstrap is not None for formula in first_formulas] == [False, False, True]
+
+    # A day later, the previously latest formula is reused, but only the new one is bootstrapped.
+    formulas = create_fitted_formulas(
+        report,
+        report.dates[-4:],
+        bootstrap_replicates=5,
+        reusable_formulas={formula.last_data_date: formula for formula in first_formulas},
+    )
+    assert [formula.bootstrap is not None for formula in formulas] == [False, False, False, True]
+    assert formulas[2].fit == first_formulas[2].fit
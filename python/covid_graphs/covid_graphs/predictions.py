@@ -2,12 +2,14 @@ import datetime
 import logging
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List
+from typing import Dict, Iterable, List, Optional
 
 from google.protobuf import text_format  # type: ignore
 
 from . import formula
+from .fit_atg_model import FitDiagnostics
 from .formula import AtgFormula, FittedFormula, Formula
+from .formula_batch import FormulaBatch
 from .pb.atg_prediction_pb2 import CountryAtgParameters
 
 # Ten weeks
@@ -192,20 +194,30 @@ _prediction_database = [
 
 # TODO(miskosz): Really really add tests in another PR.
 class PredictionDb:
-    """Interface to access prediction data."""
+    """
+    Interface to access prediction data.
+
+    The database is read-only once constructed and every method returns a new list or dictionary,
+    so it can be shared by threads and callers may modify what they get.
+    """
 
-    def __init__(self, country_predictions: List[CountryPrediction]) -> None:
+    def __init__(
+        self,
+        country_predictions: List[CountryPrediction],
+        fit_diagnostics: Optional[Dict[str, Dict[datetime.date, FitDiagnostics]]] = None,
+    ) -> None:
         self._prediction_database = country_predictions
+        self._fit_diagnostics = fit_diagnostics or {}
         self._prediction_events = list(set(p.prediction_event for p in self._prediction_database))
         self._countries = list(set(p.country for p in self._prediction_database))
 
     def get_prediction_events(self) -> List[PredictionEvent]:
         """Returns an unordered list of all prediction events."""
-        return self._prediction_events
+        return list(self._prediction_events)
 
     def get_countries(self) -> List[str]:
         """Returns an unordered list of all countries."""
-        return self._countries
+        return list(self._countries)
 
     def predictions_for_event(self, prediction_event: PredictionEvent) -> List[CountryPrediction]:
         return [p for p in self._prediction_database if p.prediction_event == prediction_event]
@@ -213,6 +225,13 @@ class PredictionDb:
     def predictions_for_country(self, country: str) -> List[CountryPrediction]:
         return [p for p in self._prediction_database if p.country == country]
 
+    def get_fit_diagnostics(self, country: str) -> Dict[datetime.date, FitDiagnostics]:
+        """
+        Returns solver diagnostics of all fits of the country by their last data date, including
+        fits which are not displayed. Fits without diagnostics are omitted.
+        """
+        return dict(self._fit_diagnostics.get(country, {}))
+
     def select_predictions(
         self, country: str, last_data_dates: List[datetime.date]
     ) -> List[CountryPrediction]:
@@ -229,6 +248,7 @@ class PredictionDb:
 
 def load_prediction_db(prediction_dir: Path) -> PredictionDb:
     country_predictions = _prediction_database[:]
+    fit_diagnostics = {}
 
     # TODO: Load all predictions from prediction dir. Make the folder existence mandatory.
     if not prediction_dir.is_dir():
@@ -242,17 +262,31 @@ def load_prediction_db(prediction_dir: Path) -> PredictionDb:
             formula.create_formula_from_proto(atg_parameters)
             for atg_parameters in country_atg_parameters.parameters
         ]
+        short_name = country_atg_parameters.short_country_name
+        fit_diagnostics[short_name] = {
+            fitted_formula.last_data_date: fitted_formula.diagnostics
+            for fitted_formula in fitted_formulas
+            if fitted_formula.diagnostics is not None
+        }
+        not_converged = [
+            diagnostics
+            for diagnostics in fit_diagnostics[short_name].values()
+            if not diagnostics.converged
+        ]
+        if len(not_converged) > 0:
+            logging.warning(
+                f"{len(not_converged)} of {len(fitted_formulas)} fits of {short_name} did not converge."
+            )
+
         # TODO(miskosz): The decision on which predictions to display should not be a reponsibility
         # of `predictions` module. All data should be served.
         displayable_formulas = _calculate_displayable_predictions(
             fitted_formulas, MAX_PEAK_DISTANCE, MAX_PEAK_VARIABILITY, datetime.datetime.now()
         )
-        fitted_predictions = _create_predictions_from_formulas(
-            displayable_formulas, country_atg_parameters.short_country_name
-        )
+        fitted_predictions = _create_predictions_from_formulas(displayable_formulas, short_name)
         country_predictions.extend(fitted_predictions)
 
-    return PredictionDb(country_predictions=country_predictions)
+    return PredictionDb(country_predictions=country_predictions, fit_diagnostics=fit_diagnostics)
 
 
 def _calculate_displayable_predictions(
@@ -268,33 +302,11 @@ def _calculate_displayable_predictions(
     * f[0] is the earliest prediction after which the predicted peaks of 'f[0], ..., f[k]' are
       within 'max_peak_variability'.
     """
-
-    # Note that the formulas are sorted in reverse order, so the latest is the first.
-    sorted_formulas = list(
-        sorted(fitted_formulas, key=lambda formula: formula.last_data_date, reverse=True)
+    fitted_formulas = list(fitted_formulas)
+    displayable_idx = FormulaBatch.from_formulas(fitted_formulas).select_displayable(
+        max_peak_distance, max_peak_variability, now
     )
-
-    skip = 0
-    latest_possible_peak = now + max_peak_distance
-    while skip < len(sorted_formulas) and sorted_formulas[skip].get_peak() > latest_possible_peak:
-        skip += 1
-
-    clipped_formulas = sorted_formulas[skip:]
-    if len(clipped_formulas) == 0:
-        return []
-
-    result = [clipped_formulas[0]]
-    min_peak, max_peak = clipped_formulas[0].get_peak(), clipped_formulas[0].get_peak()
-    for fitted_formula in clipped_formulas[1:]:
-        peak = fitted_formula.get_peak()
-        min_peak = min(min_peak, peak)
-        max_peak = max(max_peak, peak)
-        if max_peak - min_peak <= max_peak_variability:
-            result.append(fitted_formula)
-        else:
-            break
-    result.reverse()
-    return result
+    return [fitted_formulas[idx] for idx in displayable_idx]
 
 
 def _create_predictions_from_formulas(
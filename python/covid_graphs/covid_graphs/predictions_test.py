@@ -58,3 +58,18 @@ def test_displayable_formulas():
     assert displayable_formulas[1].last_data_date == base_last_data_date + datetime.timedelta(
         days=2
     )
+
+
+def test_prediction_db_returns_copies():
+    formula = FittedFormula(
+        fit=AtgModelFit(a=17, exp=2, tg=10, t0=0.4),
+        start_date=datetime.date(2020, 5, 1),
+        last_data_date=datetime.date(2020, 5, 11),
+    )
+    prediction_db = predictions.PredictionDb(
+        [predictions.CountryPrediction(predictions.BK_20200329, "Slovakia", formula)]
+    )
+    prediction_db.get_countries().append("Czechia")
+    prediction_db.get_prediction_events().clear()
+    assert prediction_db.get_countries() == ["Slovakia"]
+    assert prediction_db.get_prediction_events() == [predictions.BK_20200329]
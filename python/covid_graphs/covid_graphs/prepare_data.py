@@ -1,14 +1,228 @@
 import datetime
 import json
+import os
+import tempfile
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import click
 import click_pathlib
+import numpy as np
 import pandas as pd
 from google.protobuf import text_format  # type: ignore
 
+from .country_report import read_country_data
 from .pb.country_data_pb2 import CountryData, DailyStats
 
+JHU_SOURCE = (
+    "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/"
+    "csse_covid_19_data/csse_covid_19_time_series"
+)
+JHU_TABLE_TYPES = ["deaths", "recovered", "confirmed"]
+# JHU uses country names that we want to improve.
+_JHU_NAME_MAP = {"United States": "US", "South Korea": "Korea, South"}
+# The first four columns of the JHU tables are Province/State, Country/Region, Lat and Long.
+_JHU_DATE_COLUMNS_START = 4
+
+
+def read_population(data_dir: Path) -> Dict[str, int]:
+    with (data_dir / "country-populations.json").open() as stream:
+        return {data["country"]: data["population"] for data in json.load(stream)}
+
+
+def read_jhu_tables(source: str = JHU_SOURCE) -> Dict[str, pd.DataFrame]:
+    """
+    Reads the JHU global time series of every type in JHU_TABLE_TYPES, each one exactly once.
+    `source` is either the URL of the directory with the CSV files or a local directory, so that
+    the data can be prepared offline.
+
+    Returns daily increases by type, as a table indexed by the JHU country name with one column
+    per date. Provinces of a country are summed up.
+    """
+    tables = {}
+    for typ in JHU_TABLE_TYPES:
+        table = pd.read_csv(f"{source.rstrip('/')}/time_series_covid19_{typ}_global.csv")
+        cumulative = table.groupby("Country/Region").sum(numeric_only=True)
+        cumulative = cumulative[table.columns[_JHU_DATE_COLUMNS_START:]]
+        cumulative.columns = pd.to_datetime(cumulative.columns, format="%m/%d/%y").date
+        tables[typ] = compute_daily_increase(cumulative)
+    return tables
+
+
+def compute_daily_increase(cumulative: pd.DataFrame) -> pd.DataFrame:
+    """Calculates the daily increase from cumulative numbers, each row is one time series."""
+    values = cumulative.to_numpy(dtype=np.int64)
+    daily = np.diff(values, axis=1, prepend=0)
+    return pd.DataFrame(daily, index=cumulative.index, columns=cumulative.columns)
+
+
+def create_country_data(
+    tables: Dict[str, pd.DataFrame],
+    country: str,
+    short_name: str,
+    population: int,
+    start: datetime.date,
+    end: datetime.date,
+) -> CountryData:
+    """Creates CountryData of `country` from tables returned by `read_jhu_tables`."""
+    country_name_JHU = _JHU_NAME_MAP.get(country, country)
+    dates = [date for date in tables["deaths"].columns if start <= date <= end]
+    rows = {typ: tables[typ].loc[country_name_JHU, dates] for typ in JHU_TABLE_TYPES}
+
+    country_data = CountryData()
+    country_data.name = country
+    country_data.short_name = short_name
+    country_data.population = population
+    for c, r, d, t in zip(rows["confirmed"], rows["recovered"], rows["deaths"], dates):
+        stats = DailyStats()
+        stats.positive = c
+        stats.recovered = r
+        stats.dead = d
+        date = stats.date
+        date.day, date.month, date.year = t.day, t.month, t.year
+        country_data.stats.append(stats)
+    return country_data
+
+
+def write_country_data(country_data: CountryData, output_dir: Path) -> Path:
+    path = output_dir / f"{country_data.short_name}.data"
+    # Write into a temporary file first, so that concurrent readers never see partial data.
+    fd, tmp_name = tempfile.mkstemp(dir=output_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as output:
+        output.write(text_format.MessageToString(country_data))
+    os.replace(tmp_name, path)
+    return path
+
+
+@dataclass
+class CountryDataUpdate:
+    """
+    Summary of an incremental update of a country's .data file. All days before
+    `first_changed_date` are unchanged, so results computed only from them stay valid.
+    """
+
+    short_name: str
+    # Closed interval of added, revised or removed days, None if no day changed.
+    first_changed_date: Optional[datetime.date]
+    last_changed_date: Optional[datetime.date]
+    appended_days: int
+    revised_days: int
+    # Whether the file was written. It is not touched when nothing changed.
+    written: bool
+
+    def to_json(self) -> Dict[str, Any]:
+        def format_date(date: Optional[datetime.date]) -> Optional[str]:
+            return None if date is None else date.isoformat()
+
+        return {
+            "first_changed_date": format_date(self.first_changed_date),
+            "last_changed_date": format_date(self.last_changed_date),
+            "appended_days": self.appended_days,
+            "revised_days": self.revised_days,
+        }
+
+
+def _get_date(stats: DailyStats) -> datetime.date:
+    return datetime.date(stats.date.year, stats.date.month, stats.date.day)
+
+
+def compare_country_data(old: CountryData, new: CountryData) -> CountryDataUpdate:
+    """Finds the days of `new` added or revised since `old`, or removed from it."""
+    old_stats, new_stats = list(old.stats), list(new.stats)
+    common_length = min(len(old_stats), len(new_stats))
+    if common_length > 0 and _get_date(old_stats[0]) != _get_date(new_stats[0]):
+        # The data starts on another day, nothing can be reused.
+        common_length = 0
+        revised_days = 0
+    else:
+        revised_days = sum(old_stats[i] != new_stats[i] for i in range(common_length))
+
+    first_changed_idx = next(
+        (i for i in range(common_length) if old_stats[i] != new_stats[i]), common_length
+    )
+    # Removed days count as changed too, e.g. if the update ends earlier.
+    longer_stats = new_stats if len(new_stats) >= len(old_stats) else old_stats
+    first_changed_date, last_changed_date = None, None
+    if first_changed_idx < len(longer_stats):
+        first_changed_date = _get_date(longer_stats[first_changed_idx])
+        last_changed_date = _get_date(longer_stats[-1])
+
+    metadata_changed = (old.name, old.short_name, old.population) != (
+        new.name,
+        new.short_name,
+        new.population,
+    )
+    return CountryDataUpdate(
+        short_name=new.short_name,
+        first_changed_date=first_changed_date,
+        last_changed_date=last_changed_date,
+        appended_days=max(0, len(new_stats) - common_length),
+        revised_days=revised_days,
+        written=first_changed_date is not None or metadata_changed,
+    )
+
+
+def update_country_data(country_data: CountryData, output_dir: Path) -> CountryDataUpdate:
+    """
+    Writes `country_data` into its .data file only if it differs from the file's content, and
+    reports which days changed. Since days are serialized in order, the unchanged days stay a
+    byte-identical prefix of the file.
+    """
+    path = output_dir / f"{country_data.short_name}.data"
+    if path.exists():
+        update = compare_country_data(read_country_data(path), country_data)
+    else:
+        update = compare_country_data(CountryData(), country_data)
+        update.written = True
+    if update.written:
+        write_country_data(country_data, output_dir)
+    return update
+
+
+def _parse_country(country: str) -> Tuple[str, str]:
+    """Parses 'Country' or 'Country=ShortName' into the country name and its short name."""
+    name, _, short_name = country.partition("=")
+    return name, short_name or name
+
+
+def prepare_countries(
+    countries: Iterable[Tuple[str, str]],
+    population: Dict[str, int],
+    start: datetime.date,
+    end: datetime.date,
+    output_dir: Path,
+    source: str = JHU_SOURCE,
+) -> List[Path]:
+    """Writes the .data file of every (country, short name) pair, reading the JHU data once."""
+    tables = read_jhu_tables(source)
+    return [
+        write_country_data(
+            create_country_data(tables, country, short_name, population[country], start, end),
+            output_dir,
+        )
+        for country, short_name in countries
+    ]
+
+
+def update_countries(
+    countries: Iterable[Tuple[str, str]],
+    population: Dict[str, int],
+    start: datetime.date,
+    end: datetime.date,
+    output_dir: Path,
+    source: str = JHU_SOURCE,
+) -> List[CountryDataUpdate]:
+    """Like `prepare_countries`, but only writes files whose data changed, see `update_country_data`."""
+    tables = read_jhu_tables(source)
+    return [
+        update_country_data(
+            create_country_data(tables, country, short_name, population[country], start, end),
+            output_dir,
+        )
+        for country, short_name in countries
+    ]
+
 
 @click.command(help="COVID-19 data downloader, writes into current directory")
 @click.argument(
@@ -36,59 +250,113 @@ from .pb.country_data_pb2 import CountryData, DailyStats
     type=click_pathlib.Path(exists=True),
     help="Directory with the population JSON",
 )
+@click.option(
+    "--jhu-source",
+    default=JHU_SOURCE,
+    help="URL or local directory with the JHU time series CSV files",
+)
 def main(
     country: str,
     short_name: str,
     start: datetime.datetime,
     end: datetime.datetime,
     data_dir: Path,
+    jhu_source: str,
 ):
-    with (data_dir / "country-populations.json").open() as stream:
-        population = {}
-        for data in json.load(stream):
-            population[data["country"]] = data["population"]
-
-    def diff(a):
-        "Calculates the daily increase from a cumulative number"
-        a = list(map(int, a))
-        for i in range(len(a) - 1, 0, -1):
-            a[i] -= a[i - 1]
-        return a
-
-    # JHU uses country names that we want to improve.
-    name_map = {"United States": "US", "South Korea": "Korea, South"}
-    country_name_JHU = country if country not in name_map else name_map[country]
-    data = {}
-
-    for typ in ["deaths", "recovered", "confirmed"]:
-        url = (
-            "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/"
-            f"csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_{typ}_global.csv"
-        )
-        table = pd.read_csv(url)
-        row = table.loc[table["Country/Region"] == country_name_JHU].iloc[:, 4:].sum()
-        data[typ] = diff(row.values.tolist())
+    prepare_countries(
+        [(country, short_name)],
+        read_population(data_dir),
+        start.date(),
+        end.date(),
+        output_dir=Path("."),
+        source=jhu_source,
+    )
 
-    start_day = datetime.datetime(2020, 1, 22)
-    length = len(data["deaths"])
-    dates = [(start_day + datetime.timedelta(days=i)).date() for i in range(length)]
 
-    points = []
-    country_data = CountryData()
-    country_data.name = country
-    country_data.short_name = short_name
-    country_data.population = population[country]
-    for c, r, d, t in zip(data["confirmed"], data["recovered"], data["deaths"], dates):
-        if t < start.date() or t > end.date():
-            continue
-        points.append({"positive": c, "recovered": r, "dead": d, "date": t.strftime("%Y-%m-%d")})
-        stats = DailyStats()
-        stats.positive = c
-        stats.recovered = r
-        stats.dead = d
-        date = stats.date
-        date.day, date.month, date.year = t.day, t.month, t.year
-        country_data.stats.append(stats)
+@click.command(
+    help="COVID-19 data downloader for many countries at once. COUNTRIES are country names, "
+    "optionally with a short name, e.g. 'United States=USA'."
+)
+@click.argument(
+    "countries",
+    nargs=-1,
+    required=True,
+    type=str,
+)
+@click.option("--start", type=click.DateTime(formats=["%Y-%m-%d"]), default="2020-01-22")
+@click.option(
+    "--end", type=click.DateTime(formats=["%Y-%m-%d"]), default=str(datetime.date.today())
+)
+@click.option(
+    "-d",
+    "--data-dir",
+    required=False,
+    default=Path("."),
+    type=click_pathlib.Path(exists=True),
+    help="Directory with the population JSON",
+)
+@click.option(
+    "-o",
+    "--output-dir",
+    default=Path("."),
+    type=click_pathlib.Path(),
+    help="Directory to write the .data files into",
+)
+@click.option(
+    "--jhu-source",
+    default=JHU_SOURCE,
+    help="URL or local directory with the JHU time series CSV files",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="Only write files whose data changed and report the changed days",
+)
+@click.option(
+    "--changes-output",
+    type=click_pathlib.Path(),
+    default=None,
+    help="With --incremental, write the changed date range of every country into this JSON file",
+)
+def prepare_all_data(
+    countries: Tuple[str, ...],
+    start: datetime.datetime,
+    end: datetime.datetime,
+    data_dir: Path,
+    output_dir: Path,
+    jhu_source: str,
+    incremental: bool,
+    changes_output: Optional[Path],
+):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if not incremental:
+        paths = prepare_countries(
+            map(_parse_country, countries),
+            read_population(data_dir),
+            start.date(),
+            end.date(),
+            output_dir=output_dir,
+            source=jhu_source,
+        )
+        print(f"Wrote {len(paths)} country data files into {output_dir}")
+        return
 
-    with open(f"{short_name}.data", "w") as output:
-        output.write(text_format.MessageToString(country_data))
+    updates = update_countries(
+        map(_parse_country, countries),
+        read_population(data_dir),
+        start.date(),
+        end.date(),
+        output_dir=output_dir,
+        source=jhu_source,
+    )
+    for update in updates:
+        if update.first_changed_date is not None:
+            print(
+                f"{update.short_name}: {update.first_changed_date} to {update.last_changed_date} "
+                f"changed, {update.appended_days} days appended, {update.revised_days} revised"
+            )
+    print(f"Updated {sum(update.written for update in updates)} of {len(updates)} countries")
+    if changes_output is not None:
+        changes = {update.short_name: update.to_json() for update in updates}
+        changes_output.write_text(json.dumps(changes, indent=2))
@@ -0,0 +1,98 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from . import prepare_data
+from .country_report import create_report
+
+_HEADER = "Province/State,Country/Region,Lat,Long,1/22/20,1/23/20,1/24/20,1/25/20\n"
+
+
+def _write_jhu_tables(directory):
+    rows_by_type = {
+        "confirmed": [
+            ",Slovakia,0,0,1,3,3,7",
+            'A,"Korea, South",0,0,0,1,1,1',
+            'B,"Korea, South",0,0,2,2,4,9',
+        ],
+        "recovered": [
+            ",Slovakia,0,0,0,0,1,1",
+            'A,"Korea, South",0,0,0,0,0,0',
+            'B,"Korea, South",0,0,0,1,1,1',
+        ],
+        "deaths": [
+            ",Slovakia,0,0,0,0,0,1",
+            'A,"Korea, South",0,0,0,0,0,0',
+            'B,"Korea, South",0,0,0,0,1,1',
+        ],
+    }
+    for typ, rows in rows_by_type.items():
+        path = directory / f"time_series_covid19_{typ}_global.csv"
+        path.write_text(_HEADER + "\n".join(rows) + "\n")
+
+
+def test_compute_daily_increase():
+    cumulative = pd.DataFrame([[1, 3, 3, 7], [0, 2, 5, 5]])
+    daily = prepare_data.compute_daily_increase(cumulative)
+    assert np.array_equal(daily.to_numpy(), [[1, 2, 0, 4], [0, 2, 3, 0]])
+
+
+def test_prepare_countries(tmp_path):
+    _write_jhu_tables(tmp_path)
+    paths = prepare_data.prepare_countries(
+        [("Slovakia", "Slovakia"), ("South Korea", "Korea")],
+        population={"Slovakia": 5450000, "South Korea": 51640000},
+        start=datetime.date(2020, 1, 23),
+        end=datetime.date(2020, 1, 25),
+        output_dir=tmp_path,
+        source=str(tmp_path),
+    )
+    assert [path.name for path in paths] == ["Slovakia.data", "Korea.data"]
+
+    report = create_report(tmp_path / "Korea.data")
+    assert report.long_name == "South Korea"
+    assert report.population == 51640000
+    assert report.dates[0] == datetime.date(2020, 1, 23)
+    assert len(report.dates) == 3
+    # Provinces are summed up.
+    assert list(report.daily_positive) == [1, 2, 5]
+    assert list(report.daily_recovered) == [1, 0, 0]
+    assert list(report.daily_dead) == [0, 1, 0]
+
+
+def test_update_countries(tmp_path):
+    _write_jhu_tables(tmp_path)
+    population = {"Slovakia": 5450000, "South Korea": 51640000}
+    countries = [("Slovakia", "Slovakia"), ("South Korea", "Korea")]
+    start, end = datetime.date(2020, 1, 22), datetime.date(2020, 1, 24)
+    updates = prepare_data.update_countries(
+        countries, population, start, end, tmp_path, str(tmp_path)
+    )
+    assert [update.written for update in updates] == [True, True]
+    assert updates[0].first_changed_date == start
+    assert updates[0].appended_days == 3
+
+    # Nothing changed, the files are not written.
+    updates = prepare_data.update_countries(
+        countries, population, start, end, tmp_path, str(tmp_path)
+    )
+    assert [update.written for update in updates] == [False, False]
+    assert updates[0].first_changed_date is None
+
+    # Revise Slovakia on 2020-01-24 and add a day.
+    confirmed = tmp_path / "time_series_covid19_confirmed_global.csv"
+    confirmed.write_text(
+        confirmed.read_text().replace(",Slovakia,0,0,1,3,3,7", ",Slovakia,0,0,1,3,4,7")
+    )
+    end = datetime.date(2020, 1, 25)
+    updates = prepare_data.update_countries(
+        countries, population, start, end, tmp_path, str(tmp_path)
+    )
+    slovakia, korea = updates
+    assert slovakia.first_changed_date == datetime.date(2020, 1, 24)
+    assert slovakia.last_changed_date == end
+    assert (slovakia.appended_days, slovakia.revised_days) == (1, 1)
+    assert korea.first_changed_date == end
+    assert (korea.appended_days, korea.revised_days) == (1, 0)
+    assert list(create_report(tmp_path / "Slovakia.data").daily_positive) == [1, 2, 1, 3]
@@ -31,8 +31,8 @@ class SimulationReport:
     growth_type: GrowthType
 
 
-def create_simulation_reports(simulation_pb2_file: Path) -> List[SimulationReport]:
-    """Parses a proto file and creates a list of SimulationReport out of it"""
+def read_simulation_results(simulation_pb2_file: Path) -> SimulationResults:
+    """Parses a proto file with simulation results"""
     if not simulation_pb2_file.is_file():
         raise FileNotFoundError
     simulation_results = SimulationResults()
@@ -40,6 +40,12 @@ def create_simulation_reports(simulation_pb2_file: Path) -> List[SimulationRepor
         simulation_results.ParseFromString(simulation_pb2_file.read_bytes())
     except message.DecodeError:
         raise ValueError(f"Cannot parse {simulation_pb2_file}")
+    return simulation_results
+
+
+def create_simulation_reports(simulation_pb2_file: Path) -> List[SimulationReport]:
+    """Parses a proto file and creates a list of SimulationReport out of it"""
+    simulation_results = read_simulation_results(simulation_pb2_file)
 
     reports = []
     for result in simulation_results.results:
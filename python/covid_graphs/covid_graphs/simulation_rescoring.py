@@ -0,0 +1,123 @@
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import click
+import click_pathlib
+import numpy as np
+import pandas as pd
+from scipy.special import gammaln
+
+from .country_report import create_report
+from .simulation_report import SimulationReport, create_simulation_reports
+
+
+def log_distance(z: np.ndarray, c: np.ndarray) -> np.ndarray:
+    """
+    Vectorized version of `PopulationModel::LogDistance` from the C++ simulation. Logarithm of the
+    distance function between simulated `z` and observed `c` counts, see Rado Harman's COR01.pdf.
+
+    The factorial table of the C++ code is replaced by the log-gamma function, since
+    `log(n!) = gammaln(n + 1)`.
+    """
+    z = np.asarray(z, dtype=float)
+    c = np.asarray(c, dtype=float)
+    total = z + c
+    # Avoid log(0) warnings, the distance is defined to be 0 when z + c == 0.
+    safe_total = np.where(total > 0, total, 1.0)
+    positive = total * np.log(safe_total / 2.0)
+    negative = total + gammaln(z + 1) + gammaln(c + 1)
+    return np.where(total > 0, positive - negative, 0.0)
+
+
+def calculate_run_errors(daily_positive: np.ndarray, observed_positive: np.ndarray) -> np.ndarray:
+    """
+    Calculates the error of each simulation run, the same way as `Simulator::Simulate` does.
+
+    daily_positive: Matrix of simulated daily positive cases with shape (runs, days).
+    observed_positive: Observed daily positive cases, already prefixed with `prefix_length` zeros.
+
+    Only the days covered by both the simulation and the observations are scored.
+    """
+    days = min(daily_positive.shape[1], len(observed_positive))
+    simulated_cumulative = np.cumsum(daily_positive[:, :days], axis=1)
+    observed_cumulative = np.cumsum(observed_positive[:days])
+    return -log_distance(simulated_cumulative, observed_cumulative[np.newaxis, :]).sum(axis=1)
+
+
+def rescore_simulation_reports(
+    simulation_reports: List[SimulationReport], observed_positive: np.ndarray
+) -> pd.DataFrame:
+    """
+    Recomputes the average error of every simulation report against `observed_positive` (daily
+    positive cases). Returns a summary table sorted by the new error.
+
+    Reports whose runs were not serialized (because their error was above the threshold of the
+    simulation) cannot be rescored and get NaN as the new error.
+    """
+    new_errors: List[Optional[float]] = [None] * len(simulation_reports)
+
+    # Runs of all reports with the same prefix length and run length are scored in one batch.
+    batches: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+    for idx, report in enumerate(simulation_reports):
+        if len(report.daily_positive) == 0:
+            continue
+        run_length = len(report.daily_positive[0])
+        batches[(report.prefix_length, run_length)].append(idx)
+
+    for (prefix_length, _), report_indices in batches.items():
+        observed = np.concatenate((np.zeros(prefix_length), observed_positive))
+        run_counts = [len(simulation_reports[idx].daily_positive) for idx in report_indices]
+        daily_positive = np.array(
+            [run for idx in report_indices for run in simulation_reports[idx].daily_positive],
+            dtype=float,
+        )
+        run_errors = calculate_run_errors(daily_positive, observed)
+        offsets = np.concatenate(([0], np.cumsum(run_counts)[:-1]))
+        average_errors = np.add.reduceat(run_errors, offsets) / run_counts
+        for idx, error in zip(report_indices, average_errors):
+            new_errors[idx] = error
+
+    table = pd.DataFrame(
+        {
+            "growth_type": [str(report.growth_type) for report in simulation_reports],
+            "param": [report.param for report in simulation_reports],
+            "prefix_length": [report.prefix_length for report in simulation_reports],
+            "b0": [report.b0 for report in simulation_reports],
+            "runs": [len(report.daily_positive) for report in simulation_reports],
+            "old_error": [report.error for report in simulation_reports],
+            "error": np.array(
+                [np.nan if error is None else error for error in new_errors], dtype=float
+            ),
+        }
+    )
+    return table.sort_values(by="error", na_position="last").reset_index(drop=True)
+
+
+@click.command(help="Rescore stored COVID-19 simulation runs against updated country data")
+@click.argument(
+    "country_data",
+    required=True,
+    type=click_pathlib.Path(exists=True),
+)
+@click.argument(
+    "simulation_protofile",
+    required=True,
+    type=click_pathlib.Path(exists=True),
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click_pathlib.Path(),
+    default=None,
+    help="Write the summary table as CSV into this file instead of printing it",
+)
+def rescore_simulation(country_data: Path, simulation_protofile: Path, output: Path) -> None:
+    country_report = create_report(country_data)
+    simulation_reports = create_simulation_reports(simulation_protofile)
+    table = rescore_simulation_reports(simulation_reports, country_report.daily_positive)
+
+    if output is None:
+        print(table.to_string(index=False))
+    else:
+        table.to_csv(output, index=False)
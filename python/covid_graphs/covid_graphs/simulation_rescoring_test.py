@@ -0,0 +1,62 @@
+import math
+
+import numpy as np
+import pytest
+
+from . import simulation_rescoring
+from .simulation_report import GrowthType, SimulationReport
+
+
+def _log_factorial(n: int) -> float:
+    return sum(math.log(i) for i in range(1, n + 1))
+
+
+def _log_distance_with_factorials(z: int, c: int) -> float:
+    if z + c == 0:
+        return 0.0
+    return (z + c) * math.log((z + c) / 2) - (z + c + _log_factorial(z) + _log_factorial(c))
+
+
+def test_log_distance():
+    zs = np.array([0, 0, 3, 10, 57, 120])
+    cs = np.array([0, 4, 3, 0, 60, 100])
+    expected = [_log_distance_with_factorials(z, c) for z, c in zip(zs, cs)]
+    assert simulation_rescoring.log_distance(zs, cs) == pytest.approx(expected)
+
+
+def test_rescore_simulation_reports():
+    observed_positive = np.array([1, 2, 0, 5])
+
+    def create_report(b0: int, runs):
+        return SimulationReport(
+            daily_positive=runs,
+            daily_infected=[],
+            deltas=[],
+            b0=b0,
+            prefix_length=1,
+            error=100.0,
+            param=1.3,
+            growth_type=GrowthType.Polynomial,
+        )
+
+    perfect_run = [0, 1, 2, 0, 5]
+    bad_run = [3, 0, 7, 1, 0]
+    reports = [
+        create_report(b0=20, runs=[bad_run, bad_run]),
+        create_report(b0=23, runs=[perfect_run, bad_run]),
+        # Runs of reports with high error are not serialized.
+        create_report(b0=26, runs=[]),
+    ]
+    table = simulation_rescoring.rescore_simulation_reports(reports, observed_positive)
+
+    def run_error(run):
+        cumulative_run = np.cumsum(run)
+        cumulative_observed = np.cumsum([0] + list(observed_positive))
+        return -sum(
+            _log_distance_with_factorials(z, c) for z, c in zip(cumulative_run, cumulative_observed)
+        )
+
+    assert list(table.b0) == [23, 20, 26]
+    assert table.error[0] == pytest.approx((run_error(perfect_run) + run_error(bad_run)) / 2)
+    assert table.error[1] == pytest.approx(run_error(bad_run))
+    assert np.isnan(table.error[2])
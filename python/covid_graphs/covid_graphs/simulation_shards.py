@@ -0,0 +1,117 @@
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import click
+import click_pathlib
+
+from .pb.simulation_results_pb2 import SimulationResult, SimulationResults
+from .simulation_report import GrowthType, read_simulation_results
+
+# Identifies a single simulated configuration: (growth parameter name, its value, prefix_length, b0).
+ResultKey = Tuple[str, float, int, int]
+
+
+def _get_result_key(result: SimulationResult) -> ResultKey:
+    param_name = result.WhichOneof("growth_param")
+    return param_name, getattr(result, param_name), result.prefix_length, result.b0
+
+
+def _get_growth_type(result: SimulationResult) -> GrowthType:
+    return GrowthType.Polynomial if result.HasField("alpha") else GrowthType.Exponential
+
+
+def merge_simulation_results(shards: Iterable[SimulationResults]) -> SimulationResults:
+    """
+    Merges several shards of a simulation sweep into one.
+
+    Identical configurations (growth parameter, prefix_length, b0) are deduplicated, keeping the
+    result with more simulation runs. On a tie, the result from the earlier shard is kept. Raises
+    ValueError if the shards mix exponential and polynomial growth.
+    """
+    result_by_key: Dict[ResultKey, SimulationResult] = {}
+    growth_types = set()
+    for shard in shards:
+        for result in shard.results:
+            growth_types.add(_get_growth_type(result))
+            key = _get_result_key(result)
+            if key not in result_by_key or len(result.runs) > len(result_by_key[key].runs):
+                result_by_key[key] = result
+
+    if len(growth_types) > 1:
+        raise ValueError("Cannot merge simulations of exponential and polynomial growth")
+
+    merged = SimulationResults()
+    for key in sorted(result_by_key.keys()):
+        merged.results.append(result_by_key[key])
+    return merged
+
+
+def split_simulation_results(
+    simulation_results: SimulationResults, boundaries: List[float]
+) -> List[SimulationResults]:
+    """
+    Splits a simulation sweep by the value of its growth parameter (alpha or gamma2).
+
+    Sorted `boundaries` b_1 < ... < b_k create k+1 shards, the i-th containing results with
+    b_i <= param < b_{i+1}. Shards may be empty.
+    """
+    sorted_boundaries = sorted(boundaries)
+    shards = [SimulationResults() for _ in range(len(sorted_boundaries) + 1)]
+    for result in simulation_results.results:
+        _, param, _, _ = _get_result_key(result)
+        shard_idx = sum(1 for boundary in sorted_boundaries if boundary <= param)
+        shards[shard_idx].results.append(result)
+    return shards
+
+
+@click.command(help="Merge shards of a COVID-19 simulation sweep into one file")
+@click.argument(
+    "shard_files",
+    nargs=-1,
+    required=True,
+    type=click_pathlib.Path(exists=True),
+)
+@click.option(
+    "-o",
+    "--output",
+    required=True,
+    type=click_pathlib.Path(),
+    help="Output file, typically polynomial.sim or exponential.sim",
+)
+def merge_simulations(shard_files: Tuple[Path, ...], output: Path) -> None:
+    merged = merge_simulation_results(read_simulation_results(path) for path in shard_files)
+    output.write_bytes(merged.SerializeToString())
+    print(f"Wrote {len(merged.results)} results to {output}")
+
+
+@click.command(help="Split a COVID-19 simulation sweep into shards by growth parameter ranges")
+@click.argument(
+    "simulation_protofile",
+    required=True,
+    type=click_pathlib.Path(exists=True),
+)
+@click.argument(
+    "output_dir",
+    required=True,
+    type=click_pathlib.Path(),
+)
+@click.option(
+    "-b",
+    "--boundary",
+    "boundaries",
+    multiple=True,
+    required=True,
+    type=float,
+    help="Value of alpha or gamma2 at which a new shard starts, can be repeated",
+)
+def split_simulation(
+    simulation_protofile: Path, output_dir: Path, boundaries: Tuple[float, ...]
+) -> None:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    shards = split_simulation_results(
+        read_simulation_results(simulation_protofile), list(boundaries)
+    )
+    for idx, shard in enumerate(shards):
+        output = output_dir / f"{simulation_protofile.stem}_{idx}.sim"
+        output.write_bytes(shard.SerializeToString())
+        print(f"Wrote {len(shard.results)} results to {output}")
@@ -0,0 +1,51 @@
+import pytest
+
+from . import simulation_shards
+from .pb.simulation_results_pb2 import SimulationResults
+
+
+def _create_shard(configurations):
+    shard = SimulationResults()
+    for alpha, prefix_length, b0, run_count in configurations:
+        result = shard.results.add()
+        result.alpha = alpha
+        result.prefix_length = prefix_length
+        result.b0 = b0
+        for _ in range(run_count):
+            result.runs.add()
+    return shard
+
+
+def test_merge_simulation_results():
+    shard1 = _create_shard([(1.3, 1, 20, 10), (1.3, 1, 23, 0), (1.32, 2, 20, 10)])
+    shard2 = _create_shard([(1.3, 1, 20, 5), (1.3, 1, 23, 100), (1.28, 1, 20, 10)])
+
+    merged = simulation_shards.merge_simulation_results([shard1, shard2])
+    configurations = [
+        (result.alpha, result.prefix_length, result.b0, len(result.runs))
+        for result in merged.results
+    ]
+    assert configurations == [
+        (1.28, 1, 20, 10),
+        (1.3, 1, 20, 10),
+        (1.3, 1, 23, 100),
+        (1.32, 2, 20, 10),
+    ]
+
+
+def test_merge_mixed_growth_types():
+    exponential = SimulationResults()
+    exponential.results.add().gamma2 = 1.01
+    with pytest.raises(ValueError):
+        simulation_shards.merge_simulation_results([_create_shard([(1.3, 1, 20, 1)]), exponential])
+
+
+def test_split_simulation_results():
+    sweep = _create_shard([(1.28, 1, 20, 1), (1.3, 1, 20, 1), (1.32, 1, 20, 1), (1.36, 1, 20, 1)])
+    shards = simulation_shards.split_simulation_results(sweep, boundaries=[1.3, 1.34])
+    assert [[result.alpha for result in shard.results] for shard in shards] == [
+        [1.28],
+        [1.3, 1.32],
+        [1.36],
+    ]
+    assert simulation_shards.merge_simulation_results(shards) == sweep
@@ -0,0 +1,83 @@
+import datetime
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Hashable, Tuple
+
+import numpy as np
+
+# Enough for the traces of all dashboards and REST payloads of the web server.
+DEFAULT_MAX_BYTES = 256 * 2 ** 20
+
+
+@dataclass(frozen=True)
+class CachedTrace:
+    """Values of a trace without its label. Shared between all users, so they are read-only."""
+
+    xs: np.ndarray
+    ys: np.ndarray
+    max_value_date: datetime.date
+    max_value: float
+
+    def get_size(self) -> int:
+        return self.xs.nbytes + self.ys.nbytes
+
+
+class TraceCache:
+    """
+    Least recently used cache of trace values, keyed by the parameters of the formula and the date
+    range of the trace. Evicts the least recently used traces once they take more than
+    `max_bytes`. Safe to use from multiple threads.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._traces: "OrderedDict[Hashable, CachedTrace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._traces)
+
+    def get_size(self) -> int:
+        """Returns the approximate number of bytes taken by the cached traces."""
+        return self._size
+
+    def get_or_create(self, key: Hashable, create: Callable[[], CachedTrace]) -> CachedTrace:
+        """Returns the trace cached under `key`, or creates and caches it if there is none."""
+        with self._lock:
+            trace = self._traces.get(key)
+            if trace is not None:
+                self._traces.move_to_end(key)
+                self.hits += 1
+                return trace
+            self.misses += 1
+
+        # Created outside of the lock, at worst a trace is created twice by concurrent requests.
+        trace = create()
+        trace.xs.flags.writeable = False
+        trace.ys.flags.writeable = False
+        with self._lock:
+            if key in self._traces:
+                return self._traces[key]
+            self._traces[key] = trace
+            self._size += trace.get_size()
+            while self._size > self.max_bytes and len(self._traces) > 0:
+                _, evicted = self._traces.popitem(last=False)
+                self._size -= evicted.get_size()
+        return trace
+
+    def get_stats(self) -> Tuple[int, int]:
+        """Returns the number of hits and misses."""
+        return self.hits, self.misses
+
+    def clear(self) -> None:
+        with self._lock:
+            self._traces.clear()
+            self._size = 0
+
+
+# Traces of this process, shared by all graphs, dashboards and REST payloads.
+TRACE_CACHE = TraceCache(DEFAULT_MAX_BYTES)
@@ -0,0 +1,63 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from .fit_atg_model import AtgModelFit
+from .formula import TraceGenerator, get_date_axis
+from .trace_cache import CachedTrace, TraceCache
+
+
+def _create_trace(length: int) -> CachedTrace:
+    start_date = datetime.date(2020, 3, 1)
+    xs = get_date_axis(start_date, np.arange(length))
+    ys = np.arange(length, dtype=float)
+    return CachedTrace(xs, ys, max_value_date=xs[-1].item(), max_value=ys[-1])
+
+
+def test_hits_and_misses():
+    cache = TraceCache(max_bytes=2 ** 20)
+    first = cache.get_or_create("a", lambda: _create_trace(10))
+    assert cache.get_or_create("a", lambda: _create_trace(20)) is first
+    cache.get_or_create("b", lambda: _create_trace(10))
+    assert cache.get_stats() == (1, 2)
+    assert len(cache) == 2
+
+    with pytest.raises(ValueError):
+        first.ys[0] = 1.0
+
+
+def test_eviction():
+    trace_size = _create_trace(100).get_size()
+    cache = TraceCache(max_bytes=2 * trace_size)
+    for key in ["a", "b", "c"]:
+        cache.get_or_create(key, lambda: _create_trace(100))
+    assert len(cache) == 2
+    assert cache.get_size() == 2 * trace_size
+
+    # "a" was evicted as the least recently used trace.
+    cache.get_or_create("b", lambda: _create_trace(100))
+    cache.get_or_create("a", lambda: _create_trace(100))
+    assert cache.get_stats() == (1, 4)
+    cache.get_or_create("b", lambda: _create_trace(100))
+    assert cache.get_stats() == (2, 4)
+
+
+def test_traces_with_the_same_key_are_shared():
+    fit = AtgModelFit(a=2000.0, tg=7.0, exp=6.0, t0=0.5)
+    trace_generators = [
+        TraceGenerator(
+            func=fit.predict_many,
+            start_date=datetime.date(2020, 3, 1),
+            display_at_least_until=datetime.date(2020, 5, 1),
+            label=label,
+            cache_key=("trace_cache_test", fit.a, fit.tg, fit.exp, fit.t0),
+        )
+        for label in ["first", "second"]
+    ]
+    display_until = datetime.date(2020, 6, 1)
+    first, second = (generator.generate_trace(display_until) for generator in trace_generators)
+    assert first.xs is second.xs and first.ys is second.ys
+    assert (first.label, second.label) == ("first", "second")
+    assert first.xs[-1] == display_until
+    np.testing.assert_allclose(first.ys, [fit.predict(x) for x in range(len(first.xs))])
@@ -25,11 +25,17 @@ setup(
     entry_points={
         "console_scripts": [
             "covid_graphs.prepare_data = covid_graphs.prepare_data:main",
+            "covid_graphs.prepare_all_data = covid_graphs.prepare_data:prepare_all_data",
+            "covid_graphs.create_dataset = covid_graphs.country_dataset:create_dataset",
             "covid_graphs.show_country_plot = covid_graphs.country_graph:show_country_plot",
             "covid_graphs.show_heat_map = covid_graphs.heat_map:show_heat_map",
             "covid_graphs.show_scatter_plot = covid_graphs.scatter_plot:show_scatter_plot",
             "covid_graphs.generate_predictions = covid_graphs.prediction_generator:generate_predictions",
             "covid_graphs.calculate_posterior = covid_graphs.bayesian:calculate_posterior",
+            "covid_graphs.compare_posteriors = covid_graphs.approximate_posterior:compare_posteriors",
+            "covid_graphs.rescore_simulation = covid_graphs.simulation_rescoring:rescore_simulation",
+            "covid_graphs.merge_simulations = covid_graphs.simulation_shards:merge_simulations",
+            "covid_graphs.split_simulation = covid_graphs.simulation_shards:split_simulation",
         ]
     },
 )
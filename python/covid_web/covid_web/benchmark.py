@@ -0,0 +1,262 @@
+import datetime
+import functools
+import gc
+import json
+import statistics
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import click
+import click_pathlib
+import numpy as np
+from flask import Flask
+
+from covid_graphs import formula, predictions
+from covid_graphs.country_graph import CountryGraph, GraphType
+from covid_graphs.country_report import create_report
+from covid_graphs.fit_atg_model import fit_atg_model
+from covid_graphs.formula import FittedFormula
+from covid_graphs.trace_cache import TRACE_CACHE
+
+from .country_dashboard import DashboardFactory, DashboardType, create_dashboard_data
+from .rest import Rest
+from .snapshot import SNAPSHOT_FILENAME, get_input_fingerprint, load_snapshot, write_snapshot
+
+# Number of prediction dates shown on the slider, as in `show_country_plot`.
+SLIDER_PREDICTION_DAYS = 28
+
+
+@dataclass
+class BenchmarkCase:
+    name: str
+    func: Callable[[], Any]
+    # Prepares inputs of `func`, not measured. Only called if the case runs.
+    setup: Callable[[], Any] = field(default=lambda: None)
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    repeat: int
+    min_seconds: float
+    median_seconds: float
+    peak_memory_mb: float
+
+
+def create_benchmark_cases(
+    data_dir: Path, prediction_dir: Path, country: str
+) -> List[BenchmarkCase]:
+    """
+    Creates the benchmarks of the modeling and rendering hot paths, using data of `country` for
+    the single-country cases. Inputs of every case are prepared outside of the measurement.
+    """
+    report = create_report(data_dir / f"{country}.data")
+    xs = np.arange(len(report.dates))
+    last_data_date = report.dates[-1]
+    fitted_formula = formula.fit_country_data(report, last_data_date, bootstrap_replicates=200)
+    trace_generator = fitted_formula.get_trace_generator(report)
+    display_until = last_data_date + datetime.timedelta(days=len(report.dates))
+
+    prediction_db = predictions.load_prediction_db(prediction_dir)
+    country_predictions = [
+        prediction
+        for prediction in prediction_db.select_predictions(
+            country=country, last_data_dates=report.dates[-SLIDER_PREDICTION_DAYS:]
+        )
+        if isinstance(prediction.formula, FittedFormula)
+    ]
+
+    def generate_uncached_trace() -> None:
+        TRACE_CACHE.clear()
+        trace_generator.generate_trace(display_until)
+
+    def create_graph() -> CountryGraph:
+        return CountryGraph(
+            report=report,
+            country_predictions=country_predictions,
+            posterior_formula=fitted_formula.get_bootstrap_formula(),
+        )
+
+    country_graph = create_graph()
+
+    @functools.lru_cache(maxsize=None)
+    def get_rest() -> Rest:
+        return Rest(data_dir=data_dir, prediction_dir=prediction_dir)
+
+    def generate_static_files() -> None:
+        with tempfile.TemporaryDirectory() as output_dir:
+            get_rest().generate_static_files(Path(output_dir))
+
+    def start_dashboards() -> None:
+        dashboard_factory = DashboardFactory(create_dashboard_data(data_dir, prediction_dir))
+        server = Flask(__name__)
+        for dashboard_type in DashboardType:
+            dashboard_factory.create_dashboard(dashboard_type, server)
+
+    # Deleted once the cases are garbage collected.
+    snapshot_dir = tempfile.TemporaryDirectory()
+
+    def get_snapshot_path() -> Path:
+        return Path(snapshot_dir.name) / SNAPSHOT_FILENAME
+
+    @functools.lru_cache(maxsize=None)
+    def write_dashboard_snapshot() -> None:
+        write_snapshot(
+            get_snapshot_path(),
+            create_dashboard_data(data_dir, prediction_dir),
+            get_input_fingerprint(data_dir, prediction_dir),
+        )
+
+    def load_dashboard_snapshot() -> None:
+        fingerprint = get_input_fingerprint(data_dir, prediction_dir)
+        assert load_snapshot(get_snapshot_path(), fingerprint) is not None
+
+    return (
+        [
+            BenchmarkCase("fit_atg_model", lambda: fit_atg_model(xs, report.cumulative_active)),
+            BenchmarkCase(
+                "fit_country_data", lambda: formula.fit_country_data(report, last_data_date)
+            ),
+            BenchmarkCase("generate_trace", generate_uncached_trace),
+            BenchmarkCase(
+                "generate_trace[cached]",
+                lambda: trace_generator.generate_trace(display_until),
+                setup=lambda: trace_generator.generate_trace(display_until),
+            ),
+            BenchmarkCase("CountryGraph", create_graph),
+        ]
+        + [_create_figure_case(country_graph, graph_type) for graph_type in GraphType]
+        + [
+            BenchmarkCase(
+                "load_prediction_db", lambda: predictions.load_prediction_db(prediction_dir)
+            ),
+            BenchmarkCase("Rest", lambda: Rest(data_dir=data_dir, prediction_dir=prediction_dir)),
+            BenchmarkCase("generate_static_files", generate_static_files, setup=get_rest),
+            BenchmarkCase("DashboardFactory", start_dashboards),
+            BenchmarkCase("load_snapshot", load_dashboard_snapshot, setup=write_dashboard_snapshot),
+        ]
+    )
+
+
+def _create_figure_case(country_graph: CountryGraph, graph_type: GraphType) -> BenchmarkCase:
+    return BenchmarkCase(
+        f"create_country_figure[{graph_type}]",
+        lambda: country_graph.create_country_figure(graph_type=graph_type),
+    )
+
+
+def run_benchmark(case: BenchmarkCase, repeat: int) -> BenchmarkResult:
+    """
+    Runs `case` `repeat` times to measure its time, and once more with tracemalloc to measure its
+    peak memory, since tracing slows the code down.
+    """
+    case.setup()
+    durations = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        case.func()
+        durations.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        case.func()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return BenchmarkResult(
+        name=case.name,
+        repeat=repeat,
+        min_seconds=min(durations),
+        median_seconds=statistics.median(durations),
+        peak_memory_mb=peak_memory / 2 ** 20,
+    )
+
+
+def find_regressions(
+    results: List[BenchmarkResult], baseline: Dict[str, Dict[str, float]], tolerance: float
+) -> List[str]:
+    """
+    Compares `results` with a baseline saved by `--save-baseline`. Returns descriptions of cases
+    whose median time or peak memory grew by more than `tolerance` (relative).
+    """
+    regressions = []
+    for result in results:
+        if result.name not in baseline:
+            continue
+        for metric in ["median_seconds", "peak_memory_mb"]:
+            old_value, new_value = baseline[result.name][metric], getattr(result, metric)
+            if new_value > old_value * (1 + tolerance):
+                regressions.append(f"{result.name}: {metric} {old_value:.4g} -> {new_value:.4g}")
+    return regressions
+
+
+@click.command(help="Benchmark the modeling and rendering hot paths on a data directory")
+@click.argument(
+    "data_dir",
+    required=True,
+    type=click_pathlib.Path(exists=True),
+)
+@click.option(
+    "-p",
+    "--prediction-dir",
+    type=click_pathlib.Path(exists=True),
+    default=None,
+    help="Directory with prediction proto files, DATA_DIR/predictions by default",
+)
+@click.option("--country", default="Germany", help="Country used by single-country cases")
+@click.option("--repeat", type=int, default=3, help="Number of timed runs of every case")
+@click.option("-k", "--filter", "name_filter", default="", help="Only run cases containing this")
+@click.option(
+    "--baseline",
+    type=click_pathlib.Path(exists=True),
+    default=None,
+    help="Compare with a baseline JSON saved by --save-baseline, fail on regressions",
+)
+@click.option("--save-baseline", type=click_pathlib.Path(), default=None)
+@click.option(
+    "--tolerance", type=float, default=0.25, help="Allowed relative slowdown over the baseline"
+)
+def benchmark(
+    data_dir: Path,
+    prediction_dir: Optional[Path],
+    country: str,
+    repeat: int,
+    name_filter: str,
+    baseline: Optional[Path],
+    save_baseline: Optional[Path],
+    tolerance: float,
+) -> None:
+    prediction_dir = prediction_dir or data_dir / "predictions"
+    cases = [
+        case
+        for case in create_benchmark_cases(data_dir, prediction_dir, country)
+        if name_filter in case.name
+    ]
+
+    results = []
+    print(f"{'case':40} {'min [s]':>10} {'median [s]':>10} {'peak [MB]':>10}")
+    for case in cases:
+        result = run_benchmark(case, repeat)
+        results.append(result)
+        print(
+            f"{result.name:40} {result.min_seconds:10.4f} {result.median_seconds:10.4f} "
+            f"{result.peak_memory_mb:10.1f}"
+        )
+
+    if save_baseline is not None:
+        save_baseline.write_text(
+            json.dumps({result.name: asdict(result) for result in results}, indent=2)
+        )
+    if baseline is not None:
+        regressions = find_regressions(results, json.loads(baseline.read_text()), tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if len(regressions) > 0:
+            raise click.ClickException(f"{len(regressions)} regressions over {baseline}")
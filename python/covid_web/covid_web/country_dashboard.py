@@ -1,6 +1,8 @@
+import json
+from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Dict, Iterable, List, Optional, Union
 
 import dash
 import dash_core_components as dcc
@@ -8,13 +10,18 @@ import dash_html_components as html
 from dash.dependencies import Input, Output
 from dash.development.base_component import Component
 from flask import Flask
+from plotly.graph_objs import Layout
+from plotly.utils import PlotlyJSONEncoder
 
-import covid_graphs.country_report as country_report
 from covid_graphs import predictions
+from covid_graphs.country_dataset import load_country_reports
 from covid_graphs.country_graph import CountryGraph, GraphAxisType, GraphType
 from covid_graphs.country_report import CountryReport
 from covid_graphs.predictions import BK_20200329, BK_20200411, PredictionDb, PredictionEvent
 
+from .metrics import METRICS
+from .startup_profile import StartupProfile
+
 
 class DashboardType(Enum):
     SingleCountry = "single"
@@ -28,13 +35,200 @@ class DashboardType(Enum):
 TITLE = "COVID-19 predictions of Boďová and Kollár"
 CountryGraphsByReportName = Dict[str, List[CountryGraph]]
 CURRENT_DIR = Path(__file__).parent
+# Axis types offered by the dashboards. Figures of these types only differ in the axes layout.
+DASHBOARD_AXIS_TYPES = [GraphAxisType.Linear, GraphAxisType.SemiLog]
+
+# Applies the axes layout of the selected axis type to the country figure in the browser.
+APPLY_AXES_LAYOUT_JS = """
+function(countryFigure, graphAxisType) {
+    if (!countryFigure) {
+        return window.dash_clientside.no_update;
+    }
+    const figure = countryFigure.figure;
+    const axesLayout = countryFigure.axes_layouts[graphAxisType];
+    const layout = Object.assign({}, figure.layout, {
+        xaxis: Object.assign({}, figure.layout.xaxis, axesLayout.xaxis),
+        yaxis: Object.assign({}, figure.layout.yaxis, axesLayout.yaxis),
+    });
+    return Object.assign({}, figure, {layout: layout});
+}
+"""
+
+
+# Encoded JSON, either bytes or a view of a memory mapped snapshot.
+FigureJson = Union[bytes, memoryview]
+
+
+class CountryFigures:
+    """
+    Figures of country graphs of one graph type, by the short names of the countries in the order
+    of the graphs. Every figure is stored together with the axes layouts of `DASHBOARD_AXIS_TYPES`,
+    so that the axis type can be switched without creating the figure again, e.g. by the browser.
+
+    The figures are stored as encoded JSON, which takes a fraction of the memory of plotly objects.
+    Unlike objects, the JSON isn't touched by the garbage collector, so the pages of figures
+    created before forking stay shared by the uwsgi workers. The figures are only read after
+    construction, so they can be used from multiple threads.
+    """
+
+    def __init__(self, figure_json_by_country: Dict[str, FigureJson]):
+        self.figure_json_by_country = figure_json_by_country
+
+    @staticmethod
+    def create(graphs: Iterable[CountryGraph], graph_type: GraphType) -> "CountryFigures":
+        return CountryFigures(
+            {graph.short_name: _encode_country_figure(graph, graph_type) for graph in graphs}
+        )
+
+    def get_countries(self) -> List[str]:
+        return list(self.figure_json_by_country.keys())
+
+    def get_figure(self, country_short_name: str) -> Dict[str, Any]:
+        """
+        Returns the figure of the country as {"figure": ..., "axes_layouts": ...}, decoded anew by
+        every call, so it may be modified.
+        """
+        return json.loads(bytes(self.figure_json_by_country[country_short_name]))
+
+
+def _encode_country_figure(graph: CountryGraph, graph_type: GraphType) -> bytes:
+    figure = graph.create_country_figure(
+        graph_axis_type=DASHBOARD_AXIS_TYPES[0], graph_type=graph_type
+    )
+    axes_layouts = {
+        graph_axis_type.name: Layout(graph.get_axes_layout(graph_axis_type))
+        for graph_axis_type in DASHBOARD_AXIS_TYPES
+    }
+    return json.dumps(
+        dict(figure=figure, axes_layouts=axes_layouts), cls=PlotlyJSONEncoder
+    ).encode()
+
+
+def _apply_axes_layout(country_figure: Dict[str, Any], graph_axis_type_str: str) -> Dict[str, Any]:
+    """Same as APPLY_AXES_LAYOUT_JS, but modifies `country_figure`."""
+    figure = country_figure["figure"]
+    axes_layout = country_figure["axes_layouts"][graph_axis_type_str]
+    for axis in ["xaxis", "yaxis"]:
+        figure["layout"][axis].update(axes_layout[axis])
+    return figure
+
+
+@dataclass
+class DashboardData:
+    """
+    Everything shown by the dashboards: the prediction events sorted by their last data date, the
+    long names of the countries with predictions by their short names, and the country figures of
+    every dashboard. Created from the reports and predictions by `create_dashboard_data`, or loaded
+    from a snapshot, see `covid_web.snapshot`.
+    """
+
+    prediction_events: List[PredictionEvent]
+    long_name_by_country: Dict[str, str]
+    single_country_figures: CountryFigures
+    single_country_all_predictions_figures: CountryFigures
+    # Figures of the countries with a prediction of the event, ordered by their long names.
+    all_countries_figures_by_event: Dict[str, CountryFigures]
+
+
+def create_dashboard_data(
+    data_dir: Path, prediction_dir: Path, startup_profile: Optional[StartupProfile] = None
+) -> DashboardData:
+    startup_profile = startup_profile or StartupProfile()
+    with startup_profile.phase("load_prediction_db"):
+        prediction_db = predictions.load_prediction_db(prediction_dir=prediction_dir)
+    prediction_events = prediction_db.get_prediction_events()
+    prediction_events.sort(key=lambda event: event.last_data_date)
+
+    with startup_profile.phase("load_country_reports"):
+        report_by_short_name = load_country_reports(data_dir, prediction_db.get_countries())
+
+    with startup_profile.phase(f"create_figures[{DashboardType.SingleCountry}]"):
+        single_country_figures = CountryFigures.create(
+            _create_single_country_graphs(prediction_db, report_by_short_name),
+            GraphType.CompactSlider,
+        )
+    with startup_profile.phase(f"create_figures[{DashboardType.SingleCountryAllPredictions}]"):
+        single_country_all_predictions_figures = CountryFigures.create(
+            _create_single_country_all_predictions_graphs(prediction_db, report_by_short_name),
+            GraphType.MultiPredictions,
+        )
+    with startup_profile.phase(f"create_figures[{DashboardType.AllCountries}]"):
+        all_countries_figures_by_event = {
+            prediction_event.name: CountryFigures.create(
+                _create_all_countries_graphs(prediction_db, report_by_short_name, prediction_event),
+                GraphType.SinglePrediction,
+            )
+            for prediction_event in prediction_events
+        }
+
+    return DashboardData(
+        prediction_events=prediction_events,
+        long_name_by_country={
+            short_name: report.long_name for short_name, report in report_by_short_name.items()
+        },
+        single_country_figures=single_country_figures,
+        single_country_all_predictions_figures=single_country_all_predictions_figures,
+        all_countries_figures_by_event=all_countries_figures_by_event,
+    )
+
+
+def _create_single_country_graphs(
+    prediction_db: PredictionDb, report_by_short_name: Dict[str, CountryReport]
+) -> List[CountryGraph]:
+    return [
+        CountryGraph(
+            report_by_short_name[country_short_name],
+            # TODO(mszabados): Make it possible to select only automatic predictions.
+            # Right now this shows BK predictions as well, which makes for a strange experience
+            # (the curve changes color, etc).
+            prediction_db.select_predictions(
+                country=country_short_name,
+                last_data_dates=report_by_short_name[country_short_name].dates,
+            ),
+        )
+        for country_short_name in prediction_db.get_countries()
+    ]
+
+
+def _create_single_country_all_predictions_graphs(
+    prediction_db: PredictionDb, report_by_short_name: Dict[str, CountryReport]
+) -> List[CountryGraph]:
+    graphs = []
+    for country_short_name in prediction_db.get_countries():
+        report = report_by_short_name[country_short_name]
+        country_predictions = prediction_db.select_predictions(
+            country=country_short_name,
+            last_data_dates=[
+                report.dates[-1],
+                report.dates[-8],
+                report.dates[-15],
+                report.dates[-22],
+                report.dates[-29],
+            ],
+        )
+        if len(country_predictions) > 0:
+            graphs.append(CountryGraph(report=report, country_predictions=country_predictions))
+    return graphs
+
+
+def _create_all_countries_graphs(
+    prediction_db: PredictionDb,
+    report_by_short_name: Dict[str, CountryReport],
+    prediction_event: PredictionEvent,
+) -> List[CountryGraph]:
+    # Note: We silently assume there is only one prediction per country.
+    country_graphs = [
+        CountryGraph(report_by_short_name[country_prediction.country], [country_prediction])
+        for country_prediction in prediction_db.predictions_for_event(prediction_event)
+    ]
+    country_graphs.sort(key=lambda graph: graph.long_name)
+    return country_graphs
 
 
 class DashboardFactory:
-    def __init__(self, data_dir: Path, prediction_dir: Path):
-        self.prediction_db = predictions.load_prediction_db(prediction_dir=prediction_dir)
-        prediction_events = self.prediction_db.get_prediction_events()
-        prediction_events.sort(key=lambda event: event.last_data_date)
+    def __init__(self, dashboard_data: DashboardData):
+        self.dashboard_data = dashboard_data
+        prediction_events = dashboard_data.prediction_events
         self.prediction_event_by_name = {
             prediction_event.name: prediction_event for prediction_event in prediction_events
         }
@@ -50,30 +244,18 @@ class DashboardFactory:
         # Show the week-old prediction by default
         self._dropdown_initial_value = self._dropdown_prediction_events[1]
 
-        reports = [
-            country_report.create_report(data_dir / f"{country_short_name}.data")
-            for country_short_name in self.prediction_db.get_countries()
-            if (data_dir / f"{country_short_name}.data").is_file()
-        ]
-        self.report_by_short_name = {report.short_name: report for report in reports}
-
-        self.graphs_by_event = {
-            prediction_event.name: DashboardFactory._create_graphs(
-                self.prediction_db, self.report_by_short_name, prediction_event
-            )
-            for prediction_event in self.prediction_db.get_prediction_events()
-        }
-
     def create_dashboard(self, dashboard_type: DashboardType, server: Flask) -> dash.Dash:
         if dashboard_type == DashboardType.AllCountries:
             extra_content = [html.Div(id="country-graphs")]
         else:
             extra_content = [
+                # Figure of the selected country, see CountryFigures.
+                dcc.Store(id="country-figure"),
                 dcc.Graph(
                     id="country-graph",
                     figure=dict(layout=dict(height=700)),
                     config=dict(modeBarButtons=[["toImage"]]),
-                )
+                ),
             ]
 
         app = dash.Dash(
@@ -97,7 +279,7 @@ class DashboardFactory:
             content += [
                 html.H1(id="graph-title", children="Automated daily predictions"),
             ]
-        content += self._create_buttons(dashboard_type, self.report_by_short_name)
+        content += self._create_buttons(dashboard_type)
         content += extra_content
 
         app.title = TITLE
@@ -115,25 +297,17 @@ class DashboardFactory:
             self._create_single_country_all_predictions_callbacks(app)
         else:
             self._create_all_countries_callbacks(app)
+        if dashboard_type != DashboardType.AllCountries:
+            app.clientside_callback(
+                APPLY_AXES_LAYOUT_JS,
+                Output("country-graph", component_property="figure"),
+                [Input("country-figure", "data"), Input("graph-axis-type", "value")],
+            )
 
         return app
 
-    @staticmethod
-    def _create_graphs(
-        prediction_db: PredictionDb,
-        report_by_short_name: Dict[str, CountryReport],
-        prediction_event: PredictionEvent,
-    ) -> List[CountryGraph]:
-        # Note: We silently assume there is only one prediction per country.
-        country_graphs = [
-            CountryGraph(report_by_short_name[country_prediction.country], [country_prediction])
-            for country_prediction in prediction_db.predictions_for_event(prediction_event)
-        ]
-        country_graphs.sort(key=lambda graph: graph.long_name)
-        return country_graphs
-
     def _create_buttons(
-        self, dashboard_type: DashboardType, report_by_short_name: Dict[str, CountryReport]
+        self, dashboard_type: DashboardType
     ) -> List[dash.development.base_component.Component]:
         buttons = []
         if dashboard_type == DashboardType.AllCountries:
@@ -160,9 +334,10 @@ class DashboardFactory:
                 dcc.Dropdown(
                     id="country-short-name",
                     options=[
-                        dict(label=report.long_name, value=report.short_name)
-                        for report in sorted(
-                            report_by_short_name.values(), key=lambda x: x.long_name
+                        dict(label=long_name, value=short_name)
+                        for short_name, long_name in sorted(
+                            self.dashboard_data.long_name_by_country.items(),
+                            key=lambda item: item[1],
                         )
                     ],
                     value="Italy",
@@ -175,83 +350,38 @@ class DashboardFactory:
                 id="graph-axis-type",
                 options=[
                     {"label": graph_axis_type.value, "value": graph_axis_type.name}
-                    for graph_axis_type in [GraphAxisType.Linear, GraphAxisType.SemiLog]
+                    for graph_axis_type in DASHBOARD_AXIS_TYPES
                 ],
-                value="Linear",
+                value=DASHBOARD_AXIS_TYPES[0].name,
                 labelStyle={"display": "inline-block", "margin": "0 4px 0 0"},
             ),
         )
         return buttons
 
     def _create_single_country_callbacks(self, app: dash.Dash) -> None:
-        graphs_by_country = {
-            country_short_name: CountryGraph(
-                self.report_by_short_name[country_short_name],
-                # TODO(mszabados): Make it possible to select only automatic predictions.
-                # Right now this shows BK predictions as well, which makes for a strange experience
-                # (the curve changes color, etc).
-                self.prediction_db.select_predictions(
-                    country=country_short_name,
-                    last_data_dates=self.report_by_short_name[country_short_name].dates,
-                ),
-            )
-            for country_short_name in self.prediction_db.get_countries()
-        }
+        figures = self.dashboard_data.single_country_figures
 
         @app.callback(
-            Output("country-graph", component_property="figure"),
-            [Input("graph-axis-type", "value"), Input("country-short-name", "value")],
+            Output("country-figure", component_property="data"),
+            [Input("country-short-name", "value")],
         )
-        def update_graph(graph_axis_type_str, country_short_name):
-            graph = graphs_by_country[country_short_name]
-            return graph.create_country_figure(
-                graph_axis_type=GraphAxisType[graph_axis_type_str], graph_type=GraphType.Slider
-            )
+        @METRICS.timed(f"update_graph[{DashboardType.SingleCountry}]")
+        def update_graph(country_short_name):
+            return figures.get_figure(country_short_name)
 
     def _create_single_country_all_predictions_callbacks(self, app: dash.Dash) -> None:
-        graph_by_short_name = {}
-        for country_short_name in self.prediction_db.get_countries():
-            report = self.report_by_short_name[country_short_name]
-            country_predictions = self.prediction_db.select_predictions(
-                country=country_short_name,
-                last_data_dates=[
-                    report.dates[-1],
-                    report.dates[-8],
-                    report.dates[-15],
-                    report.dates[-22],
-                    report.dates[-29],
-                ],
-            )
-            if len(country_predictions) > 0:
-                graph_by_short_name[country_short_name] = CountryGraph(
-                    report=report, country_predictions=country_predictions
-                )
+        figures = self.dashboard_data.single_country_all_predictions_figures
 
         @app.callback(
-            Output("country-graph", component_property="figure"),
-            [Input("graph-axis-type", "value"), Input("country-short-name", "value")],
+            Output("country-figure", component_property="data"),
+            [Input("country-short-name", "value")],
         )
-        def update_graph(graph_axis_type_str, country_short_name):
-            graph_axis_type = GraphAxisType[graph_axis_type_str]
-            return graph_by_short_name[country_short_name].create_country_figure(
-                graph_axis_type=graph_axis_type, graph_type=GraphType.MultiPredictions
-            )
+        @METRICS.timed(f"update_graph[{DashboardType.SingleCountryAllPredictions}]")
+        def update_graph(country_short_name):
+            return figures.get_figure(country_short_name)
 
     def _create_all_countries_callbacks(self, app: dash.Dash) -> None:
-        dash_graph_dict = {
-            (prediction_event_name, graph_axis_type): [
-                dcc.Graph(
-                    id=f"{graph.short_name}-graph-{prediction_event_name}",
-                    figure=graph.create_country_figure(
-                        graph_type=GraphType.SinglePrediction, graph_axis_type=graph_axis_type
-                    ),
-                    config=dict(modeBarButtons=[["toImage"]]),
-                )
-                for graph in self.graphs_by_event[prediction_event_name]
-            ]
-            for graph_axis_type in [GraphAxisType.Linear, GraphAxisType.SemiLog]
-            for prediction_event_name in self.prediction_event_by_name.keys()
-        }
+        figures_by_event = self.dashboard_data.all_countries_figures_by_event
 
         @app.callback(
             [
@@ -260,9 +390,19 @@ class DashboardFactory:
             ],
             [Input("prediction-event", "value"), Input("graph-axis-type", "value")],
         )
+        @METRICS.timed(f"update_dashboard[{DashboardType.AllCountries}]")
         def update_dashboard(prediction_event_name: str, graph_axis_type_str: str):
-            graph_axis_type = GraphAxisType[graph_axis_type_str]
-            graphs = dash_graph_dict[(prediction_event_name, graph_axis_type)]
+            figures = figures_by_event[prediction_event_name]
+            graphs = [
+                dcc.Graph(
+                    id=f"{country_short_name}-graph-{prediction_event_name}",
+                    figure=_apply_axes_layout(
+                        figures.get_figure(country_short_name), graph_axis_type_str
+                    ),
+                    config=dict(modeBarButtons=[["toImage"]]),
+                )
+                for country_short_name in figures.get_countries()
+            ]
 
             prediction_date = self.prediction_event_by_name[prediction_event_name].prediction_date
             return graphs, f"{prediction_date.strftime('%B %d')} predictions"
@@ -0,0 +1,184 @@
+import bisect
+import functools
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar, cast
+
+from flask import Flask, Response, g, request
+
+# Upper bounds of the buckets of latency histograms, in seconds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the buckets of response size histograms, in bytes.
+SIZE_BUCKETS = (2 ** 10, 2 ** 12, 2 ** 14, 2 ** 16, 2 ** 18, 2 ** 20, 2 ** 22, 2 ** 24)
+# Content type of the Prometheus text exposition format.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+F = TypeVar("F", bound=Callable)
+
+
+class Histogram:
+    """Counts of observations in buckets with the given upper bounds, and their sum."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        # The last count is of observations over the largest bucket.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+@dataclass
+class _Family:
+    help: str
+    kind: str
+    label_names: LabelValues
+
+
+class Metrics:
+    """
+    Latency and response size histograms of the web server, rendered in the Prometheus text
+    format. Every update is a dictionary lookup and a few additions under a lock,
+    so the metrics can stay on in production.
+
+    The metrics live in the memory of one process. Under uwsgi with several workers, each worker
+    reports only the requests it served, labeled by its worker id. Every scrape is served by one of
+    the workers, so the series of a worker are only updated when it is scraped, and the totals are
+    sums over the `worker` label.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._families = {
+            "covid_web_request_duration_seconds": _Family(
+                "Time to serve a request, by URL rule", "histogram", ("route", "status")
+            ),
+            "covid_web_response_size_bytes": _Family(
+                "Size of the response body, by URL rule", "histogram", ("route",)
+            ),
+            "covid_web_function_duration_seconds": _Family(
+                "Time spent in REST getters and Dash callbacks", "histogram", ("function",)
+            ),
+        }
+        self._histograms: Dict[Tuple[str, LabelValues], Histogram] = {}
+
+    def _observe(
+        self, name: str, label_values: LabelValues, value: float, buckets: Sequence[float]
+    ) -> None:
+        key = (name, label_values)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def observe_request(self, route: str, status: int, seconds: float, size: Optional[int]):
+        self._observe(
+            "covid_web_request_duration_seconds", (route, str(status)), seconds, LATENCY_BUCKETS
+        )
+        if size is not None:
+            self._observe("covid_web_response_size_bytes", (route,), size, SIZE_BUCKETS)
+
+    def observe_function(self, function: str, seconds: float) -> None:
+        self._observe("covid_web_function_duration_seconds", (function,), seconds, LATENCY_BUCKETS)
+
+    def timed(self, function: str) -> Callable[[F], F]:
+        """Decorator recording the duration of every call under the label `function`."""
+
+        def decorator(func: F) -> F:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe_function(function, time.perf_counter() - start)
+
+            return cast(F, wrapper)
+
+        return decorator
+
+    def render(self) -> str:
+        lines: List[str] = []
+        worker_labels = _get_worker_labels()
+        with self._lock:
+            for name, family in self._families.items():
+                lines.append(f"# HELP {name} {family.help}")
+                lines.append(f"# TYPE {name} {family.kind}")
+                for (family_name, label_values), histogram in sorted(self._histograms.items()):
+                    if family_name == name:
+                        labels = list(zip(family.label_names, label_values)) + worker_labels
+                        lines += _render_histogram(name, labels, histogram)
+        return "\n".join(lines) + "\n"
+
+
+def _get_worker_labels() -> List[Tuple[str, str]]:
+    """Returns the label of the uwsgi worker of this process, none if not running under uwsgi."""
+    try:
+        # Only importable in processes started by uwsgi.
+        import uwsgi  # type: ignore
+    except ImportError:
+        return []
+    return [("worker", str(uwsgi.worker_id()))]
+
+
+def _render_labels(labels: List[Tuple[str, str]]) -> str:
+    if len(labels) == 0:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    # Whole numbers without the exponent or the decimal point, e.g. bucket bounds in bytes.
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _render_histogram(name: str, labels: List[Tuple[str, str]], histogram: Histogram) -> List[str]:
+    lines = []
+    cumulative_count = 0
+    for upper_bound, count in zip(list(histogram.buckets) + [float("inf")], histogram.counts):
+        cumulative_count += count
+        le = "+Inf" if upper_bound == float("inf") else _format_value(upper_bound)
+        lines.append(f"{name}_bucket{_render_labels(labels + [('le', le)])} {cumulative_count}")
+    lines.append(f"{name}_sum{_render_labels(labels)} {_format_value(histogram.sum)}")
+    lines.append(f"{name}_count{_render_labels(labels)} {cumulative_count}")
+    return lines
+
+
+# Metrics of this process, shared by the server, the dashboards and the REST getters.
+METRICS = Metrics()
+
+
+def instrument_server(server: Flask, metrics: Metrics = METRICS) -> None:
+    """
+    Records the latency and response size of every request of `server`, labeled by its URL rule
+    so that the number of label values stays bounded, and serves the metrics at /internal/metrics.
+    """
+
+    @server.before_request
+    def start_timer():
+        g.metrics_request_start = time.perf_counter()
+
+    @server.after_request
+    def record_request(response: Response) -> Response:
+        start = g.pop("metrics_request_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+            size = response.content_length
+            if size is None and not response.is_streamed:
+                size = response.calculate_content_length()
+            metrics.observe_request(route, response.status_code, time.perf_counter() - start, size)
+        return response
+
+    # Not reachable from the outside, nginx blocks /internal/.
+    @server.route("/internal/metrics")
+    def internal_metrics():
+        return Response(metrics.render(), content_type=CONTENT_TYPE)
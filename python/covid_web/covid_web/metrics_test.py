@@ -0,0 +1,65 @@
+import sys
+import types
+
+from .metrics import Histogram, Metrics
+
+
+def test_histogram_buckets():
+    histogram = Histogram([1.0, 2.0])
+    for value in [0.5, 1.0, 1.5, 3.0]:
+        histogram.observe(value)
+    # Upper bounds are inclusive, the last count is over the largest bucket.
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.sum == 6.0
+
+
+def test_render_histogram():
+    metrics = Metrics()
+    for seconds in [0.0005, 0.003, 0.003, 20.0]:
+        metrics.observe_function("update_graph", seconds)
+    lines = metrics.render().splitlines()
+
+    name = "covid_web_function_duration_seconds"
+    assert f"# HELP {name} Time spent in REST getters and Dash callbacks" in lines
+    assert f"# TYPE {name} histogram" in lines
+    series = [line for line in lines if line.startswith(name)]
+    assert series[:3] == [
+        f'{name}_bucket{{function="update_graph",le="0.001"}} 1',
+        f'{name}_bucket{{function="update_graph",le="0.0025"}} 1',
+        f'{name}_bucket{{function="update_graph",le="0.005"}} 3',
+    ]
+    assert series[-3:] == [
+        f'{name}_bucket{{function="update_graph",le="+Inf"}} 4',
+        f'{name}_sum{{function="update_graph"}} 20.0065',
+        f'{name}_count{{function="update_graph"}} 4',
+    ]
+    # Bucket counts are cumulative.
+    counts = [int(line.split()[-1]) for line in series if "_bucket" in line]
+    assert counts == sorted(counts)
+
+
+def test_render_request_sizes_and_label_escaping():
+    metrics = Metrics()
+    metrics.observe_request('/a"b\\c\n', 200, 0.01, size=2 ** 10)
+    metrics.observe_request('/a"b\\c\n', 200, 0.01, size=None)
+    lines = metrics.render().splitlines()
+
+    labels = 'route="/a\\"b\\\\c\\n"'
+    assert f'covid_web_request_duration_seconds_count{{{labels},status="200"}} 2' in lines
+    # Bucket bounds in bytes are rendered without the decimal point.
+    assert f'covid_web_response_size_bytes_bucket{{{labels},le="1024"}} 1' in lines
+    assert f"covid_web_response_size_bytes_count{{{labels}}} 1" in lines
+    assert metrics.render().endswith("\n")
+
+
+def test_render_worker_label(monkeypatch):
+    uwsgi = types.ModuleType("uwsgi")
+    uwsgi.worker_id = lambda: 2  # type: ignore
+    monkeypatch.setitem(sys.modules, "uwsgi", uwsgi)
+    metrics = Metrics()
+    metrics.observe_function("update_graph", 0.5)
+    lines = metrics.render().splitlines()
+
+    name = "covid_web_function_duration_seconds"
+    assert f'{name}_bucket{{function="update_graph",worker="2",le="+Inf"}} 1' in lines
+    assert f'{name}_count{{function="update_graph",worker="2"}} 1' in lines
@@ -7,10 +7,13 @@ import click_pathlib
 import flask
 
 from covid_graphs import predictions
+from covid_graphs.country_dataset import load_country_reports
 from covid_graphs.country_graph import CountryGraph
-from covid_graphs.country_report import CountryReport, create_report
+from covid_graphs.country_report import CountryReport
 from covid_graphs.predictions import PredictionDb
 
+from .metrics import METRICS
+
 CURRENT_DIR = Path(__file__).parent
 
 
@@ -23,6 +26,11 @@ def generate_static_rest(data_dir: Path, output_dir: Path) -> None:
 
 
 class Rest:
+    """
+    REST payloads of all predictions and country data, computed at construction. The payloads are
+    only read afterwards, so the getters can be called from multiple threads.
+    """
+
     def __init__(self, data_dir: Path, prediction_dir: Path):
         self.prediction_db = predictions.load_prediction_db(prediction_dir=prediction_dir)
         self.available_predictions = Rest._create_available_predictions(self.prediction_db)
@@ -55,11 +63,7 @@ class Rest:
     def _create_country_reports(
         prediction_db: PredictionDb, data_dir: Path
     ) -> Dict[str, CountryReport]:
-        return {
-            country_short_name: create_report(data_dir / f"{country_short_name}.data")
-            for country_short_name in prediction_db.get_countries()
-            if (data_dir / f"{country_short_name}.data").is_file()
-        }
+        return load_country_reports(data_dir, prediction_db.get_countries())
 
     @staticmethod
     def _create_predictions(
@@ -75,19 +79,19 @@ class Rest:
             cropped_cumulative_active = graph.cropped_cumulative_active.tolist()
             country_reports_active[country] = {
                 "type": "cumulative_active",
-                "date_list": graph.cropped_dates,
+                "date_list": graph.cropped_dates.tolist(),
                 "values": cropped_cumulative_active,
                 "short_name": country_report.short_name,
                 "long_name": country_report.long_name,
                 "population": country_report.population,
-                "max_value_date": graph.cropped_dates[max_value_idx],
+                "max_value_date": graph.cropped_dates[max_value_idx].item(),
                 "max_value": cropped_cumulative_active[max_value_idx],
             }
             for event, trace in graph.trace_by_event.items():
                 result_predictions.append(
                     {
                         "type": "prediction",
-                        "date_list": trace.xs,
+                        "date_list": trace.xs.tolist(),
                         "values": trace.ys.tolist(),
                         "description": trace.label,
                         "short_name": country_report.short_name,
@@ -106,6 +110,7 @@ class Rest:
     def get_app(self):
         return self
 
+    @METRICS.timed("Rest.get_available_predictions")
     def get_available_predictions(self):
         return flask.jsonify(self.available_predictions)
 
@@ -116,6 +121,7 @@ class Rest:
             if prediction["short_name"] == country
         ]
 
+    @METRICS.timed("Rest.get_predictions_by_country")
     def get_predictions_by_country(self, country: str):
         result = self._get_predictions_by_country(country=country)
 
@@ -131,6 +137,7 @@ class Rest:
             if prediction["prediction_name"] == prediction_name
         ]
 
+    @METRICS.timed("Rest.get_predictions_by_name")
     def get_predictions_by_name(self, date: str):
         result = self._get_predictions_by_name(prediction_name=date)
 
@@ -146,6 +153,7 @@ class Rest:
 
         return ""
 
+    @METRICS.timed("Rest.get_specific_prediction")
     def get_specific_prediction(self, date: str, country: str):
         result = self._get_specific_prediction(date=date, country=country)
         if result == "":
@@ -153,6 +161,7 @@ class Rest:
 
         return flask.jsonify(result)
 
+    @METRICS.timed("Rest.get_country_data")
     def get_country_data(self, country: str):
         if country not in self.country_reports_active:
             flask.abort(404)
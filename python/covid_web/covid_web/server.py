@@ -1,15 +1,22 @@
+import cProfile
+import gc
+import logging
 import os
 from pathlib import Path
+from typing import Optional
 
 import click
 import click_pathlib
 import requests
-from flask import Flask, redirect, render_template, request, url_for
+from flask import Flask, jsonify, redirect, render_template, request, url_for
 
 from covid_graphs.heat_map import create_heat_map_dashboard
 from covid_graphs.simulation_report import GrowthType
 
-from .country_dashboard import DashboardFactory, DashboardType
+from .country_dashboard import DashboardFactory, DashboardType, create_dashboard_data
+from .metrics import instrument_server
+from .snapshot import get_input_fingerprint, load_snapshot
+from .startup_profile import PROFILE_PATH_ENV, StartupProfile
 
 CURRENT_DIR = Path(__file__).parent
 
@@ -29,8 +36,15 @@ CURRENT_DIR = Path(__file__).parent
     type=click_pathlib.Path(exists=True),
     help="Directory with prediction proto files",
 )
-def run_server(data_dir: Path, prediction_dir: Path) -> None:
-    server = setup_server(data_dir, prediction_dir)
+@click.option(
+    "-s",
+    "--snapshot",
+    type=click_pathlib.Path(),
+    default=None,
+    help="Snapshot created by covid_web.build_snapshot, used if it matches the data",
+)
+def run_server(data_dir: Path, prediction_dir: Path, snapshot: Optional[Path]) -> None:
+    server = setup_server(data_dir, prediction_dir, snapshot)
     server.run(host="0.0.0.0", port=8081)
 
 
@@ -52,8 +66,43 @@ def track_pageview(path):
     response.raise_for_status()
 
 
-def setup_server(data_dir: Path, prediction_dir: Path) -> Flask:
+def setup_server(
+    data_dir: Path, prediction_dir: Path, snapshot_path: Optional[Path] = None
+) -> Flask:
+    """
+    Creates the server with all apps. The prediction dashboards are loaded from the snapshot in
+    `snapshot_path` if it was built from the same data and code, otherwise they are computed. The
+    simulation heat maps are not in the snapshot, they are always created from the .sim files.
+
+    If the environment variable COVID_WEB_STARTUP_PROFILE is set, a cProfile of the startup is
+    written into the file it names.
+    """
+    profile_path = os.environ.get(PROFILE_PATH_ENV)
+    if profile_path is None:
+        return _setup_server(data_dir, prediction_dir, snapshot_path)
+
+    profiler = cProfile.Profile()
+    server = profiler.runcall(_setup_server, data_dir, prediction_dir, snapshot_path)
+    profiler.dump_stats(profile_path)
+    logging.getLogger(__name__).info(f"Wrote a profile of the startup into {profile_path}")
+    return server
+
+
+def freeze_for_fork() -> None:
+    """
+    Moves all objects created so far, e.g. by `setup_server`, into the permanent generation of the
+    garbage collector. Collections in processes forked afterwards don't touch these objects, so
+    their memory pages stay shared between the processes, instead of being copied on write.
+    """
+    gc.collect()
+    gc.freeze()
+    logging.getLogger(__name__).info(f"Froze {gc.get_freeze_count()} objects before forking")
+
+
+def _setup_server(data_dir: Path, prediction_dir: Path, snapshot_path: Optional[Path]) -> Flask:
+    startup_profile = StartupProfile()
     server = Flask(__name__, template_folder=str(CURRENT_DIR))
+    instrument_server(server)
 
     @server.route("/")
     def home():
@@ -67,23 +116,49 @@ def setup_server(data_dir: Path, prediction_dir: Path) -> Flask:
     def covid19_predictions_redirect():
         return redirect(url_for("covid19_single_predictions"))
 
-    _create_prediction_apps(server=server, data_dir=data_dir, prediction_dir=prediction_dir)
-    _create_simulation_apps(server=server, data_dir=data_dir)
+    # Not reachable from the outside, nginx blocks /internal/.
+    @server.route("/internal/startup")
+    def internal_startup():
+        return jsonify(phases=startup_profile.to_json())
+
+    with startup_profile.phase("create_prediction_apps"):
+        _create_prediction_apps(
+            server=server,
+            data_dir=data_dir,
+            prediction_dir=prediction_dir,
+            snapshot_path=snapshot_path,
+            startup_profile=startup_profile,
+        )
+    with startup_profile.phase("create_simulation_apps"):
+        _create_simulation_apps(server=server, data_dir=data_dir)
 
     return server
 
 
-def _create_prediction_apps(server: Flask, data_dir: Path, prediction_dir: Path):
-    dashboard_factory = DashboardFactory(data_dir, prediction_dir)
-    single_prediction_app = dashboard_factory.create_dashboard(
-        dashboard_type=DashboardType.SingleCountry, server=server
-    )
-    single_country_all_predictions_app = dashboard_factory.create_dashboard(
-        dashboard_type=DashboardType.SingleCountryAllPredictions, server=server
-    )
-    all_predictions_app = dashboard_factory.create_dashboard(
-        dashboard_type=DashboardType.AllCountries, server=server
-    )
+def _create_prediction_apps(
+    server: Flask,
+    data_dir: Path,
+    prediction_dir: Path,
+    snapshot_path: Optional[Path],
+    startup_profile: StartupProfile,
+):
+    dashboard_data = None
+    if snapshot_path is not None:
+        with startup_profile.phase("load_snapshot"):
+            fingerprint = get_input_fingerprint(data_dir, prediction_dir)
+            dashboard_data = load_snapshot(snapshot_path, fingerprint)
+    if dashboard_data is None:
+        with startup_profile.phase("create_dashboard_data"):
+            dashboard_data = create_dashboard_data(data_dir, prediction_dir, startup_profile)
+    dashboard_factory = DashboardFactory(dashboard_data)
+
+    def create_dashboard(dashboard_type: DashboardType):
+        with startup_profile.phase(f"create_dashboard[{dashboard_type}]"):
+            return dashboard_factory.create_dashboard(dashboard_type=dashboard_type, server=server)
+
+    single_prediction_app = create_dashboard(DashboardType.SingleCountry)
+    single_country_all_predictions_app = create_dashboard(DashboardType.SingleCountryAllPredictions)
+    all_predictions_app = create_dashboard(DashboardType.AllCountries)
 
     @server.route("/covid19/predictions/single/")
     def covid19_single_predictions():
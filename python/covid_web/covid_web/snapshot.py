@@ -0,0 +1,187 @@
+import datetime
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import click
+import click_pathlib
+import dash
+import plotly
+
+import covid_graphs
+from covid_graphs.country_dataset import DATASET_FILENAME
+from covid_graphs.predictions import PredictionEvent
+
+from .country_dashboard import CountryFigures, DashboardData, FigureJson, create_dashboard_data
+
+# Bump when the layout of the snapshot or of its index changes.
+SNAPSHOT_VERSION = 1
+# Default name of the snapshot in the data directory.
+SNAPSHOT_FILENAME = "server.snapshot"
+# The file starts with the magic and the length of the JSON index, followed by the index and the
+# encoded figures. The index holds the offsets of the figures relative to the end of the index.
+_MAGIC = b"COVIDSNP"
+_HEADER = struct.Struct("<8sQ")
+
+logger = logging.getLogger(__name__)
+
+
+@click.command(
+    help="Save the data of the prediction dashboards into a snapshot loaded by the server"
+)
+@click.argument("data_dir", required=True, type=click_pathlib.Path(exists=True))
+@click.option(
+    "-o",
+    "--output",
+    type=click_pathlib.Path(),
+    default=None,
+    help=f"Output file, {SNAPSHOT_FILENAME} in DATA_DIR by default",
+)
+def build_snapshot(data_dir: Path, output: Optional[Path]) -> None:
+    output = output or data_dir / SNAPSHOT_FILENAME
+    prediction_dir = data_dir / "predictions"
+    fingerprint = get_input_fingerprint(data_dir, prediction_dir)
+    if load_snapshot(output, fingerprint) is not None:
+        print(f"Snapshot {output} is up to date")
+        return
+    write_snapshot(output, create_dashboard_data(data_dir, prediction_dir), fingerprint)
+    print(f"Wrote a snapshot of {data_dir} into {output}")
+
+
+def get_input_fingerprint(data_dir: Path, prediction_dir: Path) -> str:
+    """
+    Returns a hash of everything the dashboard data is computed from: the country data, the
+    predictions, and the code and libraries creating the figures. Takes milliseconds.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{SNAPSHOT_VERSION} {plotly.__version__} {dash.__version__}\n".encode())
+    labeled_paths = (
+        [(f"data/{path.name}", path) for path in sorted(data_dir.glob("*.data"))]
+        + [(f"data/{DATASET_FILENAME}", data_dir / DATASET_FILENAME)]
+        + [(f"predictions/{path.name}", path) for path in sorted(prediction_dir.glob("*.atg"))]
+    )
+    for package_dir in [Path(covid_graphs.__file__).parent, Path(__file__).parent]:
+        labeled_paths += [
+            (f"{package_dir.name}/{path.name}", path) for path in sorted(package_dir.glob("*.py"))
+        ]
+    for label, path in labeled_paths:
+        if path.is_file():
+            content = path.read_bytes()
+            digest.update(f"{label} {len(content)}\n".encode())
+            digest.update(content)
+    return digest.hexdigest()
+
+
+def write_snapshot(path: Path, dashboard_data: DashboardData, fingerprint: str) -> None:
+    """Writes `dashboard_data` into `path`, replacing the previous snapshot atomically."""
+    blobs: List[bytes] = []
+    offset = 0
+
+    def add_figures(figures: CountryFigures) -> List[List[Any]]:
+        nonlocal offset
+        entries = []
+        for country_short_name, figure_json in figures.figure_json_by_country.items():
+            blob = bytes(figure_json)
+            blobs.append(blob)
+            entries.append([country_short_name, offset, len(blob)])
+            offset += len(blob)
+        return entries
+
+    index = dict(
+        version=SNAPSHOT_VERSION,
+        fingerprint=fingerprint,
+        prediction_events=[
+            dict(
+                name=event.name,
+                label_prefix=event.label_prefix,
+                last_data_date=event.last_data_date.isoformat(),
+                prediction_date=event.prediction_date.isoformat(),
+            )
+            for event in dashboard_data.prediction_events
+        ],
+        long_name_by_country=dashboard_data.long_name_by_country,
+        single_country_figures=add_figures(dashboard_data.single_country_figures),
+        single_country_all_predictions_figures=add_figures(
+            dashboard_data.single_country_all_predictions_figures
+        ),
+        all_countries_figures_by_event={
+            event_name: add_figures(figures)
+            for event_name, figures in dashboard_data.all_countries_figures_by_event.items()
+        },
+    )
+    index["figures_size"] = offset
+    index_json = json.dumps(index).encode()
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(f"{path.name}.tmp")
+    with open(temporary_path, "wb") as snapshot_file:
+        snapshot_file.write(_HEADER.pack(_MAGIC, len(index_json)))
+        snapshot_file.write(index_json)
+        for blob in blobs:
+            snapshot_file.write(blob)
+    os.replace(temporary_path, path)
+
+
+def load_snapshot(path: Path, fingerprint: str) -> Optional[DashboardData]:
+    """
+    Loads the dashboard data from the snapshot in `path`, or returns None if there is no snapshot,
+    or it was written by another version or from other inputs than those of `fingerprint`.
+
+    The snapshot is memory mapped and the figures are views of the mapping, so loading only reads
+    the index. The pages of the figures are read on first use and shared by all processes.
+    """
+    if not path.is_file():
+        logger.info(f"There is no snapshot in {path}")
+        return None
+    try:
+        with open(path, "rb") as snapshot_file:
+            mapping = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_length = _HEADER.unpack_from(mapping)
+        if magic != _MAGIC:
+            logger.warning(f"{path} is not a snapshot")
+            return None
+        index = json.loads(mapping[_HEADER.size : _HEADER.size + index_length])
+    except (OSError, ValueError, struct.error) as error:
+        logger.warning(f"Could not read the snapshot {path}: {error}")
+        return None
+    if index["version"] != SNAPSHOT_VERSION or index["fingerprint"] != fingerprint:
+        logger.info(f"The snapshot {path} does not match the inputs of the server")
+        return None
+
+    figure_data = memoryview(mapping)[_HEADER.size + index_length :]
+    if len(figure_data) != index["figures_size"]:
+        logger.warning(f"The snapshot {path} is truncated")
+        return None
+
+    def get_figures(entries: List[List[Any]]) -> CountryFigures:
+        figure_json_by_country: Dict[str, FigureJson] = {
+            country_short_name: figure_data[offset : offset + length]
+            for country_short_name, offset, length in entries
+        }
+        return CountryFigures(figure_json_by_country)
+
+    return DashboardData(
+        prediction_events=[
+            PredictionEvent(
+                name=event["name"],
+                label_prefix=event["label_prefix"],
+                last_data_date=datetime.date.fromisoformat(event["last_data_date"]),
+                prediction_date=datetime.date.fromisoformat(event["prediction_date"]),
+            )
+            for event in index["prediction_events"]
+        ],
+        long_name_by_country=index["long_name_by_country"],
+        single_country_figures=get_figures(index["single_country_figures"]),
+        single_country_all_predictions_figures=get_figures(
+            index["single_country_all_predictions_figures"]
+        ),
+        all_countries_figures_by_event={
+            event_name: get_figures(entries)
+            for event_name, entries in index["all_countries_figures_by_event"].items()
+        },
+    )
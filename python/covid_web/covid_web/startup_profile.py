@@ -0,0 +1,73 @@
+import logging
+import resource
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, List, Union
+
+# Environment variable with a path, if set, a cProfile of the server startup is written into it.
+PROFILE_PATH_ENV = "COVID_WEB_STARTUP_PROFILE"
+
+logger = logging.getLogger(__name__)
+
+
+def _get_rss_mb() -> float:
+    """Returns the current resident set size of this process, or 0 if it is not available."""
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return 0.0
+    return resident_pages * resource.getpagesize() / 2 ** 20
+
+
+def _get_peak_rss_mb() -> float:
+    # Linux reports the peak resident set size in kilobytes.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+@dataclass
+class StartupPhase:
+    # Nested phases are named by their path, e.g. "create_dashboard_data/load_prediction_db".
+    name: str
+    seconds: float
+    # Change of the resident set size during the phase.
+    rss_delta_mb: float
+    # Peak resident set size of the process at the end of the phase.
+    peak_rss_mb: float
+
+
+class StartupProfile:
+    """
+    Wall time and memory of the phases of the server startup. Cheap enough to be always on: it
+    only reads the clock and the process memory statistics at the start and end of each phase.
+    """
+
+    def __init__(self) -> None:
+        self.phases: List[StartupPhase] = []
+        self._phase_stack: List[str] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        self._phase_stack.append(name)
+        path = "/".join(self._phase_stack)
+        start_rss_mb = _get_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._phase_stack.pop()
+            phase = StartupPhase(
+                name=path,
+                seconds=time.perf_counter() - start,
+                rss_delta_mb=_get_rss_mb() - start_rss_mb,
+                peak_rss_mb=_get_peak_rss_mb(),
+            )
+            self.phases.append(phase)
+            logger.info(
+                f"Startup phase {phase.name}: {phase.seconds:.2f} s, "
+                f"{phase.rss_delta_mb:+.1f} MB, peak {phase.peak_rss_mb:.1f} MB"
+            )
+
+    def to_json(self) -> List[Dict[str, Union[str, float]]]:
+        return [asdict(phase) for phase in self.phases]
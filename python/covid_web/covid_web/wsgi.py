@@ -1,10 +1,17 @@
+import logging
 from os import getenv
 from pathlib import Path
 
-from .server import setup_server
+from .server import freeze_for_fork, setup_server
+from .snapshot import SNAPSHOT_FILENAME
 
+# Shows the timing of the startup phases in the uwsgi log.
+logging.basicConfig(level=logging.INFO)
 data_path = Path(getenv(key="DATA_PATH", default="data"))
-app = setup_server(data_path, data_path / "predictions")
+snapshot_path = Path(getenv(key="SNAPSHOT_PATH", default=str(data_path / SNAPSHOT_FILENAME)))
+app = setup_server(data_path, data_path / "predictions", snapshot_path)
+# uwsgi forks the workers after loading the app, so that they share the state of the server.
+freeze_for_fork()
 
 if __name__ == "__main__":
     app.run()
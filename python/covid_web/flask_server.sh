@@ -1,3 +1,8 @@
 #!/bin/sh
 covid_web.generate_static_rest $DATA_PATH $STATIC_REST_PATH
-uwsgi --uid www-data --gid www-data --socket 0.0.0.0:5000 --die-on-term -w covid_web.wsgi:app
+# Only recomputes the dashboards if the data or the code changed since the last start.
+covid_web.build_snapshot $DATA_PATH -o "${SNAPSHOT_PATH:-${DATA_PATH}/server.snapshot}"
+# The app is loaded once by the master process and shared by the forked workers, so don't add
+# --lazy-apps.
+uwsgi --uid www-data --gid www-data --socket 0.0.0.0:5000 --die-on-term \
+    --master --processes "${UWSGI_PROCESSES:-2}" --threads 4 -w covid_web.wsgi:app
@@ -14,6 +14,8 @@ setup(
         "console_scripts": [
             "covid_web.run_server = covid_web.server:run_server",
             "covid_web.generate_static_rest = covid_web.rest:generate_static_rest",
+            "covid_web.benchmark = covid_web.benchmark:benchmark",
+            "covid_web.build_snapshot = covid_web.snapshot:build_snapshot",
         ]
     },
     package_data={"": ["*.html"], "covid_web": ["py.typed", "about.md"]},